@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+"""Benchmarks for the command hot paths, runnable on plain Linux without hardware
+
+Serial benchmarks talk to FakeSerialDevice, a pty pair whose far end
+echoes each line and answers with a prompt after a configurable delay;
+remote benchmarks run FakeSSH, a stand-in ssh client that runs commands
+locally after a simulated connection handshake.
+Each benchmark reports throughput plus the process's RSS growth; the GUI
+benchmark also reports event loop stalls and is skipped without a display.
+
+    python benchmark.py
+    python benchmark.py --only serial,config --count 2000 --latency 5
+    python benchmark.py --json bench.json > bench_output.txt
+"""
+
+import argparse
+import gc
+import json
+import os
+import pty
+import select
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from config_model import compile_config, compile_unit
+from command_index import CommandIndex
+from config_store import ConfigStore
+from engine import Engine
+from log_buffer import LogBuffer
+from templates import TemplateRegistry
+from unit_catalog import UnitCatalog
+
+BENCHMARKS = ('serial', 'local', 'remote', 'config', 'templates', 'gui')
+
+
+class FakeSerialDevice:
+    """A pty pretending to be a console: echoes input and prints a prompt per line
+
+    Open .path like a serial port. latency is the delay before each answer,
+    in seconds.
+    """
+
+    def __init__(self, latency=0.0, prompt="switch# ", echo=True, response="ok"):
+        self.latency = latency
+        self.prompt = prompt.encode()
+        self.echo = echo
+        self.response = response.encode()
+        self.lines_received = 0
+        self._master, self._slave = pty.openpty()
+        self.path = os.ttyname(self._slave)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._serve, name="fake-serial", daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        buffer = b''
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self._master], [], [], 0.1)
+            if not readable:
+                continue
+            try:
+                buffer += os.read(self._master, 4096)
+            except OSError:
+                return
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                self.lines_received += 1
+                if self.latency:
+                    time.sleep(self.latency)
+                reply = (line.rstrip(b'\r') + b'\r\n' if self.echo else b'') + self.response + b'\r\n' + self.prompt
+                os.write(self._master, reply)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=1)
+        os.close(self._master)
+        os.close(self._slave)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Takes the place of ssh: understands the options SSHPool passes, treats a
+# file at ControlPath as a running master and runs the command with sh
+FAKE_SSH = """#!/bin/sh
+socket= op= master=
+while [ $# -gt 0 ]; do
+    case "$1" in
+        -o) case "$2" in ControlPath=*) socket="${2#ControlPath=}";; esac; shift 2;;
+        -p|-i|-l) shift 2;;
+        -O) op="$2"; shift 2;;
+        -M) master=1; shift;;
+        -*) shift;;
+        *) break;;
+    esac
+done
+connected=
+if [ -n "$socket" ] && [ -e "$socket" ]; then connected=1; fi
+case "$op" in
+    check) if [ -n "$connected" ]; then exit 0; else exit 255; fi;;
+    exit) rm -f "$socket"; exit 0;;
+esac
+[ -n "$connected" ] || sleep %(handshake)s
+if [ -n "$master" ]; then : > "$socket"; exit 0; fi
+SSH_DESTINATION="$1"; export SSH_DESTINATION; shift
+exec /bin/sh -c "$*"
+"""
+
+
+class FakeSSH:
+    """A stand-in ssh client script; set settings.ssh_command to .command
+
+    Each connection it makes (a master, or a command without one) sleeps
+    for handshake seconds first, like a key exchange and login would.
+    Commands see the host they ran on as $SSH_DESTINATION.
+    """
+
+    def __init__(self, directory, handshake=0.05):
+        self.path = os.path.join(directory, 'fake_ssh')
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(FAKE_SSH % {'handshake': f"{handshake:.3f}"})
+        os.chmod(self.path, 0o755)
+        self.command = [self.path]
+
+
+def rss_bytes():
+    """Current resident set size of this process"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def synthetic_config(device, unit_types=3, groups=10, buttons=100):
+    """A config with unit_types x groups x buttons buttons, alternating serial and local groups"""
+    config = {
+        'settings': {
+            'serial_device': device,
+            'serial_baudrate': '115200',
+            'default_ip_address': '192.168.10.20',
+            'serial_read_output': True,
+            'serial_probe': False,
+            'max_queue_size': 100000,
+        },
+        'unit_types': {},
+    }
+    for u in range(unit_types):
+        button_groups = []
+        for g in range(groups):
+            serial = g % 2 == 0
+            button_groups.append({
+                'title': f"{'Serial' if serial else 'Local'} Group {g}",
+                'group_type': 'serial' if serial else 'local',
+                'buttons': [{
+                    'text': f"Button {u}.{g}.{b}",
+                    'action': 'send_to_serial' if serial else 'run_local_command',
+                    'command': f"echo {b} {{default_ip_address}}",
+                    'style': {'bg': '#f0f0f0', 'fg': 'black'},
+                } for b in range(buttons)],
+            })
+        config['unit_types'][f"Unit{u}"] = {'description': f"Synthetic unit {u}", 'button_groups': button_groups}
+    return config
+
+
+class Bench:
+    """Temporary directory, config file and log sink shared by the benchmarks"""
+
+    def __init__(self, args):
+        self.args = args
+        self.dir = tempfile.mkdtemp(prefix='port-control-bench-')
+        self.log = LogBuffer(max_lines=5000)
+        self.results = []
+
+    def write_config(self, config):
+        path = os.path.join(self.dir, 'config.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(config, f)
+        if os.path.exists(path + '.journal'):
+            os.unlink(path + '.journal')
+        return path
+
+    def engine(self, config):
+        return Engine(self.write_config(config), on_log=self.log.append)
+
+    def record(self, name, count, seconds, rss_before, **extra):
+        result = {'benchmark': name, 'count': count, 'seconds': round(seconds, 4),
+                  'per_second': round(count / seconds, 1) if seconds else None,
+                  'rss_growth_kib': (rss_bytes() - rss_before) // 1024}
+        result.update(extra)
+        self.results.append(result)
+        # Keep the ring from growing across benchmarks
+        self.log.drain()
+        return result
+
+    def close(self):
+        self.log.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def bench_serial(bench):
+    """Round trips through Engine._send_to_serial via the per-port queue"""
+    args = bench.args
+    with FakeSerialDevice(latency=args.latency / 1000) as device:
+        engine = bench.engine(synthetic_config(device.path, unit_types=1, groups=2, buttons=10))
+        try:
+            # Warm up: opens the port and starts the reader
+            engine.queue_serial_command('warmup', wait_for=True, timeout=5).wait(5)
+
+            rss = rss_bytes()
+            started = time.perf_counter()
+            jobs = [engine.queue_serial_command(f'show {i}', wait_for=True, timeout=10) for i in range(args.count)]
+            for job in jobs:
+                job.wait()
+            elapsed = time.perf_counter() - started
+            failed = sum(job.state != 'done' for job in jobs)
+            run_times = [job.finished_at - job.started_at for job in jobs if job.finished_at]
+            bench.record('serial round trip', args.count, elapsed, rss, failed=failed,
+                         p50_ms=round(statistics.median(run_times) * 1000, 3),
+                         p99_ms=round(sorted(run_times)[int(len(run_times) * 0.99) - 1] * 1000, 3))
+
+            rss = rss_bytes()
+            started = time.perf_counter()
+            jobs = [engine.queue_serial_command(f'fire {i}') for i in range(args.count)]
+            for job in jobs:
+                job.wait()
+            bench.record('serial write only', args.count, time.perf_counter() - started, rss)
+
+            # The same number of lines as one paced stream: written in chunks, then
+            # gated on the prompt with up to 8 lines ahead of the answers
+            lines = [f'batch {i}' for i in range(args.count)]
+            for label, window in (('serial batch pipelined', None), ('serial batch prompt window 8', 8)):
+                # Let the device answer what was sent before, so old prompts don't count as answers
+                received = -1
+                while received != device.lines_received:
+                    received = device.lines_received
+                    time.sleep(0.2)
+                rss = rss_bytes()
+                started = time.perf_counter()
+                job = engine.queue_serial_batch(lines, wait_for=bool(window), window=window or 1, timeout=10)
+                job.wait()
+                bench.record(label, args.count, time.perf_counter() - started, rss, failed=int(job.state != 'done'))
+        finally:
+            engine.shutdown()
+
+
+def bench_local(bench):
+    """Local commands through Engine._execute_local_command on the worker pool"""
+    args = bench.args
+    count = max(1, args.count // 10)
+    engine = bench.engine(synthetic_config('/dev/null', unit_types=1, groups=2, buttons=10))
+    try:
+        rss = rss_bytes()
+        started = time.perf_counter()
+        jobs = [engine.queue_local_command('true') for _ in range(count)]
+        for job in jobs:
+            job.wait()
+        bench.record('local command', count, time.perf_counter() - started, rss,
+                     failed=sum(job.result.returncode != 0 for job in jobs))
+
+        rss = rss_bytes()
+        started = time.perf_counter()
+        job = engine.queue_local_command(f'seq 1 {args.count * 10}')
+        job.wait()
+        bench.record('local output lines', args.count * 10, time.perf_counter() - started, rss)
+    finally:
+        engine.shutdown()
+
+
+def bench_remote(bench):
+    """Commands on several hosts over pooled SSH connections, against one connection per command"""
+    args = bench.args
+    count = max(4, args.count // 10)
+    fake = FakeSSH(bench.dir, handshake=args.ssh_handshake / 1000)
+    for label, multiplex in (('remote command pooled', True), ('remote command per connection', False)):
+        config = synthetic_config('/dev/null', unit_types=1, groups=2, buttons=10)
+        config['settings'].update({
+            'remote_hosts': [f"bench@host{i}.invalid" for i in range(4)], 'ssh_command': fake.command,
+            'ssh_multiplex': multiplex, 'ssh_control_dir': os.path.join(bench.dir, 'ssh')})
+        engine = bench.engine(config)
+        hosts = list(engine.remote_hosts)
+        try:
+            rss = rss_bytes()
+            started = time.perf_counter()
+            jobs = [engine.queue_remote_command('true', hosts[i % len(hosts)]) for i in range(count)]
+            for job in jobs:
+                job.wait()
+            bench.record(label, count, time.perf_counter() - started, rss,
+                         failed=sum(job.state != 'done' or job.result.returncode != 0 for job in jobs),
+                         connects=engine.ssh_pool.connects if multiplex else count)
+        finally:
+            engine.shutdown()
+
+
+def bench_config(bench):
+    """Loading a large config and journaling edits to it"""
+    args = bench.args
+    config = synthetic_config('/dev/null', unit_types=3, groups=10, buttons=args.buttons // 30 or 1)
+    path = bench.write_config(config)
+    total_buttons = sum(len(group['buttons']) for unit in config['unit_types'].values()
+                        for group in unit['button_groups'])
+
+    rss = rss_bytes()
+    loads = 20
+    started = time.perf_counter()
+    for _ in range(loads):
+        ConfigStore(path).load()
+    bench.record(f'config load ({total_buttons} buttons)', loads, time.perf_counter() - started, rss)
+
+    rss = rss_bytes()
+    started = time.perf_counter()
+    for _ in range(loads):
+        compile_config(config, compile_template=TemplateRegistry(config['settings']).compile)
+    bench.record(f'config compile ({total_buttons} buttons)', loads, time.perf_counter() - started, rss)
+
+    store = ConfigStore(path, debounce=3600)
+    store.load()
+    edits = max(1, args.count // 10)
+    rss = rss_bytes()
+    started = time.perf_counter()
+    for i in range(edits):
+        store.append(['unit_types', 'Unit0', 'button_groups', 0, 'buttons'],
+                     {'text': f'Added {i}', 'action': 'send_to_serial', 'command': 'show'})
+    bench.record('config edit (journal)', edits, time.perf_counter() - started, rss)
+
+    rss = rss_bytes()
+    started = time.perf_counter()
+    store.save_now()
+    bench.record('config save (snapshot)', 1, time.perf_counter() - started, rss)
+    store.close()
+
+    # The same buttons split over many include_unit_types files
+    units = 300
+    split = synthetic_config('/dev/null', unit_types=units, groups=10, buttons=max(1, total_buttons // (units * 10)))
+    units_dir = os.path.join(bench.dir, 'units')
+    os.makedirs(units_dir, exist_ok=True)
+    for name, unit in split['unit_types'].items():
+        with open(os.path.join(units_dir, f"{name}.json"), 'w', encoding='utf-8') as f:
+            json.dump(unit, f)
+    manifest = os.path.join(bench.dir, 'config.json.manifest')
+    if os.path.exists(manifest):
+        os.unlink(manifest)
+
+    rss = rss_bytes()
+    started = time.perf_counter()
+    UnitCatalog(['units/'], bench.dir, manifest).names()
+    bench.record(f'unit catalog cold ({units} files)', 1, time.perf_counter() - started, rss)
+
+    rss = rss_bytes()
+    started = time.perf_counter()
+    for _ in range(loads):
+        catalog = UnitCatalog(['units/'], bench.dir, manifest)
+        catalog.names()
+    bench.record(f'unit catalog from manifest ({units} files)', loads, time.perf_counter() - started, rss)
+
+    compile_template = TemplateRegistry(split['settings']).compile
+    rss = rss_bytes()
+    started = time.perf_counter()
+    for name in catalog.names()[:loads]:
+        compile_unit(name, catalog.load(name), compile_template=compile_template)
+    bench.record('unit type first selection', loads, time.perf_counter() - started, rss)
+    catalog.close()
+
+    # Command palette: one lookup per keystroke while typing
+    rss = rss_bytes()
+    index = CommandIndex()
+    started = time.perf_counter()
+    for name, unit in config['unit_types'].items():
+        index.set_unit(name, [(group['title'], button['text'], button.get('command'), button['action'])
+                              for group in unit['button_groups'] for button in group['buttons']])
+    index.prepare()
+    bench.record(f'palette index ({len(index)} buttons)', 1, time.perf_counter() - started, rss)
+    typed = ['b', 'bu', 'but', 'butt', 'button', 'button 1', 'button 1.', 'button 1.5',
+             'e', 'ec', 'echo', 'echo 7', 'local', 'local g', 'serial 4', 'defip']
+    rss = rss_bytes()
+    timings = []
+    for _ in range(max(1, args.count // 100)):
+        for query in typed:
+            started = time.perf_counter()
+            index.search(query)
+            timings.append(time.perf_counter() - started)
+    bench.record('palette keystroke', len(timings), sum(timings), rss,
+                 p50_ms=round(statistics.median(timings) * 1000, 3),
+                 max_ms=round(max(timings) * 1000, 3))
+
+
+def bench_templates(bench):
+    """Rendering command templates at click time"""
+    args = bench.args
+    settings = {'default_ip_address': '192.168.10.20', 'serial_device': '/dev/ttyS0'}
+    registry = TemplateRegistry(settings)
+    templates = [f"ifconfig ma{i} {{default_ip_address}} # {{serial_device}}" for i in range(100)]
+    count = args.count * 100
+    rss = rss_bytes()
+    started = time.perf_counter()
+    for i in range(count):
+        registry.render(templates[i % len(templates)])
+    bench.record('template render', count, time.perf_counter() - started, rss)
+
+
+def bench_gui(bench):
+    """Building and switching button frames, and event loop stalls under serial load"""
+    if not os.environ.get('DISPLAY') and sys.platform.startswith('linux'):
+        print("gui: skipped (no DISPLAY)", file=sys.stderr)
+        return
+    import tkinter as tk
+    import gui
+
+    args = bench.args
+    with FakeSerialDevice(latency=args.latency / 1000) as device:
+        config = synthetic_config(device.path, unit_types=3, groups=10, buttons=args.buttons // 30 or 1)
+        path = bench.write_config(config)
+        try:
+            app = gui.App(path)
+        except tk.TclError as e:
+            print(f"gui: skipped ({e})", file=sys.stderr)
+            return
+        try:
+            app.update()
+            units = list(config['unit_types'])
+            per_unit = args.buttons // 30 * 10 or 10
+
+            # First build of each unit type, then the cached switch back
+            for phase in ('build', 'switch'):
+                rss = rss_bytes()
+                started = time.perf_counter()
+                for unit in units:
+                    app.current_unit_type = unit
+                    app._create_buttons()
+                    app.update_idletasks()
+                bench.record(f'gui {phase} unit ({per_unit} buttons)', len(units),
+                             time.perf_counter() - started, rss)
+
+            # Heartbeat every 10ms while serial commands stream into the log
+            gaps = []
+            last = [time.perf_counter()]
+            def beat():
+                now = time.perf_counter()
+                gaps.append(now - last[0])
+                last[0] = now
+                app.after(10, beat)
+            app.after(10, beat)
+
+            rss = rss_bytes()
+            started = time.perf_counter()
+            jobs = [app.engine.queue_serial_command(f'show {i}', wait_for=True, timeout=10)
+                    for i in range(args.count)]
+            # One port, so the last job finishes last
+            while not jobs[-1].wait(0):
+                app.update()
+            while time.perf_counter() - started < 0.5:
+                app.update()
+            elapsed = time.perf_counter() - started
+            stalls = [gap for gap in gaps if gap > args.stall_ms / 1000]
+            bench.record('gui under serial load', args.count, elapsed, rss,
+                         frames=len(gaps), stalls=len(stalls),
+                         worst_frame_ms=round(max(gaps, default=0) * 1000, 1))
+        finally:
+            app.on_closing()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Port Control command paths")
+    parser.add_argument('--only', help=f"comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--count', type=int, default=500, help="serial commands per run (default: 500)")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="fake device response delay in milliseconds (default: 0)")
+    parser.add_argument('--ssh-handshake', type=float, default=150.0,
+                        help="fake ssh connection setup time in milliseconds (default: 150)")
+    parser.add_argument('--buttons', type=int, default=3000,
+                        help="buttons in the synthetic config (default: 3000)")
+    parser.add_argument('--stall-ms', type=float, default=50.0,
+                        help="event loop gap that counts as a UI stall (default: 50)")
+    parser.add_argument('--json', metavar='PATH', help="also write the results as JSON")
+    args = parser.parse_args(argv)
+
+    selected = args.only.split(',') if args.only else BENCHMARKS
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    bench = Bench(args)
+    try:
+        for name in selected:
+            gc.collect()
+            globals()[f'bench_{name}'](bench)
+    finally:
+        bench.close()
+
+    print(f"{'benchmark':<36} {'count':>8} {'seconds':>9} {'per sec':>10} {'RSS +KiB':>9}  extra")
+    for result in bench.results:
+        extra = {key: value for key, value in result.items()
+                 if key not in ('benchmark', 'count', 'seconds', 'per_second', 'rss_growth_kib')}
+        print(f"{result['benchmark']:<36} {result['count']:>8} {result['seconds']:>9.3f} "
+              f"{result['per_second'] or 0:>10.1f} {result['rss_growth_kib']:>9}  "
+              f"{' '.join(f'{key}={value}' for key, value in extra.items())}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'argv': sys.argv[1:], 'results': bench.results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""Session capture: compressed, append-only console recordings with a search index
+
+Everything read from or written to a serial port, and the output of local
+commands, is recorded to <capture_dir>/<device>/<YYYY-MM-DD>.cap. A file is a
+sequence of independently compressed blocks:
+
+    b'PCB1' | payload length (u32) | record count (u32) | first ts (f64) | last ts (f64) | zlib payload
+
+and each record inside a payload is
+
+    timestamp (f64) | stream (u8) | text length (u32) | UTF-8 text
+
+Next to it, <YYYY-MM-DD>.idx gets one JSON line per block with its offset,
+time range and the distinct words it contains. A search reads only the
+index files of the days in range and decompresses just the blocks whose
+words and times can match, so it stays fast however large the captures grow.
+"""
+
+import datetime
+import json
+import os
+import queue
+import re
+import struct
+import threading
+import time
+import zlib
+
+BLOCK_MAGIC = b'PCB1'
+BLOCK_HEADER = struct.Struct('>4sIIdd')
+RECORD_HEADER = struct.Struct('>dBI')
+
+# Record streams
+RX = 0        # read from a serial port
+TX = 1        # written to a serial port
+STDOUT = 2    # local command output
+STDERR = 3
+EVENT = 4     # e.g. a local command starting
+
+# Device name local command output is recorded under
+LOCAL_DEVICE = 'local'
+
+STREAM_NAMES = {RX: 'rx', TX: 'tx', STDOUT: 'stdout', STDERR: 'stderr', EVENT: 'event'}
+
+# Words shorter than this aren't indexed; queries for them fall back to scanning
+MIN_TERM_LENGTH = 3
+TERM = re.compile(r'[A-Za-z0-9_]{%d,}' % MIN_TERM_LENGTH)
+
+
+def terms(text):
+    return {term.lower() for term in TERM.findall(text)}
+
+
+def device_slug(device):
+    """Directory name for a device: /dev/serial/by-id/usb-FTDI_X-port0 -> usb-FTDI_X-port0"""
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', os.path.basename(device.rstrip('/')) or device) or 'unknown'
+
+
+class Record:
+    """One captured line"""
+
+    def __init__(self, timestamp, device, stream, text):
+        self.timestamp = timestamp
+        self.device = device
+        self.stream = stream
+        self.text = text
+
+    def format(self):
+        ts = datetime.datetime.fromtimestamp(self.timestamp).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        return f"{ts} {self.device} {STREAM_NAMES.get(self.stream, '?'):<6} {self.text}"
+
+
+class _CaptureFile:
+    """Buffers records for one device and day and appends them as compressed blocks"""
+
+    def __init__(self, path, index_path):
+        self.path = path
+        self.index_path = index_path
+        self.day = os.path.splitext(os.path.basename(path))[0]
+        self._records = []
+        self._size = 0
+        self._created = False
+
+    def add(self, timestamp, stream, text):
+        data = text.encode('utf-8', errors='replace')
+        self._records.append((timestamp, stream, data))
+        self._size += RECORD_HEADER.size + len(data)
+
+    @property
+    def buffered_bytes(self):
+        return self._size
+
+    def take(self):
+        """The buffered records, leaving the buffer empty"""
+        records, self._records, self._size = self._records, [], 0
+        return records
+
+    def write(self, records):
+        """Append records as one compressed block and index it"""
+        if not self._created:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._created = True
+        payload = b''.join(RECORD_HEADER.pack(ts, stream, len(data)) + data for ts, stream, data in records)
+        compressed = zlib.compress(payload, 6)
+        first, last = records[0][0], records[-1][0]
+        words = set()
+        for _, _, data in records:
+            words |= terms(data.decode('utf-8', errors='replace'))
+
+        with open(self.path, 'ab') as f:
+            offset = f.tell()
+            f.write(BLOCK_HEADER.pack(BLOCK_MAGIC, len(compressed), len(records), first, last) + compressed)
+        entry = {'offset': offset, 'length': BLOCK_HEADER.size + len(compressed), 'count': len(records),
+                 'first': first, 'last': last, 'terms': sorted(words)}
+        with open(self.index_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, separators=(',', ':')) + "\n")
+
+
+class CaptureStore:
+    """Records sessions per device and day and searches them through the sidecar index
+
+    record() is cheap and safe from any thread: records are buffered, and
+    when a buffer reaches block_bytes, or every flush_interval seconds, it
+    is swapped out and queued for a writer thread that compresses it and
+    appends it as one block. No file I/O happens under the lock, so a slow
+    disk holds up the writer rather than the serial readers recording.
+
+    record() and flush() never raise for a write that fails, since they run
+    on serial readers and writers: the first OSError turns recording off
+    and is passed to on_error(error) once.
+    """
+
+    def __init__(self, directory, block_bytes=64 * 1024, flush_interval=2.0, on_error=None):
+        self.directory = directory
+        self.block_bytes = block_bytes
+        self.flush_interval = flush_interval
+        self.on_error = on_error
+        self.disabled = False
+        self._files = {}
+        self._lock = threading.Lock()
+        self._index_cache = {}
+        self._stop = threading.Event()
+        self._closed = False
+        # (capture file, records) blocks in the order they were taken, and
+        # Events set once everything queued before them is written
+        self._blocks = queue.Queue()
+        os.makedirs(directory, exist_ok=True)
+        self._writer = threading.Thread(target=self._write_loop, name="capture-write", daemon=True)
+        self._writer.start()
+        self._flusher = threading.Thread(target=self._flush_loop, name="capture-flush", daemon=True)
+        self._flusher.start()
+
+    def _paths(self, device, day):
+        folder = os.path.join(self.directory, device_slug(device))
+        return os.path.join(folder, f"{day}.cap"), os.path.join(folder, f"{day}.idx")
+
+    def record(self, device, stream, text, timestamp=None):
+        """Append one line for a device"""
+        if self.disabled or self._closed:
+            return
+        timestamp = timestamp or time.time()
+        day = time.strftime('%Y-%m-%d', time.localtime(timestamp))
+        with self._lock:
+            capture = self._files.get(device)
+            if capture is None or capture.day != day:
+                if capture is not None:
+                    self._queue(capture)
+                capture = self._files[device] = _CaptureFile(*self._paths(device, day))
+            capture.add(timestamp, stream, text)
+            if capture.buffered_bytes >= self.block_bytes:
+                self._queue(capture)
+
+    def _queue(self, capture):
+        # Called under the lock, so blocks of a file are queued in the order they were taken
+        records = capture.take()
+        if records:
+            self._blocks.put((capture, records))
+
+    def flush(self):
+        """Queue every buffered record and wait until the writer has written it"""
+        if self.disabled or self._closed:
+            return
+        with self._lock:
+            for capture in self._files.values():
+                self._queue(capture)
+        written = threading.Event()
+        self._blocks.put(written)
+        written.wait()
+
+    def _write_loop(self):
+        while True:
+            item = self._blocks.get()
+            if item is None:
+                return
+            if isinstance(item, threading.Event):
+                item.set()
+                continue
+            if self.disabled:
+                # Drain what was queued before the failure
+                continue
+            capture, records = item
+            try:
+                capture.write(records)
+            except OSError as e:
+                self._fail(e)
+
+    def _fail(self, error):
+        """Stop recording after a failed write (disk full, directory removed) and report it once"""
+        with self._lock:
+            if self.disabled:
+                return
+            self.disabled = True
+            self._files.clear()
+        self._stop.set()
+        if self.on_error:
+            self.on_error(error)
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+        self._closed = True
+        self._blocks.put(None)
+        self._writer.join()
+
+    def devices(self):
+        """Device directories that have captures, counting records not written yet"""
+        with self._lock:
+            names = {device_slug(device) for device in self._files}
+        try:
+            names.update(name for name in os.listdir(self.directory)
+                         if os.path.isdir(os.path.join(self.directory, name)))
+        except FileNotFoundError:
+            pass
+        return sorted(names)
+
+    def _days(self, device_dir, since, until):
+        first = time.strftime('%Y-%m-%d', time.localtime(since)) if since else ''
+        last = time.strftime('%Y-%m-%d', time.localtime(until)) if until else '9999'
+        try:
+            names = os.listdir(os.path.join(self.directory, device_dir))
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-4] for name in names if name.endswith('.cap') and first <= name[:-4] <= last)
+
+    def _index(self, index_path):
+        """Parsed index entries of one file, cached until the file grows"""
+        try:
+            size = os.path.getsize(index_path)
+        except OSError:
+            return []
+        cached = self._index_cache.get(index_path)
+        if cached and cached[0] == size:
+            return cached[1]
+        entries = []
+        with open(index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                # One string, so a query word can be looked for inside the terms
+                entry['text'] = '\n'.join(entry.pop('terms'))
+                entries.append(entry)
+        self._index_cache[index_path] = (size, entries)
+        return entries
+
+    @staticmethod
+    def _read_block(f, entry):
+        f.seek(entry['offset'])
+        header = f.read(BLOCK_HEADER.size)
+        if len(header) < BLOCK_HEADER.size:
+            return
+        magic, length, count, _, _ = BLOCK_HEADER.unpack(header)
+        if magic != BLOCK_MAGIC:
+            return
+        compressed = f.read(length)
+        if len(compressed) < length:
+            return
+        payload = zlib.decompress(compressed)
+        offset = 0
+        for _ in range(count):
+            ts, stream, size = RECORD_HEADER.unpack_from(payload, offset)
+            offset += RECORD_HEADER.size
+            yield ts, stream, payload[offset:offset + size].decode('utf-8', errors='replace')
+            offset += size
+
+    def search(self, query='', devices=None, since=None, until=None, regex=None, streams=None):
+        """Yield matching Records lazily, per device in time order
+
+        query is a set of words that must all appear in a line, anywhere in
+        it and case insensitive, so 'eth' finds 'eth0'; regex is an optional
+        extra pattern. Blocks whose index rules out a match are never read:
+        every run of word characters in a query word is part of some word
+        of a matching line, so it must be inside one of the block's terms.
+        """
+        self.flush()
+        words = query.lower().split()
+        pieces = {piece for word in words for piece in TERM.findall(word)}
+        pattern = re.compile(regex, re.IGNORECASE) if regex else None
+        device_dirs = [device_slug(device) for device in devices] if devices else self.devices()
+
+        for device_dir in device_dirs:
+            for day in self._days(device_dir, since, until):
+                path, index_path = self._paths(device_dir, day)
+                blocks = [entry for entry in self._index(index_path)
+                          if (since is None or entry['last'] >= since)
+                          and (until is None or entry['first'] <= until)
+                          and all(piece in entry['text'] for piece in pieces)]
+                if not blocks:
+                    continue
+                with open(path, 'rb') as f:
+                    for entry in blocks:
+                        for ts, stream, text in self._read_block(f, entry):
+                            if since is not None and ts < since or until is not None and ts > until:
+                                continue
+                            if streams is not None and stream not in streams:
+                                continue
+                            lowered = text.lower()
+                            if any(word not in lowered for word in words):
+                                continue
+                            if pattern and not pattern.search(text):
+                                continue
+                            yield Record(ts, device_dir, stream, text)
+
+    def replay(self, device, since=None, until=None):
+        """Every record of a device in a time range, in order"""
+        return self.search(devices=[device], since=since, until=until)
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""Search index over every button of every unit type, for the command palette
+
+Each entry is indexed under the three-letter runs (trigrams) of its text,
+group, unit type and command, under the characters it contains and under
+the one- and two-letter prefixes of the words of its text and the first
+letters of all its words. A query first
+narrows the candidates with set intersections, then only those are
+scored, so a keystroke costs about the same whether the config has a
+hundred buttons or thousands. Typing more letters narrows the previous
+result instead of searching again.
+"""
+
+import bisect
+import heapq
+import json
+import math
+import re
+import threading
+import time
+
+from config_store import atomic_write
+
+# Words of a button text, for the prefix index
+_WORD = re.compile(r'[a-z0-9]+')
+
+# Score bonuses for one matched query character
+START_BONUS = 8     # first character of a word
+RUN_BONUS = 5       # right after the previous matched character
+TEXT_BONUS = 3      # in the button text rather than its group, unit or command
+# For a query word found as a whole, on top of the per-character bonuses
+SUBSTRING_BONUS = 20
+
+# Usage counts lose half their weight every this many seconds
+HISTORY_HALF_LIFE = 3 * 24 * 3600
+HISTORY_WEIGHT = 6.0
+
+
+class PaletteEntry:
+    """One button as the palette shows it"""
+
+    __slots__ = ('id', 'unit', 'group', 'text', 'command', 'action', 'key', 'haystack', 'text_length')
+
+    def __init__(self, id, unit, group, text, command, action):
+        self.id = id
+        self.unit = unit
+        self.group = group
+        self.text = text
+        self.command = command or ''
+        self.action = action
+        self.key = usage_key(unit, text)
+        self.haystack = f"{text}\t{group}\t{unit}\t{self.command}".lower()
+        self.text_length = len(text)
+
+    def __repr__(self):
+        return f"<PaletteEntry {self.unit}/{self.text!r}>"
+
+
+def usage_key(unit, text):
+    return f"{unit}\t{text.strip().lower()}"
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _word_start(haystack, text, start=0):
+    """Position of text at the start of a word of haystack, or -1"""
+    position = haystack.find(text, start)
+    while position > 0 and haystack[position - 1].isalnum():
+        position = haystack.find(text, position + 1)
+    return position
+
+
+def _word_score(word, haystack, text_length):
+    """Score of one query word in a haystack, or None if its letters don't appear in order
+
+    Like the candidate lookup in CommandIndex, a word of one or two letters
+    only matches where a word starts, and letters spread out only count
+    when the first of them starts a word.
+    """
+    position = haystack.find(word) if len(word) >= 3 else _word_start(haystack, word)
+    if position >= 0:
+        # Found whole: no need to look at it letter by letter
+        score = SUBSTRING_BONUS + RUN_BONUS * (len(word) - 1)
+        if position == 0 or not haystack[position - 1].isalnum():
+            score += START_BONUS
+        if position < text_length:
+            score += SUBSTRING_BONUS + TEXT_BONUS * len(word)
+        return score
+    score = 0
+    previous = -1
+    for char in word:
+        position = haystack.find(char, previous + 1) if previous >= 0 else _word_start(haystack, char)
+        if position < 0:
+            return None
+        if previous >= 0 and position == previous + 1:
+            score += RUN_BONUS
+        if position == 0 or not haystack[position - 1].isalnum():
+            score += START_BONUS
+        if position < text_length:
+            score += TEXT_BONUS
+        previous = position
+    return score
+
+
+def fuzzy_score(words, entry):
+    """Score of a query's words against an entry, or None unless every word matches
+
+    Each word must appear as a subsequence, in any order relative to the
+    other words, so "gen12 b3" finds button "b3" of unit type "Gen12".
+    """
+    score = 0
+    for word in words:
+        word_score = _word_score(word, entry.haystack, entry.text_length)
+        if word_score is None:
+            return None
+        score += word_score
+    # Shorter texts first among equal matches
+    return score - entry.text_length / 100
+
+
+class CommandIndex:
+    """Buttons of all unit types with fuzzy lookup, ranked by how often and how recently they were used
+
+    Rows are (group title, button text, command, action) per unit type;
+    set_unit() replaces one unit type's rows, so an added button or group
+    only reindexes its own unit type. Use counts are kept in history_path
+    across runs.
+    """
+
+    # Candidate sets up to this size are scored in full; larger ones have
+    # this many of their likeliest entries scored
+    SCAN_ALL = 300
+
+    def __init__(self, history_path=None):
+        self.history_path = history_path
+        self._entries = {}
+        self._by_unit = {}
+        self._by_key = {}
+        self._by_gram = {}
+        self._by_char = {}
+        self._by_prefix = {}
+        self._by_start = {}
+        # Prefix -> its entry ids in display order, and every entry id with
+        # the shortest texts first; sorted on first use, then kept in order
+        self._prefix_order = {}
+        self._order = None
+        self._ids = 0
+        self._history = self._load_history()
+        self._history_changed = False
+        self._last = ('', None)
+        self._lock = threading.Lock()
+
+    def _load_history(self):
+        if not self.history_path:
+            return {}
+        try:
+            with open(self.history_path, 'r', encoding='utf-8') as f:
+                history = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return history if isinstance(history, dict) else {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def set_unit(self, unit, rows):
+        """Replace a unit type's entries with rows of (group, text, command, action)"""
+        with self._lock:
+            self._remove_unit(unit)
+            ids = self._by_unit[unit] = []
+            for group, text, command, action in rows:
+                self._ids += 1
+                entry = PaletteEntry(self._ids, unit, group, text, command, action)
+                self._entries[entry.id] = entry
+                ids.append(entry.id)
+                self._by_key.setdefault(entry.key, set()).add(entry.id)
+                for gram in self._grams(entry.haystack):
+                    self._by_gram.setdefault(gram, set()).add(entry.id)
+                for char in set(entry.haystack):
+                    self._by_char.setdefault(char, set()).add(entry.id)
+                for char in self._starts(entry.haystack):
+                    self._by_start.setdefault(char, set()).add(entry.id)
+                for prefix in self._prefixes(entry.text):
+                    self._by_prefix.setdefault(prefix, set()).add(entry.id)
+                    if prefix in self._prefix_order:
+                        bisect.insort(self._prefix_order[prefix], entry.id, key=self._prefix_key(prefix))
+                if self._order is not None:
+                    bisect.insort(self._order, entry.id, key=self._length_key)
+            self._last = ('', None)
+
+    def remove_unit(self, unit):
+        with self._lock:
+            self._remove_unit(unit)
+            self._last = ('', None)
+
+    def _remove_unit(self, unit):
+        for entry_id in self._by_unit.pop(unit, ()):
+            entry = self._entries.pop(entry_id)
+            self._by_key[entry.key].discard(entry_id)
+            for gram in self._grams(entry.haystack):
+                self._by_gram[gram].discard(entry_id)
+            for char in set(entry.haystack):
+                self._by_char[char].discard(entry_id)
+            for char in self._starts(entry.haystack):
+                self._by_start[char].discard(entry_id)
+            for prefix in self._prefixes(entry.text):
+                self._by_prefix[prefix].discard(entry_id)
+                if prefix in self._prefix_order:
+                    self._prefix_order[prefix].remove(entry_id)
+            if self._order is not None:
+                self._order.remove(entry_id)
+
+    def _length_key(self, entry_id):
+        return self._entries[entry_id].text_length
+
+    def _prefix_key(self, prefix):
+        entries = self._entries
+
+        def key(entry_id):
+            entry = entries[entry_id]
+            return not entry.text.lower().startswith(prefix), entry.text_length, entry.haystack
+        return key
+
+    @staticmethod
+    def _grams(haystack):
+        grams = set()
+        for field in haystack.split('\t'):
+            grams |= trigrams(field)
+        return grams
+
+    @staticmethod
+    def _starts(haystack):
+        return {word[0] for word in _WORD.findall(haystack)}
+
+    @staticmethod
+    def _prefixes(text):
+        prefixes = set()
+        for word in _WORD.findall(text.lower()):
+            prefixes.add(word[:1])
+            prefixes.add(word[:2])
+        return prefixes
+
+    def _usage_scores(self, now):
+        """Usage bonus of every used entry id; the history is small next to the index"""
+        scores = {}
+        for key, (count, last) in self._history.items():
+            ids = self._by_key.get(key)
+            if ids:
+                score = HISTORY_WEIGHT * math.log1p(count) * 0.5 ** (max(0.0, now - last) / HISTORY_HALF_LIFE)
+                for entry_id in ids:
+                    scores[entry_id] = score
+        return scores
+
+    def search(self, query, limit=50):
+        """Best matching PaletteEntries for a query; the most used entries when it is empty"""
+        words = query.lower().split()
+        query = ' '.join(words)
+        with self._lock:
+            usage = self._usage_scores(time.time())
+            if not words:
+                self._last = ('', None)
+                ranked = heapq.nlargest(limit, usage, key=usage.get)
+            elif len(words) == 1 and len(query) <= 2:
+                self._last = ('', None)
+                ranked = self._search_prefix(query, usage, limit)
+            else:
+                ranked = self._search_fuzzy(query, words, usage, limit)
+            return [self._entries[entry_id] for entry_id in ranked]
+
+    def _search_prefix(self, prefix, usage, limit):
+        """One or two letters match word starts in the button text only
+
+        Anything looser would match nearly every button. These all match
+        equally well, so after the ones in use they come in a fixed order
+        (texts starting with the prefix first, then shorter ones) that is
+        sorted once per prefix and updated as buttons come and go.
+        """
+        ids = self._by_prefix.get(prefix)
+        if not ids:
+            return []
+        order = self._prefix_order.get(prefix)
+        if order is None:
+            order = self._prefix_order[prefix] = sorted(ids, key=self._prefix_key(prefix))
+        ranked = sorted((entry_id for entry_id in usage if entry_id in ids), key=usage.get, reverse=True)[:limit]
+        taken = set(ranked)
+        for entry_id in order:
+            if len(ranked) >= limit:
+                break
+            if entry_id not in taken:
+                ranked.append(entry_id)
+        return ranked
+
+    def _candidates(self, query, words, limit):
+        last_query, last_ids = self._last
+        if last_ids is not None and query.startswith(last_query):
+            # Typing on: whatever matches now matched the shorter query too
+            return last_ids
+        sets = []
+        for word in words:
+            ids = self._word_candidates(word, limit)
+            if not ids:
+                return ()
+            sets.append(ids)
+        sets.sort(key=len)
+        return sets[0].intersection(*sets[1:])
+
+    def _word_candidates(self, word, limit):
+        """Entries a query word may match: as a whole, or scattered from a word start of the text"""
+        if len(word) >= 3:
+            sets = [self._by_gram.get(gram) for gram in trigrams(word)]
+            whole = set() if not all(sets) else sets[0].intersection(*sets[1:])
+        else:
+            whole = self._by_prefix.get(word) or set()
+        if len(whole) >= limit:
+            return whole
+        # Few whole matches: letters spread out also count ("shint" for
+        # "Show interface"), as long as the first one starts a word
+        sets = [self._by_start.get(word[0])] + [self._by_char.get(char) for char in set(word)]
+        if not all(sets):
+            return whole
+        sets.sort(key=len)
+        return whole | sets[0].intersection(*sets[1:])
+
+    def _search_fuzzy(self, query, words, usage, limit):
+        entries = self._entries
+        candidates = self._candidates(query, words, limit)
+        if len(candidates) <= self.SCAN_ALL:
+            matches = []
+            for entry_id in candidates:
+                entry = entries.get(entry_id)
+                score = fuzzy_score(words, entry) if entry is not None else None
+                if score is not None:
+                    matches.append((score + usage.get(entry_id, 0.0), entry_id))
+            self._last = (query, [entry_id for _, entry_id in matches])
+            return [entry_id for _, entry_id in heapq.nlargest(limit, matches)]
+
+        # Many candidates, as when most buttons share a word: score the used
+        # ones, then the rest shortest first, and stop once nothing left
+        # could beat the top results, or after SCAN_ALL of them
+        if not isinstance(candidates, (set, frozenset)):
+            candidates = set(candidates)
+        best = sum(max(8 * len(word) + 43, 16 * len(word) - 5) for word in words)
+        top = []
+
+        def consider(entry_id, bonus):
+            score = fuzzy_score(words, entries[entry_id])
+            if score is None:
+                return
+            item = (score + bonus, entry_id)
+            if len(top) < limit:
+                heapq.heappush(top, item)
+            elif item > top[0]:
+                heapq.heapreplace(top, item)
+
+        for entry_id, bonus in usage.items():
+            if entry_id in candidates:
+                consider(entry_id, bonus)
+        budget = self.SCAN_ALL
+        for entry_id in self._length_order():
+            if entry_id in candidates and entry_id not in usage:
+                if len(top) == limit and top[0][0] >= best - entries[entry_id].text_length / 100:
+                    break
+                consider(entry_id, 0.0)
+                budget -= 1
+                if not budget:
+                    break
+        # Only the candidates are known to hold every match of the next keystroke
+        self._last = (query, candidates)
+        return [entry_id for _, entry_id in sorted(top, reverse=True)]
+
+    def _length_order(self):
+        if self._order is None:
+            self._order = sorted(self._entries, key=self._length_key)
+        return self._order
+
+    def prepare(self):
+        """Sort the orders searches use now rather than on the first keystrokes"""
+        with self._lock:
+            self._length_order()
+            for prefix, ids in self._by_prefix.items():
+                if len(prefix) == 1 and prefix not in self._prefix_order:
+                    self._prefix_order[prefix] = sorted(ids, key=self._prefix_key(prefix))
+
+    def record_use(self, unit, text):
+        """Count one use of a button, raising it in future results"""
+        with self._lock:
+            key = usage_key(unit, text)
+            count, _ = self._history.get(key, (0, 0))
+            self._history[key] = (count + 1, time.time())
+            self._history_changed = True
+
+    def save_history(self):
+        """Write use counts to history_path if they changed"""
+        with self._lock:
+            if not self.history_path or not self._history_changed:
+                return
+            data = json.dumps(self._history)
+            self._history_changed = False
+        atomic_write(self.history_path, data)
@@ -0,0 +1,593 @@
+#!/usr/bin/env python3
+"""Validated, typed model of config.json, compiled once per load or edit
+
+The raw dict stays the source of truth for saving (see config_store.py);
+the model is what the engine and the GUI read. Compiling checks every
+setting, unit, group and button, resolves each button's action to its
+handler and infers group types, so a bad config is reported at load time
+with the JSON path of each problem rather than when a button is clicked.
+"""
+
+import re
+
+from parsers import ParserError, find_parser
+from sequence import Sequence, SequenceError
+from serial_session import FLOW_CONTROLS
+
+# Button actions, the ones that need a GUI (an interactive terminal window)
+# and the ones that run once per serial target
+ACTIONS = ('send_to_serial', 'run_local_command', 'sequence', 'open_screen', 'close_screen')
+GUI_ACTIONS = ('open_screen', 'close_screen')
+PER_DEVICE_ACTIONS = ('send_to_serial', 'sequence')
+COMMAND_ACTIONS = ('send_to_serial', 'run_local_command')
+GROUP_TYPES = ('serial', 'local')
+
+REQUIRED_SETTINGS = ('serial_device', 'serial_baudrate')
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+class ConfigSchemaError(ValueError):
+    """Raised with every problem found; .errors is a list of (json path, message)"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("\n".join(f"{path}: {message}" for path, message in errors))
+
+
+def json_path(path):
+    """['unit_types', 'Switch', 'button_groups', 1] -> $.unit_types.Switch.button_groups[1]"""
+    parts = ['$']
+    for key in path:
+        if isinstance(key, int):
+            parts.append(f"[{key}]")
+        elif _IDENTIFIER.match(key):
+            parts.append(f".{key}")
+        else:
+            parts.append(f"[{key!r}]")
+    return ''.join(parts)
+
+
+def _is_integer(value):
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, int):
+        return True
+    return isinstance(value, str) and value.strip().lstrip('+-').isdigit()
+
+
+def _is_number(value):
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, (int, float)):
+        return True
+    try:
+        float(value)
+        return isinstance(value, str)
+    except (TypeError, ValueError):
+        return False
+
+
+def _is_regex(value):
+    if not isinstance(value, str):
+        return False
+    try:
+        re.compile(value)
+        return True
+    except re.error:
+        return False
+
+
+def _is_host_list(value):
+    return isinstance(value, list) and all(
+        (isinstance(entry, str) and entry) or (isinstance(entry, dict) and isinstance(entry.get('host'), str)
+                                               and entry['host'])
+        for entry in value)
+
+
+def _is_device_list(value):
+    return isinstance(value, list) and all(
+        (isinstance(entry, str) and entry)
+        or (isinstance(entry, dict) and isinstance(entry.get('device'), str) and entry['device']
+            and isinstance(entry.get('name', ''), str))
+        for entry in value)
+
+
+def _is_device_settings(value):
+    return isinstance(value, dict) and all(
+        isinstance(device, str) and isinstance(overrides, dict) for device, overrides in value.items())
+
+
+# Known settings: (check, description of what is expected). Others are free-form
+# values for command templates.
+SETTING_TYPES = {
+    'serial_device': (lambda v: isinstance(v, str) and v, "a device path"),
+    'serial_baudrate': (_is_integer, "an integer"),
+    'serial_parity': (lambda v: isinstance(v, str), "a parity name"),
+    'serial_bytesize': (_is_integer, "an integer"),
+    'serial_stopbits': (_is_integer, "an integer"),
+    'serial_devices': (_is_device_list, "a list of device paths or objects with a device"),
+    'device_settings': (_is_device_settings, "an object mapping device paths to objects of settings"),
+    'serial_read_output': (lambda v: isinstance(v, bool), "true or false"),
+    'serial_prompt': (_is_regex, "a regular expression"),
+    'serial_probe': (lambda v: isinstance(v, bool), "true or false"),
+    'serial_probe_timeout': (_is_number, "a number"),
+    'serial_response_timeout': (_is_number, "a number"),
+    'serial_flow_control': (lambda v: v in FLOW_CONTROLS, f"one of {', '.join(FLOW_CONTROLS)}"),
+    'serial_write_timeout': (_is_number, "a number"),
+    'serial_line_delay': (lambda v: _is_number(v) and float(v) >= 0, "a number of seconds"),
+    'serial_batch_window': (lambda v: _is_integer(v) and int(v) > 0, "a positive integer"),
+    'max_local_workers': (_is_integer, "an integer"),
+    'max_queue_size': (_is_integer, "an integer"),
+    'local_command_timeout': (_is_number, "a number"),
+    'max_output_bytes': (_is_integer, "an integer"),
+    'metrics_file': (lambda v: isinstance(v, str), "a file path"),
+    'metrics_interval': (_is_number, "a number"),
+    'metrics_window': (_is_integer, "an integer"),
+    'log_max_lines': (_is_integer, "an integer"),
+    'log_file': (lambda v: isinstance(v, str), "a file path"),
+    'capture': (lambda v: isinstance(v, bool), "true or false"),
+    'capture_dir': (lambda v: isinstance(v, str), "a directory path"),
+    'async_io': (lambda v: isinstance(v, bool), "true or false"),
+    'local_cache_ttl': (_is_number, "a number"),
+    'local_cache_max_bytes': (_is_integer, "an integer"),
+    'parse_tolerance': (lambda v: _is_number(v) and float(v) >= 0, "a fraction, e.g. 0.05"),
+    'log_parsed_output': (lambda v: isinstance(v, bool), "true or false"),
+    'remote_hosts': (_is_host_list, "a list of 'user@host' strings or objects with a host"),
+    'ssh_command': (lambda v: (isinstance(v, str) and v) or (isinstance(v, list) and v
+                                                            and all(isinstance(arg, str) for arg in v)),
+                    "a command string or argument list"),
+    'ssh_options': (lambda v: isinstance(v, list) and all(isinstance(arg, str) for arg in v),
+                    "a list of ssh arguments"),
+    'ssh_multiplex': (lambda v: isinstance(v, bool), "true or false"),
+    'ssh_max_sessions': (_is_integer, "an integer"),
+    'ssh_control_persist': (_is_number, "a number"),
+    'ssh_connect_timeout': (_is_number, "a number"),
+    'ssh_control_dir': (lambda v: isinstance(v, str), "a directory path"),
+    'terminal_command': (lambda v: isinstance(v, list) and v and all(isinstance(arg, str) for arg in v),
+                         "a non-empty argument list"),
+    'terminal_close_timeout': (lambda v: _is_number(v) and float(v) >= 0, "a number of seconds"),
+}
+
+
+def check_setting(key, value):
+    """Problem with one setting's value, or None"""
+    spec = SETTING_TYPES.get(key)
+    if spec is None:
+        return None
+    if value is None:
+        return "is required" if key in REQUIRED_SETTINGS else None
+    check, expected = spec
+    if not check(value):
+        return f"expected {expected}, got {value!r}"
+    return None
+
+
+def infer_group_type(title, actions):
+    """'serial' or 'local' from a group's buttons, or failing that its title"""
+    if 'send_to_serial' in actions:
+        return 'serial'
+    if 'run_local_command' in actions:
+        return 'local'
+    title = title.lower()
+    if 'serial' in title or 'command' in title:
+        return 'serial'
+    if 'local' in title or 'bash' in title or 'terminal' in title:
+        return 'local'
+    return 'serial'
+
+
+class Button:
+    """One configured button with its action already resolved"""
+
+    __slots__ = ('text', 'action', 'command', 'wait_for', 'timeout', 'style', 'sequence', 'handler', 'path', 'unit',
+                 'group', 'cacheable', 'ttl', 'hosts', 'line_delay', 'window', 'parser')
+
+    def __init__(self, text, action, command=None, wait_for=None, timeout=None, style=None,
+                 sequence=None, handler=None, path=(), unit=None, group=None, cacheable=False, ttl=None, hosts=None,
+                 line_delay=None, window=None, parser=None):
+        self.text = text
+        self.action = action
+        self.command = command
+        self.wait_for = wait_for
+        self.timeout = timeout
+        self.style = style or {}
+        self.sequence = sequence
+        # handler(button, device) queues the button's work; None for GUI-only actions
+        self.handler = handler
+        self.path = path
+        self.unit = unit
+        # Title of the group the button is in
+        self.group = group
+        # Output of a cacheable local command is reused for ttl seconds
+        # (settings.local_cache_ttl when None)
+        self.cacheable = cacheable
+        self.ttl = ttl
+        # Remote host names a command of a remote group runs on (all of
+        # settings.remote_hosts when empty); None runs it on this machine
+        self.hosts = hosts
+        # Pacing of a multi-line serial command (settings.serial_line_delay
+        # and serial_batch_window when None)
+        self.line_delay = line_delay
+        self.window = window
+        # Name of the parsers.PARSERS entry reading the output, or 'auto'
+        # to pick one from the command; None logs the output as it is
+        self.parser = parser
+
+    @property
+    def remote(self):
+        return self.hosts is not None
+
+    @property
+    def per_device(self):
+        return self.action in PER_DEVICE_ACTIONS or self.remote
+
+    def __repr__(self):
+        return f"<Button {self.text!r} {self.action}>"
+
+
+class ButtonGroup:
+
+    __slots__ = ('title', 'description', 'group_type', 'buttons', 'path', 'hosts')
+
+    def __init__(self, title, description, group_type, buttons, path, hosts=None):
+        self.title = title
+        self.description = description
+        self.group_type = group_type
+        self.buttons = buttons
+        self.path = path
+        # As Button.hosts, for a remote group
+        self.hosts = hosts
+
+
+class UnitType:
+
+    __slots__ = ('name', 'description', 'groups', '_by_text')
+
+    def __init__(self, name, description, groups):
+        self.name = name
+        self.description = description
+        self.groups = groups
+        # First button wins when two share a (case-insensitive) text
+        self._by_text = {}
+        for group in groups:
+            for button in group.buttons:
+                self._by_text.setdefault(button.text.strip().lower(), button)
+
+    def find(self, text):
+        return self._by_text.get(text.strip().lower())
+
+
+class ConfigModel:
+    """Unit types in config order, each with its groups and buttons
+
+    Unit types from include_unit_types files are listed by name up front
+    and compiled by their loader the first time unit() asks for them.
+    """
+
+    __slots__ = ('units', '_loaders', '_descriptions')
+
+    def __init__(self, units, loaders=None, descriptions=None):
+        self.units = units
+        self._loaders = loaders or {}
+        self._descriptions = descriptions or {}
+
+    def unit(self, name):
+        unit = self.units.get(name)
+        if unit is None and name in self._loaders:
+            # Raises ConfigSchemaError for a bad file, and again on the next call
+            unit = self.units[name] = self._loaders[name]()
+        return unit
+
+    def unit_names(self):
+        return list(self.units) + [name for name in self._loaders if name not in self.units]
+
+    def description(self, name):
+        """A unit type's description, without compiling a lazily loaded one"""
+        if name in self.units:
+            return self.units[name].description
+        return self._descriptions.get(name, '')
+
+    def is_loaded(self, name):
+        return name in self.units
+
+    def reload(self, name):
+        """Forget a lazily loaded unit type so the next unit() compiles it again"""
+        if name in self._loaders:
+            self.units.pop(name, None)
+
+
+class _Compiler:
+
+    def __init__(self, handlers, compile_template, source=None, host_names=None, settings=None):
+        self.handlers = handlers or {}
+        self.compile_template = compile_template
+        # Names in settings.remote_hosts; None skips checking group hosts
+        self.host_names = host_names
+        # Settings templates may use; None skips checking them
+        self.setting_names = template_setting_names(settings) if settings is not None else None
+        # Name of the unit type and title of the group being compiled
+        self.unit_name = None
+        self.group_title = None
+        # File the paths are relative to, for unit types kept in their own file
+        self.source = source
+        self.errors = []
+
+    def error(self, path, message):
+        self.errors.append((f"{self.source}:{json_path(path)}" if self.source else json_path(path), message))
+
+    def includes(self, patterns):
+        if patterns is None:
+            return
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        if not isinstance(patterns, list) or not all(isinstance(item, str) and item for item in patterns):
+            self.error(['include_unit_types'], "expected a list of file patterns")
+
+    def settings(self, settings):
+        path = ['settings']
+        if not isinstance(settings, dict):
+            self.error(path, "is required" if settings is None else "expected an object")
+            return
+        for key in REQUIRED_SETTINGS:
+            if key not in settings:
+                self.error(path + [key], "is required")
+        for key, value in settings.items():
+            problem = check_setting(key, value)
+            if problem:
+                self.error(path + [key], problem)
+
+    def units(self, unit_types):
+        path = ['unit_types']
+        if unit_types is None:
+            return {}
+        if not isinstance(unit_types, dict):
+            self.error(path, "expected an object")
+            return {}
+        return {name: self.unit(name, data, path + [name]) for name, data in unit_types.items()}
+
+    def unit(self, name, data, path):
+        self.unit_name = name
+        if not isinstance(data, dict):
+            self.error(path, "expected an object")
+            return UnitType(name, '', [])
+        groups = data.get('button_groups', [])
+        if not isinstance(groups, list):
+            self.error(path + ['button_groups'], "expected a list")
+            groups = []
+        return UnitType(name, self.text(data, 'description', path, required=False),
+                        [self.group(group, path + ['button_groups', i]) for i, group in enumerate(groups)])
+
+    def group(self, data, path):
+        if not isinstance(data, dict):
+            self.error(path, "expected an object")
+            return ButtonGroup('', '', 'serial', [], tuple(path))
+        title = self.text(data, 'title', path)
+        self.group_title = title
+        hosts = self.hosts(data, path)
+        buttons = data.get('buttons', [])
+        if not isinstance(buttons, list):
+            self.error(path + ['buttons'], "expected a list")
+            buttons = []
+        buttons = [button for button in (self.button(item, path + ['buttons', i], hosts)
+                                         for i, item in enumerate(buttons))
+                   if button is not None]
+        group_type = data.get('group_type')
+        if group_type is None:
+            group_type = infer_group_type(title, {button.action for button in buttons})
+        elif group_type not in GROUP_TYPES:
+            self.error(path + ['group_type'], f"expected one of {', '.join(GROUP_TYPES)}, got {group_type!r}")
+        return ButtonGroup(title, self.text(data, 'description', path, required=False), group_type,
+                           buttons, tuple(path), hosts)
+
+    def hosts(self, data, path):
+        """A remote group's host names as a tuple (empty for all hosts), or None for a local group"""
+        hosts = data.get('hosts')
+        remote = data.get('remote', hosts is not None)
+        if not isinstance(remote, bool):
+            self.error(path + ['remote'], f"expected true or false, got {remote!r}")
+            return None
+        if hosts is None:
+            return () if remote else None
+        if not isinstance(hosts, list) or not all(isinstance(name, str) and name for name in hosts):
+            self.error(path + ['hosts'], "expected a list of remote host names")
+            return None
+        if self.host_names is not None:
+            for i, name in enumerate(hosts):
+                if name not in self.host_names:
+                    self.error(path + ['hosts', i], f"{name!r} is not in settings.remote_hosts")
+        return tuple(hosts) if remote else None
+
+    def button(self, data, path, hosts=None):
+        if not isinstance(data, dict):
+            self.error(path, "expected an object")
+            return None
+        errors = len(self.errors)
+        text = self.text(data, 'text', path)
+        action = data.get('action')
+        if action not in ACTIONS:
+            self.error(path + ['action'], f"expected one of {', '.join(ACTIONS)}, got {action!r}")
+
+        command = data.get('command')
+        if action in COMMAND_ACTIONS or command is not None:
+            if not isinstance(command, str) or (action in COMMAND_ACTIONS and not command):
+                self.error(path + ['command'], "expected a command string")
+            else:
+                self.template(command, path + ['command'])
+
+        wait_for = data.get('wait_for')
+        if wait_for is not None and not (isinstance(wait_for, bool) or _is_regex(wait_for)):
+            self.error(path + ['wait_for'], f"expected true or a regular expression, got {wait_for!r}")
+        timeout = data.get('timeout')
+        if timeout is not None and not (_is_number(timeout) and float(timeout) > 0):
+            self.error(path + ['timeout'], f"expected a positive number of seconds, got {timeout!r}")
+        style = data.get('style', {})
+        if not isinstance(style, dict):
+            self.error(path + ['style'], "expected an object")
+
+        ttl = data.get('ttl')
+        if ttl is not None and not (_is_number(ttl) and float(ttl) > 0):
+            self.error(path + ['ttl'], f"expected a positive number of seconds, got {ttl!r}")
+        cacheable = data.get('cacheable', ttl is not None)
+        if not isinstance(cacheable, bool):
+            self.error(path + ['cacheable'], f"expected true or false, got {cacheable!r}")
+        elif cacheable and action != 'run_local_command':
+            self.error(path + ['cacheable'], "only run_local_command buttons can be cached")
+        elif cacheable and hosts is not None:
+            self.error(path + ['cacheable'], "commands of remote groups are not cached")
+        if hosts is not None and action in ACTIONS and action != 'run_local_command':
+            self.error(path + ['action'], f"remote groups only hold run_local_command buttons, got {action!r}")
+
+        line_delay = data.get('line_delay')
+        if line_delay is not None and not (_is_number(line_delay) and float(line_delay) >= 0):
+            self.error(path + ['line_delay'], f"expected a number of seconds, got {line_delay!r}")
+        window = data.get('window')
+        if window is not None and not (_is_integer(window) and int(window) > 0):
+            self.error(path + ['window'], f"expected a positive integer, got {window!r}")
+        if action != 'send_to_serial':
+            for key in ('line_delay', 'window'):
+                if data.get(key) is not None:
+                    self.error(path + [key], "only applies to send_to_serial buttons")
+
+        parser = data.get('parser')
+        if parser is not None:
+            if not isinstance(parser, str):
+                self.error(path + ['parser'], f"expected a parser name or 'auto', got {parser!r}")
+            elif action not in ('run_local_command', 'send_to_serial'):
+                self.error(path + ['parser'], "only run_local_command and send_to_serial buttons can be parsed")
+            elif action == 'send_to_serial' and not wait_for:
+                self.error(path + ['parser'], "a parsed serial command needs wait_for to collect its response")
+            elif isinstance(command, str):
+                if action == 'send_to_serial' and '\n' in command.strip():
+                    self.error(path + ['parser'], "multi-line serial commands can't be parsed")
+                try:
+                    find_parser(parser, command)
+                except ParserError as e:
+                    self.error(path + ['parser'], str(e))
+
+        sequence = None
+        if action == 'sequence':
+            try:
+                sequence = Sequence.from_config(data)
+            except SequenceError as e:
+                self.error(path + ['steps'] + [key for key in (e.step, e.key) if key is not None], str(e))
+            else:
+                for i, step in enumerate(sequence.steps):
+                    if 'command' in step:
+                        self.template(step['command'], path + ['steps', i, 'command'])
+
+        if len(self.errors) > errors:
+            return None
+        return Button(text, action, command=command, wait_for=wait_for,
+                      timeout=float(timeout) if timeout is not None else None, style=style,
+                      sequence=sequence, handler=self.handlers.get('remote_command' if hosts is not None else action),
+                      path=tuple(path), unit=self.unit_name, group=self.group_title, cacheable=cacheable,
+                      ttl=float(ttl) if ttl is not None else None, hosts=hosts,
+                      line_delay=float(line_delay) if line_delay is not None else None,
+                      window=int(window) if window is not None else None, parser=parser)
+
+    def text(self, data, key, path, required=True):
+        value = data.get(key)
+        if value is None and not required:
+            return ''
+        if not isinstance(value, str) or (required and not value.strip()):
+            self.error(path + [key], "expected a non-empty string" if required else "expected a string")
+            return ''
+        return value
+
+    def template(self, command, path):
+        if self.compile_template is None:
+            return
+        try:
+            compiled = self.compile_template(command)
+        except ValueError as e:
+            self.error(path, str(e))
+            return
+        keys = getattr(compiled, 'keys', None)
+        if self.setting_names is not None and keys:
+            missing = sorted(key for key in keys if key not in self.setting_names)
+            if missing:
+                self.error(path, f"uses unknown setting(s): {', '.join(missing)}")
+
+
+def template_setting_names(settings):
+    """Settings a command template may name: every setting, and any a device overrides"""
+    if not isinstance(settings, dict):
+        return set()
+    names = set(settings)
+    device_settings = settings.get('device_settings')
+    if isinstance(device_settings, dict):
+        for overrides in device_settings.values():
+            if isinstance(overrides, dict):
+                names.update(overrides)
+    return names
+
+
+def compile_unit(name, data, handlers=None, compile_template=None, source=None, host_names=None, settings=None):
+    """Check one unit type's dict and build its UnitType; raises ConfigSchemaError
+
+    source names the file the unit type came from; error paths are then
+    relative to that file. host_names are the remote hosts groups may name
+    and settings the ones command templates may use.
+    """
+    compiler = _Compiler(handlers, compile_template, source, host_names, settings)
+    unit = compiler.unit(name, data, [])
+    if compiler.errors:
+        raise ConfigSchemaError(compiler.errors)
+    return unit
+
+
+def compile_config(config, handlers=None, compile_template=None, catalog=None):
+    """Check a raw config dict and build its ConfigModel; raises ConfigSchemaError
+
+    handlers maps action names to handler(button, device) callables, and
+    'remote_command' to the handler of buttons in remote groups;
+    compile_template(text) should raise ValueError for a malformed command
+    template and return an object whose .keys are the settings it uses,
+    which must exist in the config's settings. Unit types of a catalog (see unit_catalog.py) are only
+    checked for clashing names here and compiled when first used.
+    """
+    if not isinstance(config, dict):
+        raise ConfigSchemaError([('$', "expected an object")])
+    settings = config.get('settings')
+    compiler = _Compiler(handlers, compile_template, host_names=remote_host_names(settings),
+                         settings=settings if isinstance(settings, dict) else None)
+    compiler.settings(config.get('settings'))
+    compiler.includes(config.get('include_unit_types'))
+    units = compiler.units(config.get('unit_types'))
+
+    loaders, descriptions = {}, {}
+    if catalog is not None:
+        for entry in catalog.entries():
+            name = entry['name']
+            if name in units or name in loaders:
+                compiler.error(['include_unit_types'], f"unit type {name!r} in {entry['file']} is already defined")
+                continue
+            loaders[name] = _unit_loader(catalog, name, entry['file'], handlers, compile_template,
+                                         compiler.host_names, settings)
+            descriptions[name] = entry['description']
+    if compiler.errors:
+        raise ConfigSchemaError(compiler.errors)
+    return ConfigModel(units, loaders, descriptions)
+
+
+def remote_host_names(settings):
+    """Names of settings.remote_hosts, or None if they are malformed (reported as a settings error)"""
+    hosts = settings.get('remote_hosts') if isinstance(settings, dict) else None
+    if hosts is None:
+        return set()
+    if not _is_host_list(hosts):
+        return None
+    return {entry.get('name') or entry['host'] if isinstance(entry, dict) else entry for entry in hosts}
+
+
+def _unit_loader(catalog, name, source, handlers, compile_template, host_names, settings):
+    def load():
+        try:
+            data = catalog.load(name)
+        except (OSError, ValueError) as e:
+            raise ConfigSchemaError([(source, str(e))]) from e
+        # settings is the live dict, so settings added since startup count
+        return compile_unit(name, data, handlers, compile_template, source, host_names,
+                            settings if isinstance(settings, dict) else None)
+    return load
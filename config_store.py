@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""Crash-safe config persistence: change journal plus debounced atomic snapshots"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+
+def atomic_write(path, data):
+    """Replace a file's contents so readers see either the old or the new version"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    if os.name == 'posix':
+        # Make the rename itself durable
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def _resolve(config, path):
+    """Walk a list of keys/indexes and return the container it points to"""
+    node = config
+    for key in path:
+        node = node[key]
+    return node
+
+
+def apply_change(config, change):
+    """Apply one journal entry to a config dict"""
+    op = change['op']
+    path = change['path']
+    if op == 'append':
+        _resolve(config, path).append(change['value'])
+    elif op == 'set':
+        _resolve(config, path[:-1])[path[-1]] = change['value']
+    else:
+        raise ValueError(f"Unknown config change: {op}")
+
+
+class ConfigStore:
+    """Owns the in-memory config and keeps config.json in sync with it
+
+    Every edit is applied in memory and appended to <config>.journal with
+    fsync, which is cheap regardless of config size. A full snapshot is
+    written to a temp file, fsynced and renamed over config.json on a
+    background thread once edits have been quiet for `debounce` seconds,
+    after which the journal is emptied. On load, any journal left behind
+    by a crash is replayed over the snapshot.
+
+    Every journal entry carries a sequence number. The <config>.seq sidecar
+    maps the SHA-256 of the last two snapshots to the number of the last
+    change each contains; it is written before the snapshot it describes,
+    so whichever snapshot survives a crash, its entry is found by hash.
+    Replay skips entries that snapshot already has, so a crash between
+    writing the snapshot and emptying the journal doesn't apply an edit
+    twice. A snapshot with no matching entry (edited by hand, or from
+    before the sidecar existed) has the whole journal replayed over it.
+    """
+
+    def __init__(self, path, debounce=1.0, on_error=None, on_saved=None):
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self.seq_path = f"{path}.seq"
+        self.debounce = debounce
+        self.on_error = on_error
+        self.on_saved = on_saved
+        self.config = None
+        self.recovered = 0
+
+        # Held while the config is mutated or serialized
+        self.lock = threading.RLock()
+        self._timer = None
+        self._write_lock = threading.Lock()
+        self._journal_entries = 0
+        self._seq = 0
+        # [{'sha256': ..., 'seq': ...}] for the newest snapshots, newest first
+        self._snapshots = []
+
+    def load(self):
+        """Read config.json and replay any journal left by an unclean exit"""
+        with open(self.path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        config = json.loads(text)
+        self._snapshots = self._read_seq()
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        saved_seq = next((s['seq'] for s in self._snapshots if s['sha256'] == digest), 0)
+        self._seq = saved_seq
+        self.recovered = 0
+        for change in self._read_journal():
+            seq = change.get('seq')
+            if seq is not None:
+                self._seq = max(self._seq, seq)
+                if seq <= saved_seq:
+                    # Already in the snapshot
+                    continue
+            try:
+                apply_change(config, change)
+                self.recovered += 1
+            except (KeyError, IndexError, TypeError, ValueError):
+                continue
+        self.config = config
+        self._journal_entries = self.recovered
+        if self.recovered:
+            self.schedule_save()
+        return config
+
+    def _read_seq(self):
+        try:
+            with open(self.seq_path, 'r', encoding='utf-8') as f:
+                snapshots = json.load(f).get('snapshots', [])
+        except (OSError, ValueError, AttributeError):
+            return []
+        return [s for s in snapshots
+                if isinstance(s, dict) and isinstance(s.get('sha256'), str) and isinstance(s.get('seq'), int)]
+
+    def _read_journal(self):
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+        changes = []
+        for line in lines:
+            try:
+                change = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn last line from a crash mid-append
+                continue
+            if isinstance(change, dict):
+                changes.append(change)
+        return changes
+
+    def append(self, path, value):
+        """Append value to the list at path"""
+        self._change({'op': 'append', 'path': list(path), 'value': value})
+
+    def set(self, path, value):
+        """Set the key at path to value"""
+        self._change({'op': 'set', 'path': list(path), 'value': value})
+
+    def _change(self, change):
+        with self.lock:
+            change['seq'] = self._seq + 1
+            line = json.dumps(change, ensure_ascii=False) + "\n"
+            # Journal first: if this raises, the in-memory config is untouched
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            apply_change(self.config, change)
+            self._seq = change['seq']
+            self._journal_entries += 1
+        self.schedule_save()
+
+    def schedule_save(self):
+        """Write a snapshot once no further edits arrive for `debounce` seconds"""
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.debounce, self._save_in_background)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _save_in_background(self):
+        try:
+            self.save_now()
+        except Exception as e:
+            if self.on_error:
+                self.on_error(e)
+
+    def save_now(self):
+        """Write a snapshot immediately and empty the journal"""
+        with self._write_lock:
+            with self.lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                data = json.dumps(self.config, indent=2, ensure_ascii=False)
+                seq = self._seq
+                entries = self._journal_entries
+            digest = hashlib.sha256(data.encode('utf-8')).hexdigest()
+            # Keep the previous snapshot's entry: it is the one on disk if the rename below never happens
+            self._snapshots = [{'sha256': digest, 'seq': seq}] + [
+                s for s in self._snapshots if s['sha256'] != digest][:1]
+            atomic_write(self.seq_path, json.dumps({'snapshots': self._snapshots}))
+            atomic_write(self.path, data)
+            with self.lock:
+                # Edits made while the snapshot was written stay in the journal
+                if self._journal_entries == entries:
+                    self._truncate_journal()
+                    self._journal_entries = 0
+        if self.on_saved:
+            self.on_saved()
+
+    def _truncate_journal(self):
+        try:
+            os.unlink(self.journal_path)
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        """Flush pending edits before exit"""
+        with self.lock:
+            pending = self._timer is not None or self._journal_entries
+        if pending:
+            self.save_now()
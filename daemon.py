@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""Long-running headless service with a JSON-lines API on a local Unix socket
+
+Each request is one JSON object per line and gets one JSON object back:
+
+    {"op": "run", "unit": "Switch", "button": "Kill dhclient", "devices": [...], "hosts": [...], "wait": true}
+    {"op": "send", "command": "show version", "devices": [...], "wait_for": true}
+    {"op": "send", "lines": ["conf t", "..."], "devices": [...], "line_delay": 0.05, "wait_for": true, "window": 4}
+    {"op": "list", "unit": "Switch"}
+    {"op": "targets"}
+    {"op": "ports"}
+    {"op": "status"}
+    {"op": "metrics", "format": "json" | "prometheus"}
+    {"op": "search", "query": "link down", "devices": [...], "since": 1700000000, "regex": "...", "limit": 100}
+    {"op": "find", "query": "sh int", "limit": 20}
+    {"op": "cancel"}
+    {"op": "ping"}
+
+Responses carry "ok" plus op-specific fields, or "ok": false and "error".
+"""
+
+import itertools
+import json
+import os
+import re
+import socket
+import socketserver
+import tempfile
+import threading
+
+from capture import STREAM_NAMES
+from engine import ConfigError, EngineError
+from fanout import FanOut
+
+
+def default_socket_path():
+    """Per-user socket path, in XDG_RUNTIME_DIR when available"""
+    directory = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    name = 'port-control.sock' if 'XDG_RUNTIME_DIR' in os.environ else f'port-control-{os.getuid()}.sock'
+    return os.path.join(directory, name)
+
+
+class DaemonError(Exception):
+    """Raised when the daemon can't be reached or answers with an error"""
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("request must be a JSON object")
+                response = self.server.daemon.handle(request)
+            except (ValueError, KeyError, TypeError, re.error, EngineError, ConfigError) as e:
+                # A unit type file that fails to load raises ConfigError
+                response = {'ok': False, 'error': str(e)}
+            self.wfile.write((json.dumps(response) + "\n").encode('utf-8'))
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class CommandDaemon:
+    """Serves an Engine over a Unix socket until shutdown() is called"""
+
+    def __init__(self, engine, socket_path=None):
+        if not hasattr(socket, 'AF_UNIX'):
+            raise DaemonError("Daemon mode needs Unix domain sockets")
+        self.engine = engine
+        self.socket_path = socket_path or default_socket_path()
+        self._server = None
+
+    def handle(self, request):
+        op = request.get('op')
+        handler = getattr(self, f'_op_{op}', None) if isinstance(op, str) else None
+        if handler is None:
+            raise ValueError(f"unknown op '{op}'")
+        return handler(request)
+
+    def _op_ping(self, request):
+        return {'ok': True, 'pid': os.getpid()}
+
+    def _op_list(self, request):
+        return {'ok': True, 'units': self.engine.list_buttons(request.get('unit'))}
+
+    def _op_targets(self, request):
+        return {'ok': True, 'targets': [list(target) for target in self.engine.serial_targets],
+                'hosts': list(self.engine.remote_hosts)}
+
+    def _op_ports(self, request):
+        return {'ok': True, 'ports': [info.to_dict() for info in self.engine.device_index.ports()]}
+
+    def _op_run(self, request):
+        unit = request.get('unit') or self.engine.unit_types()[0]
+        button = self.engine.find_button(unit, request['button'])
+        fanout = self.engine.dispatch_button(button, request.get('devices'), request.get('hosts'))
+        return self._finish(fanout, request)
+
+    def _op_send(self, request):
+        devices = request.get('devices') or [self.engine.settings['serial_device']]
+        lines = request.get('lines')
+        fanout = FanOut(request.get('command') or f"{len(lines or ())} lines")
+        for device in devices:
+            if lines is not None:
+                job = self.engine.queue_serial_batch(
+                    lines, device, line_delay=request.get('line_delay'), wait_for=request.get('wait_for'),
+                    window=request.get('window'), timeout=request.get('timeout'))
+            else:
+                job = self.engine.queue_serial_command(request['command'], device, wait_for=request.get('wait_for'),
+                                                       timeout=request.get('timeout'))
+            if job is not None:
+                self.engine.metrics.track(job, 'send')
+                fanout.add(device, job)
+        fanout.seal()
+        return self._finish(fanout, request)
+
+    def _finish(self, fanout, request):
+        if request.get('wait', True):
+            self.engine.wait(fanout, request.get('timeout'))
+        results = [result.to_dict() for result in fanout.results]
+        ok = bool(results) and all(result['state'] == 'done' for result in results)
+        return {'ok': ok, 'results': results}
+
+    def _op_status(self, request):
+        jobs = [{'id': job.id, 'lane': job.lane, 'state': job.state, 'description': job.description}
+                for job in self.engine.scheduler.active_jobs()]
+        return {'ok': True, 'queue': self.engine.scheduler.queue_depth(), 'jobs': jobs,
+                'cache': self.engine.result_cache.stats(), 'ssh': self.engine.ssh_pool.stats(),
+                'snapshots': self.engine.snapshots.stats()}
+
+    def _op_metrics(self, request):
+        if request.get('format') == 'prometheus':
+            return {'ok': True, 'text': self.engine.metrics.to_prometheus()}
+        return {'ok': True, 'metrics': self.engine.metrics.snapshot()}
+
+    def _op_search(self, request):
+        if self.engine.capture is None:
+            return {'ok': False, 'error': "session capture is turned off"}
+        regex = request.get('regex')
+        if regex:
+            # search() is lazy, so a bad pattern would only surface while reading results
+            try:
+                re.compile(regex)
+            except re.error as e:
+                return {'ok': False, 'error': f"invalid regex {regex!r}: {e}"}
+        results = self.engine.capture.search(request.get('query', ''), devices=request.get('devices'),
+                                             since=request.get('since'), until=request.get('until'),
+                                             regex=request.get('regex'))
+        limit = request.get('limit', 1000)
+        records = [{'timestamp': record.timestamp, 'device': record.device, 'stream': STREAM_NAMES[record.stream],
+                    'text': record.text} for record in itertools.islice(results, limit)]
+        return {'ok': True, 'records': records}
+
+    def _op_find(self, request):
+        entries = self.engine.search_commands(request.get('query', ''), int(request.get('limit', 50)))
+        return {'ok': True, 'buttons': [{'unit': entry.unit, 'group': entry.group, 'button': entry.text,
+                                         'command': entry.command} for entry in entries]}
+
+    def _op_cancel(self, request):
+        return {'ok': True, 'cancelled': len(self.engine.cancel_pending())}
+
+    def serve_forever(self):
+        """Bind the socket (owner access only) and handle requests until shutdown()"""
+        if os.path.exists(self.socket_path):
+            # Refuse to steal the socket of a daemon that is still running
+            try:
+                request(self.socket_path, {'op': 'ping'}, timeout=1)
+            except DaemonError:
+                os.unlink(self.socket_path)
+            else:
+                raise DaemonError(f"A daemon is already listening on {self.socket_path}")
+
+        old_umask = os.umask(0o077)
+        try:
+            self._server = _Server(self.socket_path, _RequestHandler)
+        finally:
+            os.umask(old_umask)
+        self._server.daemon = self
+        self.engine.log(f"Listening on {self.socket_path}", "SUCCESS")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            try:
+                os.unlink(self.socket_path)
+            except FileNotFoundError:
+                pass
+
+    def shutdown(self):
+        """Stop serve_forever(); safe to call from a signal handler"""
+        if self._server is not None:
+            # shutdown() blocks until the serve loop exits, so it can't run on that thread
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
+
+
+def request(socket_path, payload, timeout=None):
+    """Send one request to a running daemon and return its response"""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(socket_path)
+            sock.sendall((json.dumps(payload) + "\n").encode('utf-8'))
+            with sock.makefile('rb') as f:
+                line = f.readline()
+    except OSError as e:
+        raise DaemonError(f"Cannot reach daemon at {socket_path}: {e}") from e
+    if not line:
+        raise DaemonError(f"Daemon at {socket_path} closed the connection")
+    return json.loads(line)
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""Cached index of serial ports, kept current by watching /dev for hotplug events"""
+
+import errno
+import glob
+import os
+import re
+import select
+import stat
+import struct
+import sys
+import threading
+import time
+
+from serial_session import SerialError, open_port
+
+# Device nodes that can be serial ports
+PORT_PATTERNS = ('/dev/ttyS*', '/dev/ttyUSB*', '/dev/ttyACM*')
+PORT_NAME = re.compile(r'^tty(S|USB|ACM)\d+$')
+BY_ID_DIR = '/dev/serial/by-id'
+
+# inotify event bits (linux/inotify.h)
+IN_ATTRIB = 0x004
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+
+
+def _com_port_exists(port):
+    try:
+        # Try to open the port to see if it exists
+        import serial
+        serial.Serial(port, timeout=1).close()
+        return True
+    except Exception:
+        return False
+
+
+def _port_exists(device):
+    """Whether a device node is a serial port that is really there, from stat and sysfs, without opening it"""
+    try:
+        if not stat.S_ISCHR(os.stat(device).st_mode):
+            return False
+    except OSError:
+        return False
+    try:
+        with open(f"/sys/class/tty/{os.path.basename(device)}/type", encoding='utf-8') as f:
+            # PORT_UNKNOWN: a built-in ttyS node with no UART behind it
+            return f.read().strip() != '0'
+    except OSError:
+        # Only serial_core ports have a type; USB adapters and ACM modems are there if their node is
+        return True
+
+
+def _usb_serial_number(device):
+    """USB serial number of the adapter behind a tty, from sysfs"""
+    path = os.path.realpath(f"/sys/class/tty/{os.path.basename(device)}/device")
+    # Walk up from the tty's interface to the USB device that has a serial attribute
+    while path.startswith('/sys/devices/') and path != '/sys/devices':
+        try:
+            with open(os.path.join(path, 'serial'), encoding='utf-8') as f:
+                return f.read().strip() or None
+        except OSError:
+            path = os.path.dirname(path)
+    return None
+
+
+class PortInfo:
+    """One serial port in the index
+
+    stable_id is the /dev/serial/by-id link when udev made one, which
+    survives replugging into another USB socket; otherwise the USB serial
+    number, otherwise the device node.
+    """
+
+    def __init__(self, device, by_id=None, serial_number=None):
+        self.device = device
+        self.by_id = by_id
+        self.serial_number = serial_number
+        # None until probed, or when the port was busy
+        self.responsive = None
+        self.response = ''
+        self.probed_at = None
+
+    @property
+    def stable_id(self):
+        if self.by_id:
+            return self.by_id
+        if self.serial_number:
+            return f"usb:{self.serial_number}"
+        return self.device
+
+    @property
+    def path(self):
+        """Path to open the port with, preferring the by-id link that survives replugging"""
+        return self.by_id or self.device
+
+    @property
+    def name(self):
+        if self.by_id:
+            # usb-FTDI_FT232R_USB_UART_A12345-if00-port0 -> FTDI_FT232R_USB_UART_A12345
+            return os.path.basename(self.by_id).split('usb-', 1)[-1].rsplit('-if', 1)[0]
+        return os.path.basename(self.device)
+
+    def to_dict(self):
+        return {'device': self.device, 'path': self.path, 'stable_id': self.stable_id, 'name': self.name,
+                'by_id': self.by_id, 'serial_number': self.serial_number,
+                'responsive': self.responsive, 'response': self.response}
+
+
+class DeviceIndex:
+    """Serial ports found on this machine, scanned once and then updated in place
+
+    scan() checks every candidate node with stat and sysfs, never opening
+    it; with probe set it also opens the ports in parallel and sends a
+    short handshake to see whether anything answers. Ports that busy()
+    returns are never opened. After that, watch() follows
+    plug and unplug events (inotify on Linux, a cheap directory poll
+    elsewhere) and probes only the ports that changed, so lookups never
+    wait on the hardware.
+
+    on_change(added, removed) is called from a background thread with lists
+    of PortInfo whenever ports appear or disappear.
+    """
+
+    # Seconds to let udev finish creating links and setting permissions after a plug event
+    SETTLE_DELAY = 0.5
+    # Directory poll interval where inotify isn't available
+    POLL_INTERVAL = 2.0
+
+    def __init__(self, baudrate=115200, probe=False, probe_timeout=0.3, probe_payload='\r\n',
+                 busy=None, on_change=None, max_workers=16):
+        self.baudrate = baudrate
+        self.probe = probe
+        self.probe_timeout = probe_timeout
+        self.probe_payload = probe_payload.encode('utf-8')
+        self.busy = busy
+        self.on_change = on_change
+        self.max_workers = max_workers
+
+        self._ports = {}
+        self._lock = threading.Lock()
+        self._scanned = threading.Event()
+        self._stop = threading.Event()
+        self._watcher = None
+
+    def ports(self, wait=True):
+        """Indexed ports sorted by device; scans or waits for the first scan unless wait is False"""
+        if wait:
+            self._ensure_scanned()
+        with self._lock:
+            return sorted(self._ports.values(), key=lambda info: info.device)
+
+    def lookup(self, identifier):
+        """Find a port by device node, by-id link or usb:<serial number>"""
+        self._ensure_scanned()
+        real = os.path.realpath(identifier) if identifier.startswith('/') else identifier
+        with self._lock:
+            for info in self._ports.values():
+                if identifier in (info.device, info.by_id, info.stable_id) or real == info.device:
+                    return info
+        return None
+
+    def _ensure_scanned(self):
+        if not self._scanned.is_set():
+            if self._watcher is None:
+                self.scan()
+            else:
+                self._scanned.wait()
+
+    def scan(self):
+        """Rebuild the index from scratch, probing all ports in parallel"""
+        found = self._candidates()
+        infos = self._probe_all(found)
+        with self._lock:
+            old = self._ports
+            self._ports = {info.device: info for info in infos}
+            added = [info for device, info in self._ports.items() if device not in old]
+            removed = [info for device, info in old.items() if device not in self._ports]
+        rescan = self._scanned.is_set()
+        self._scanned.set()
+        # The first scan only fills the index; later ones report what changed
+        if rescan and (added or removed) and self.on_change:
+            self.on_change(added, removed)
+        return self.ports()
+
+    def _candidates(self):
+        """Existing port nodes mapped to PortInfo, without opening anything"""
+        if sys.platform.startswith('win'):
+            return {f"COM{i}": PortInfo(f"COM{i}") for i in range(1, 10)}
+
+        by_id = {}
+        for link in glob.glob(os.path.join(BY_ID_DIR, '*')):
+            by_id[os.path.realpath(link)] = link
+        found = {}
+        for pattern in PORT_PATTERNS:
+            for device in glob.glob(pattern):
+                found[device] = PortInfo(device, by_id.get(device), _usb_serial_number(device))
+        return found
+
+    def _probe_all(self, found):
+        if not found:
+            return []
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(found))) as pool:
+            results = pool.map(self._probe_port, found.values())
+            return [info for info, exists in zip(found.values(), results) if exists]
+
+    def _probe_port(self, info):
+        """Check that the port exists and, when probing, send the handshake and wait briefly for an answer; False if the port is absent"""
+        if sys.platform.startswith('win'):
+            return _com_port_exists(info.device)
+        if not _port_exists(info.device):
+            return False
+        if not self.probe:
+            return True
+        busy = self.busy() if self.busy else ()
+        if info.device in busy or info.by_id in busy:
+            # The app already has it open; a probe would steal its input
+            return True
+
+        try:
+            port = open_port(info.device, baudrate=self.baudrate, write_timeout=self.probe_timeout)
+        except SerialError as e:
+            # Built-in ttyS nodes with no UART behind them fail with EIO
+            cause = e.__cause__
+            return not (isinstance(cause, OSError) and cause.errno in (errno.EIO, errno.ENXIO, errno.ENODEV))
+        try:
+            os.write(port.fileno(), self.probe_payload)
+            deadline = time.monotonic() + self.probe_timeout
+            data = b''
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                readable, _, _ = select.select([port], [], [], remaining)
+                if not readable:
+                    break
+                chunk = os.read(port.fileno(), 4096)
+                if not chunk:
+                    break
+                data += chunk
+            info.responsive = bool(data.strip())
+            lines = data.decode('utf-8', errors='replace').strip().splitlines()
+            # The last line is usually a prompt or banner that hints at what is attached
+            info.response = lines[-1] if lines else ''
+            info.probed_at = time.time()
+            return True
+        except OSError:
+            info.responsive = False
+            return True
+        finally:
+            port.close()
+
+    def update(self, devices):
+        """Re-examine some device nodes after a hotplug event"""
+        candidates = self._candidates()
+        changed = {device: candidates[device] for device in devices if device in candidates}
+        present = {info.device for info in self._probe_all(changed)}
+        added, removed = [], []
+        with self._lock:
+            for device in devices:
+                if device in present:
+                    if device not in self._ports:
+                        added.append(changed[device])
+                    self._ports[device] = changed[device]
+                elif device in self._ports:
+                    removed.append(self._ports.pop(device))
+            # by-id links appear after the node itself, so refresh them for every port
+            for device, info in self._ports.items():
+                if device in candidates:
+                    info.by_id = candidates[device].by_id
+        if (added or removed) and self.on_change:
+            self.on_change(added, removed)
+
+    def watch(self):
+        """Scan, then follow hotplug events on a background thread until stop()"""
+        if self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, name="device-index", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self):
+        inotify = None
+        if sys.platform.startswith('linux'):
+            try:
+                inotify = _Inotify(['/dev'], IN_CREATE | IN_DELETE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO)
+            except OSError:
+                inotify = None
+        try:
+            self.scan()
+            if inotify is not None:
+                self._watch_inotify(inotify)
+            else:
+                self._watch_polling()
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    def _watch_inotify(self, inotify):
+        while not self._stop.is_set():
+            names = inotify.read(timeout=1.0)
+            if names is None:
+                # Event queue overflowed; start over
+                self.scan()
+                continue
+            devices = {f"/dev/{name}" for name in names if PORT_NAME.match(name)}
+            if not devices:
+                continue
+            # Collect the burst of events a single plug produces, then handle them once
+            if self._stop.wait(self.SETTLE_DELAY):
+                return
+            for name in inotify.read(timeout=0) or ():
+                if PORT_NAME.match(name):
+                    devices.add(f"/dev/{name}")
+            self.update(devices)
+
+    def _watch_polling(self):
+        known = set(self._candidates())
+        while not self._stop.wait(self.POLL_INTERVAL):
+            current = set(self._candidates())
+            if current != known:
+                self.update(current ^ known)
+                known = current
+
+
+class _Inotify:
+    """Just enough of inotify(7) through ctypes to watch a few directories"""
+
+    def __init__(self, paths, mask):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        for path in paths:
+            if libc.inotify_add_watch(self.fd, path.encode(), mask) < 0:
+                error = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(error, f"inotify_add_watch {path} failed")
+
+    def read(self, timeout):
+        """Names touched since the last read, [] on timeout, None if events were lost"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        names = []
+        offset = 0
+        while offset + 16 <= len(buf):
+            _, mask, _, length = struct.unpack_from('iIII', buf, offset)
+            offset += 16
+            if mask & IN_Q_OVERFLOW:
+                return None
+            names.append(buf[offset:offset + length].rstrip(b'\0').decode('utf-8', errors='replace'))
+            offset += length
+        return names
+
+    def close(self):
+        os.close(self.fd)
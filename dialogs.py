@@ -0,0 +1,766 @@
+#!/usr/bin/env python3
+"""Secondary windows of the GUI, imported the first time one is opened"""
+
+import tkinter as tk
+from tkinter import filedialog, messagebox, scrolledtext, ttk
+import time
+
+from capture import STREAM_NAMES
+from scheduler import PENDING, RUNNING
+import terminals
+
+class AddCommandDialog:
+    def __init__(self, parent, unit_type, group_title, group_type):
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title(f"Add New Command - {group_title}")
+        self.dialog.geometry("500x450")
+        self.dialog.transient(parent)
+        self.dialog.grab_set()
+        
+        self.unit_type = unit_type
+        self.group_title = group_title
+        self.group_type = group_type  # 'serial' or 'local'
+        self.result = None
+        
+        self._create_widgets()
+        
+        # Center the dialog
+        self.dialog.update_idletasks()
+        x = (self.dialog.winfo_screenwidth() // 2) - (500 // 2)
+        y = (self.dialog.winfo_screenheight() // 2) - (450 // 2)
+        self.dialog.geometry(f"500x450+{x}+{y}")
+        
+    def _create_widgets(self):
+        # Main frame
+        main_frame = tk.Frame(self.dialog, padx=20, pady=20)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        
+        # Button text
+        tk.Label(main_frame, text="Button Text:", font=("Helvetica", 10, "bold")).pack(anchor="w", pady=(0, 5))
+        self.button_text = tk.Entry(main_frame, width=50)
+        self.button_text.pack(fill=tk.X, pady=(0, 15))
+        
+        # Command type info (read-only)
+        action_text = "Send to Serial" if self.group_type == 'serial' else "Run Local Command"
+        tk.Label(main_frame, text=f"Action Type: {action_text}", 
+                font=("Helvetica", 9), fg="gray").pack(anchor="w", pady=(0, 15))
+        
+        # Command
+        tk.Label(main_frame, text="Command:", font=("Helvetica", 10, "bold")).pack(anchor="w", pady=(0, 5))
+        self.command_text = tk.Text(main_frame, height=4, width=50)
+        self.command_text.pack(fill=tk.X, pady=(0, 15))
+        
+        # Style options with visual color picker
+        style_frame = tk.LabelFrame(main_frame, text="Button Style (Optional)", padx=10, pady=10)
+        style_frame.pack(fill=tk.X, pady=(0, 15))
+        
+        # Background color with color picker
+        bg_frame = tk.Frame(style_frame)
+        bg_frame.pack(fill=tk.X, pady=(0, 5))
+        tk.Label(bg_frame, text="Background Color:").pack(side=tk.LEFT)
+        self.bg_color = tk.Entry(bg_frame, width=15)
+        self.bg_color.pack(side=tk.LEFT, padx=(10, 5))
+        self.bg_color.insert(0, "#f0f0f0")
+        self.bg_preview = tk.Frame(bg_frame, width=30, height=20, bg="#f0f0f0", relief=tk.RAISED, bd=2)
+        self.bg_preview.pack(side=tk.LEFT, padx=(0, 5))
+        tk.Button(bg_frame, text="Pick Color", command=self._pick_bg_color, 
+                 width=10, bg="#e0e0e0").pack(side=tk.LEFT)
+        
+        # Text color with color picker
+        fg_frame = tk.Frame(style_frame)
+        fg_frame.pack(fill=tk.X, pady=(0, 5))
+        tk.Label(fg_frame, text="Text Color:    ").pack(side=tk.LEFT)
+        self.fg_color = tk.Entry(fg_frame, width=15)
+        self.fg_color.pack(side=tk.LEFT, padx=(10, 5))
+        self.fg_color.insert(0, "black")
+        self.fg_preview = tk.Frame(fg_frame, width=30, height=20, bg="black", relief=tk.RAISED, bd=2)
+        self.fg_preview.pack(side=tk.LEFT, padx=(0, 5))
+        tk.Button(fg_frame, text="Pick Color", command=self._pick_fg_color, 
+                 width=10, bg="#e0e0e0").pack(side=tk.LEFT)
+        
+        # Buttons
+        button_frame = tk.Frame(main_frame)
+        button_frame.pack(fill=tk.X, pady=(20, 0))
+        
+        tk.Button(button_frame, text="Add Command", command=self._add_command, 
+                 bg="green", fg="white", width=15).pack(side=tk.RIGHT, padx=(10, 0))
+        tk.Button(button_frame, text="Cancel", command=self._cancel, 
+                 bg="red", fg="white", width=15).pack(side=tk.RIGHT)
+        
+    def _pick_bg_color(self):
+        """Open color picker for background color"""
+        from tkinter import colorchooser
+        color = colorchooser.askcolor(self.bg_color.get(), title="Choose Background Color")
+        if color[1]:  # color[1] contains the hex value
+            self.bg_color.delete(0, tk.END)
+            self.bg_color.insert(0, color[1])
+            self.bg_preview.config(bg=color[1])
+    
+    def _pick_fg_color(self):
+        """Open color picker for text color"""
+        from tkinter import colorchooser
+        color = colorchooser.askcolor(self.fg_color.get(), title="Choose Text Color")
+        if color[1]:  # color[1] contains the hex value
+            self.fg_color.delete(0, tk.END)
+            self.fg_color.insert(0, color[1])
+            self.fg_preview.config(bg=color[1])
+        
+    def _add_command(self):
+        button_text = self.button_text.get().strip()
+        command = self.command_text.get("1.0", tk.END).strip()
+        
+        if not button_text or not command:
+            messagebox.showerror("Error", "Button text and command are required!")
+            return
+            
+        # Create style dict if colors are specified
+        style = {}
+        if self.bg_color.get() and self.bg_color.get() != "#f0f0f0":
+            style["bg"] = self.bg_color.get()
+        if self.fg_color.get() and self.fg_color.get() != "black":
+            style["fg"] = self.fg_color.get()
+            
+        self.result = {
+            "text": button_text,
+            "action": "send_to_serial" if self.group_type == 'serial' else "run_local_command",
+            "command": command
+        }
+        
+        if style:
+            self.result["style"] = style
+            
+        self.dialog.destroy()
+        
+    def _cancel(self):
+        self.dialog.destroy()
+
+class AddGroupDialog:
+    def __init__(self, parent, unit_type):
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title(f"Add New Button Group - {unit_type}")
+        self.dialog.geometry("400x300")
+        self.dialog.transient(parent)
+        self.dialog.grab_set()
+        
+        self.unit_type = unit_type
+        self.result = None
+        
+        self._create_widgets()
+        
+        # Center the dialog
+        self.dialog.update_idletasks()
+        x = (self.dialog.winfo_screenwidth() // 2) - (400 // 2)
+        y = (self.dialog.winfo_screenheight() // 2) - (300 // 2)
+        self.dialog.geometry(f"400x300+{x}+{y}")
+        
+    def _create_widgets(self):
+        # Main frame
+        main_frame = tk.Frame(self.dialog, padx=20, pady=20)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        
+        # Group title
+        tk.Label(main_frame, text="Group Title:", font=("Helvetica", 10, "bold")).pack(anchor="w", pady=(0, 5))
+        self.group_title = tk.Entry(main_frame, width=40)
+        self.group_title.pack(fill=tk.X, pady=(0, 15))
+        
+        # Group description
+        tk.Label(main_frame, text="Group Description:", font=("Helvetica", 10, "bold")).pack(anchor="w", pady=(0, 5))
+        self.group_description = tk.Text(main_frame, height=4, width=40)
+        self.group_description.pack(fill=tk.X, pady=(0, 15))
+        
+        # Group type selection
+        tk.Label(main_frame, text="Group Type:", font=("Helvetica", 10, "bold")).pack(anchor="w", pady=(0, 5))
+        self.group_type_var = tk.StringVar(value="serial")
+        type_frame = tk.Frame(main_frame)
+        type_frame.pack(fill=tk.X, pady=(0, 15))
+        
+        tk.Radiobutton(type_frame, text="Serial Commands", variable=self.group_type_var, 
+                      value="serial").pack(side=tk.LEFT, padx=(0, 20))
+        tk.Radiobutton(type_frame, text="Local Commands", variable=self.group_type_var, 
+                      value="local").pack(side=tk.LEFT)
+        
+        # Buttons
+        button_frame = tk.Frame(main_frame)
+        button_frame.pack(fill=tk.X, pady=(20, 0))
+        
+        tk.Button(button_frame, text="Add Group", command=self._add_group, 
+                 bg="green", fg="white", width=15).pack(side=tk.RIGHT, padx=(10, 0))
+        tk.Button(button_frame, text="Cancel", command=self._cancel, 
+                 bg="red", fg="white", width=15).pack(side=tk.RIGHT)
+        
+    def _add_group(self):
+        title = self.group_title.get().strip()
+        description = self.group_description.get("1.0", tk.END).strip()
+        group_type = self.group_type_var.get()
+        
+        if not title:
+            messagebox.showerror("Error", "Group title is required!")
+            return
+            
+        self.result = {
+            "title": title,
+            "description": description,
+            "group_type": group_type,
+            "buttons": []
+        }
+        
+        self.dialog.destroy()
+        
+    def _cancel(self):
+        self.dialog.destroy()
+
+class SendScriptDialog:
+    """Paste or load many serial command lines and send them as one paced stream"""
+
+    def __init__(self, parent, settings, on_send):
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("Send Script")
+        self.dialog.geometry("600x450")
+        self.dialog.transient(parent)
+
+        # on_send(lines, line_delay, wait_for, window) queues the batch
+        self.on_send = on_send
+        self.settings = settings
+
+        self._create_widgets()
+
+    def _create_widgets(self):
+        main_frame = tk.Frame(self.dialog, padx=10, pady=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        top_frame = tk.Frame(main_frame)
+        top_frame.pack(fill=tk.X)
+        tk.Label(top_frame, text="One command per line:", font=("Helvetica", 10, "bold")).pack(side=tk.LEFT)
+        tk.Button(top_frame, text="Load File...", command=self._load_file).pack(side=tk.RIGHT)
+
+        self.text = scrolledtext.ScrolledText(main_frame, wrap=tk.NONE, height=15)
+        self.text.pack(fill=tk.BOTH, expand=True, pady=(5, 10))
+        self.text.bind('<<Modified>>', self._on_modified)
+
+        pacing_frame = tk.Frame(main_frame)
+        pacing_frame.pack(fill=tk.X)
+        tk.Label(pacing_frame, text="Delay between lines (ms):").pack(side=tk.LEFT)
+        self.delay_var = tk.StringVar(value=f"{float(self.settings.get('serial_line_delay', 0)) * 1000:g}")
+        tk.Entry(pacing_frame, textvariable=self.delay_var, width=6).pack(side=tk.LEFT, padx=(5, 15))
+        self.wait_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(pacing_frame, text="Wait for prompt, lines ahead:",
+                       variable=self.wait_var).pack(side=tk.LEFT)
+        self.window_var = tk.StringVar(value=str(self.settings.get('serial_batch_window', 1)))
+        tk.Spinbox(pacing_frame, from_=1, to=64, textvariable=self.window_var, width=4).pack(side=tk.LEFT, padx=5)
+
+        button_frame = tk.Frame(main_frame)
+        button_frame.pack(fill=tk.X, pady=(10, 0))
+        self.status = tk.Label(button_frame, text="0 lines", fg="gray", anchor=tk.W)
+        self.status.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        tk.Button(button_frame, text="Send", command=self._send,
+                 bg="green", fg="white", width=15).pack(side=tk.RIGHT, padx=(10, 0))
+        tk.Button(button_frame, text="Cancel", command=self.dialog.destroy,
+                 bg="red", fg="white", width=15).pack(side=tk.RIGHT)
+
+    def _lines(self):
+        return self.text.get("1.0", "end-1c").splitlines()
+
+    def _on_modified(self, event=None):
+        self.text.edit_modified(False)
+        self.status.config(text=f"{len(self._lines())} lines")
+
+    def _load_file(self):
+        path = filedialog.askopenfilename(parent=self.dialog, title="Load Script")
+        if not path:
+            return
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                content = f.read()
+        except OSError as e:
+            messagebox.showerror("Error", f"Cannot read {path}: {e}", parent=self.dialog)
+            return
+        self.text.delete("1.0", tk.END)
+        self.text.insert("1.0", content)
+
+    def _send(self):
+        lines = self._lines()
+        while lines and not lines[-1].strip():
+            lines.pop()
+        if not lines:
+            messagebox.showerror("Error", "Nothing to send!", parent=self.dialog)
+            return
+        try:
+            line_delay = float(self.delay_var.get() or 0) / 1000
+            window = int(self.window_var.get())
+            if line_delay < 0 or window < 1:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Error", "Delay must be a number of milliseconds and lines ahead at least 1",
+                                 parent=self.dialog)
+            return
+        self.on_send(lines, line_delay, True if self.wait_var.get() else None, window)
+        self.dialog.destroy()
+
+class JobsWindow:
+    """Live list of queued and running commands with cancel/kill controls"""
+
+    REFRESH_MS = 500
+
+    def __init__(self, parent, scheduler):
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("Command Jobs")
+        self.dialog.geometry("700x300")
+        self.dialog.transient(parent)
+
+        self.scheduler = scheduler
+        self.jobs = {}
+
+        self._create_widgets()
+        self._refresh()
+
+    def _create_widgets(self):
+        main_frame = tk.Frame(self.dialog, padx=10, pady=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        columns = ("id", "queue", "state", "elapsed", "command")
+        self.tree = ttk.Treeview(main_frame, columns=columns, show="headings", selectmode="extended")
+        for column, heading, width in zip(columns, ("ID", "Queue", "State", "Elapsed", "Command"),
+                                          (50, 140, 80, 70, 320)):
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width, stretch=(column == "command"))
+        self.tree.pack(fill=tk.BOTH, expand=True)
+
+        button_frame = tk.Frame(main_frame)
+        button_frame.pack(fill=tk.X, pady=(10, 0))
+
+        tk.Button(button_frame, text="Kill Selected", command=self._kill_selected,
+                 bg="red", fg="white", width=15).pack(side=tk.RIGHT, padx=(10, 0))
+        tk.Button(button_frame, text="Cancel Selected", command=self._cancel_selected,
+                 bg="#FF9800", fg="white", width=15).pack(side=tk.RIGHT)
+
+    def _refresh(self):
+        """Redraw the job list and schedule the next refresh"""
+        if not self.dialog.winfo_exists():
+            return
+        now = time.monotonic()
+        selected = set(self.tree.selection())
+        self.jobs = {str(job.id): job for job in self.scheduler.active_jobs()}
+        self.tree.delete(*self.tree.get_children())
+        for job_id, job in self.jobs.items():
+            started = job.started_at if job.state == RUNNING else job.submitted_at
+            self.tree.insert("", tk.END, iid=job_id, values=(
+                job.id, job.lane, job.state, f"{now - started:.1f}s", job.description))
+        self.tree.selection_set([job_id for job_id in selected if job_id in self.jobs])
+        self.dialog.after(self.REFRESH_MS, self._refresh)
+
+    def _selected_jobs(self):
+        return [self.jobs[job_id] for job_id in self.tree.selection() if job_id in self.jobs]
+
+    def _cancel_selected(self):
+        for job in self._selected_jobs():
+            if job.state == PENDING:
+                self.scheduler.cancel(job)
+
+    def _kill_selected(self):
+        for job in self._selected_jobs():
+            if job.state == RUNNING and not job.kill():
+                messagebox.showinfo("Info", f"Job {job.id} cannot be interrupted.", parent=self.dialog)
+
+class TerminalsWindow:
+    """Every terminal session with its live state; close, kill or reopen them"""
+
+    REFRESH_MS = 500
+
+    def __init__(self, parent, supervisor, on_reopen):
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("Terminal Sessions")
+        self.dialog.geometry("700x300")
+        self.dialog.transient(parent)
+
+        self.supervisor = supervisor
+        self.on_reopen = on_reopen
+        self.sessions = {}
+
+        self._create_widgets()
+        self._refresh()
+
+    def _create_widgets(self):
+        main_frame = tk.Frame(self.dialog, padx=10, pady=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        columns = ("target", "device", "pid", "state", "uptime", "exit")
+        self.tree = ttk.Treeview(main_frame, columns=columns, show="headings", selectmode="extended")
+        for column, heading, width in zip(columns, ("Target", "Device", "PID", "State", "Uptime", "Exit Code"),
+                                          (140, 180, 70, 80, 80, 70)):
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width, stretch=(column == "device"))
+        self.tree.tag_configure(terminals.RUNNING, foreground="green")
+        self.tree.tag_configure(terminals.CLOSING, foreground="#FF9800")
+        self.tree.tag_configure(terminals.KILLED, foreground="red")
+        self.tree.tag_configure(terminals.EXITED, foreground="gray")
+        self.tree.pack(fill=tk.BOTH, expand=True)
+
+        button_frame = tk.Frame(main_frame)
+        button_frame.pack(fill=tk.X, pady=(10, 0))
+
+        tk.Button(button_frame, text="Kill Selected", command=self._kill_selected,
+                 bg="red", fg="white", width=15).pack(side=tk.RIGHT, padx=(10, 0))
+        tk.Button(button_frame, text="Close Selected", command=self._close_selected,
+                 bg="#FF9800", fg="white", width=15).pack(side=tk.RIGHT, padx=(10, 0))
+        tk.Button(button_frame, text="Reopen Selected", command=self._reopen_selected,
+                 bg="#4CAF50", fg="white", width=15).pack(side=tk.RIGHT)
+
+    def _refresh(self):
+        """Redraw the session table and schedule the next refresh"""
+        if not self.dialog.winfo_exists():
+            return
+        selected = set(self.tree.selection())
+        self.sessions = {session.device: session for session in self.supervisor.sessions()}
+        self.tree.delete(*self.tree.get_children())
+        for device, session in self.sessions.items():
+            self.tree.insert("", tk.END, iid=device, tags=(session.state,), values=(
+                session.name, device, session.pid, session.state, f"{session.uptime:.0f}s",
+                "" if session.returncode is None else session.returncode))
+        self.tree.selection_set([device for device in selected if device in self.sessions])
+        self.dialog.after(self.REFRESH_MS, self._refresh)
+
+    def _selected(self):
+        return [self.sessions[device] for device in self.tree.selection() if device in self.sessions]
+
+    def _close_selected(self):
+        for session in self._selected():
+            self.supervisor.close(session.device)
+
+    def _kill_selected(self):
+        for session in self._selected():
+            self.supervisor.kill(session.device)
+
+    def _reopen_selected(self):
+        for session in self._selected():
+            if not session.alive:
+                self.on_reopen(session)
+
+class FanOutWindow:
+    """Per-device results of a command sent to several serial targets"""
+
+    REFRESH_MS = 500
+
+    def __init__(self, parent, fanout, device_names):
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title(f"Results - {fanout.description}")
+        self.dialog.geometry("700x350")
+
+        self.fanout = fanout
+        self.device_names = device_names
+
+        self._create_widgets()
+        self._refresh()
+
+    def _create_widgets(self):
+        main_frame = tk.Frame(self.dialog, padx=10, pady=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        self.summary = tk.Label(main_frame, text="", font=("Helvetica", 10, "bold"), anchor="w")
+        self.summary.pack(fill=tk.X, pady=(0, 5))
+
+        columns = ("target", "device", "state", "duration", "detail")
+        self.tree = ttk.Treeview(main_frame, columns=columns, show="headings")
+        for column, heading, width in zip(columns, ("Target", "Device", "State", "Duration", "Detail"),
+                                          (120, 130, 80, 70, 280)):
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width, stretch=(column == "detail"))
+        self.tree.tag_configure("failed", foreground="red")
+        self.tree.tag_configure("done", foreground="green")
+        self.tree.pack(fill=tk.BOTH, expand=True)
+
+    def _refresh(self):
+        """Redraw the result table until every device has finished"""
+        if not self.dialog.winfo_exists():
+            return
+        self.tree.delete(*self.tree.get_children())
+        for result in self.fanout.results:
+            duration = result.duration
+            self.tree.insert("", tk.END, tags=(result.state,), values=(
+                self.device_names.get(result.device, result.device), result.device, result.state,
+                "" if duration is None else f"{duration:.2f}s", result.detail))
+
+        counts = ", ".join(f"{count} {state}" for state, count in sorted(self.fanout.summary().items()))
+        self.summary.config(text=f"{len(self.fanout.results)} targets: {counts}")
+        if not self.fanout.complete:
+            self.dialog.after(self.REFRESH_MS, self._refresh)
+
+class MetricsWindow:
+    """Per-button timing percentiles and per-port traffic, with export to a file"""
+
+    REFRESH_MS = 1000
+
+    def __init__(self, parent, metrics):
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("Command Stats")
+        self.dialog.geometry("1140x450")
+
+        self.metrics = metrics
+
+        self._create_widgets()
+        self._refresh()
+
+    def _create_widgets(self):
+        main_frame = tk.Frame(self.dialog, padx=10, pady=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        columns = ("unit_type", "group", "button", "runs", "failed", "wait_p50", "p50", "p95", "p99", "max",
+                   "exit_codes")
+        headings = ("Unit Type", "Group", "Button", "Runs", "Failed", "Wait p50", "Run p50", "Run p95", "Run p99",
+                    "Run max", "Exit Codes")
+        widths = (120, 120, 160, 50, 50, 70, 70, 70, 70, 70, 120)
+        self.buttons_tree = ttk.Treeview(main_frame, columns=columns, show="headings", height=10)
+        for column, heading, width in zip(columns, headings, widths):
+            self.buttons_tree.heading(column, text=heading)
+            self.buttons_tree.column(column, width=width, stretch=(column == "button"))
+        self.buttons_tree.pack(fill=tk.BOTH, expand=True)
+
+        columns = ("device", "written", "read")
+        self.ports_tree = ttk.Treeview(main_frame, columns=columns, show="headings", height=4)
+        for column, heading, width in zip(columns, ("Serial Port", "Bytes Written", "Bytes Read"), (300, 120, 120)):
+            self.ports_tree.heading(column, text=heading)
+            self.ports_tree.column(column, width=width, stretch=(column == "device"))
+        self.ports_tree.pack(fill=tk.X, pady=(10, 0))
+
+        button_frame = tk.Frame(main_frame)
+        button_frame.pack(fill=tk.X, pady=(10, 0))
+        tk.Button(button_frame, text="Export...", command=self._export,
+                 bg="#607D8B", fg="white", width=15).pack(side=tk.RIGHT, padx=(10, 0))
+        tk.Button(button_frame, text="Reset", command=self._reset,
+                 bg="#FF9800", fg="white", width=15).pack(side=tk.RIGHT)
+
+    @staticmethod
+    def _seconds(value):
+        if value is None:
+            return ""
+        return f"{value * 1000:.0f}ms" if value < 1 else f"{value:.2f}s"
+
+    def _refresh(self):
+        """Redraw both tables and schedule the next refresh"""
+        if not self.dialog.winfo_exists():
+            return
+        snapshot = self.metrics.snapshot()
+        self.buttons_tree.delete(*self.buttons_tree.get_children())
+        for stats in snapshot['buttons']:
+            execution = stats['execution']
+            exit_codes = ", ".join(f"{code}×{count}" for code, count in sorted(stats['exit_codes'].items()))
+            self.buttons_tree.insert("", tk.END, values=(
+                stats['unit_type'], stats['group'], stats['button'], stats['runs'], stats['states'].get('failed', 0), self._seconds(stats['queue_wait']['p50']),
+                self._seconds(execution['p50']), self._seconds(execution['p95']), self._seconds(execution['p99']),
+                self._seconds(execution['max']), exit_codes))
+        self.ports_tree.delete(*self.ports_tree.get_children())
+        for device, counts in sorted(snapshot['ports'].items()):
+            self.ports_tree.insert("", tk.END, values=(device, counts['bytes_written'], counts['bytes_read']))
+        self.dialog.after(self.REFRESH_MS, self._refresh)
+
+    def _export(self):
+        from tkinter import filedialog
+        path = filedialog.asksaveasfilename(
+            parent=self.dialog, title="Export Stats", defaultextension=".prom",
+            filetypes=[("Prometheus text", "*.prom"), ("JSON", "*.json")])
+        if not path:
+            return
+        try:
+            self.metrics.export(path)
+        except OSError as e:
+            messagebox.showerror("Error", f"Failed to export stats: {e}", parent=self.dialog)
+
+    def _reset(self):
+        self.metrics.reset()
+
+class CaptureWindow:
+    """Search recorded sessions and replay a device's traffic around a hit"""
+
+    PAGE_SIZE = 200
+    # Seconds of context shown before the selected line when replaying
+    REPLAY_BEFORE = 30
+    RANGES = (("Last hour", 3600), ("Today", None), ("Last 7 days", 7 * 86400), ("All", 0))
+
+    def __init__(self, parent, capture):
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("Session Captures")
+        self.dialog.geometry("1000x550")
+
+        self.capture = capture
+        self._results = None
+        self._records = {}
+
+        self._create_widgets()
+
+    def _create_widgets(self):
+        main_frame = tk.Frame(self.dialog, padx=10, pady=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        search_frame = tk.Frame(main_frame)
+        search_frame.pack(fill=tk.X)
+        tk.Label(search_frame, text="Words:").pack(side=tk.LEFT)
+        self.query_var = tk.StringVar()
+        query_entry = tk.Entry(search_frame, textvariable=self.query_var, width=30)
+        query_entry.pack(side=tk.LEFT, padx=(5, 10))
+        query_entry.bind('<Return>', lambda e: self._search())
+        tk.Label(search_frame, text="Regex:").pack(side=tk.LEFT)
+        self.regex_var = tk.StringVar()
+        regex_entry = tk.Entry(search_frame, textvariable=self.regex_var, width=20)
+        regex_entry.pack(side=tk.LEFT, padx=(5, 10))
+        regex_entry.bind('<Return>', lambda e: self._search())
+
+        self.device_var = tk.StringVar(value="All devices")
+        ttk.Combobox(search_frame, textvariable=self.device_var, state="readonly", width=25,
+                     values=["All devices"] + self.capture.devices()).pack(side=tk.LEFT, padx=(0, 10))
+        self.range_var = tk.StringVar(value="Today")
+        ttk.Combobox(search_frame, textvariable=self.range_var, state="readonly", width=12,
+                     values=[name for name, _ in self.RANGES]).pack(side=tk.LEFT, padx=(0, 10))
+        tk.Button(search_frame, text="Search", command=self._search,
+                 bg="#4CAF50", fg="white", width=10).pack(side=tk.LEFT)
+
+        columns = ("time", "device", "stream", "text")
+        self.tree = ttk.Treeview(main_frame, columns=columns, show="headings")
+        for column, heading, width in zip(columns, ("Time", "Device", "Stream", "Text"), (170, 150, 60, 600)):
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width, stretch=(column == "text"))
+        self.tree.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
+        self.tree.bind('<Double-1>', lambda e: self._replay_selected())
+
+        button_frame = tk.Frame(main_frame)
+        button_frame.pack(fill=tk.X, pady=(10, 0))
+        self.status = tk.Label(button_frame, text="Double-click a line to replay the session around it",
+                               anchor=tk.W)
+        self.status.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.more_button = tk.Button(button_frame, text="More", command=self._load_page,
+                                     state=tk.DISABLED, width=15)
+        self.more_button.pack(side=tk.RIGHT)
+
+    def _since(self):
+        seconds = dict(self.RANGES)[self.range_var.get()]
+        if seconds is None:
+            return time.mktime(time.localtime()[:3] + (0, 0, 0, 0, 0, -1))
+        return time.time() - seconds if seconds else None
+
+    def _show(self, results, description):
+        """Replace the table with the first page of a lazy result iterator"""
+        self._results = results
+        self._records = {}
+        self._description = description
+        self.tree.delete(*self.tree.get_children())
+        self._load_page()
+
+    def _search(self):
+        import re
+        regex = self.regex_var.get().strip() or None
+        if regex:
+            try:
+                re.compile(regex)
+            except re.error as e:
+                messagebox.showerror("Error", f"Invalid regex: {e}", parent=self.dialog)
+                return
+        device = self.device_var.get()
+        devices = None if device == "All devices" else [device]
+        results = self.capture.search(self.query_var.get(), devices=devices, since=self._since(), regex=regex)
+        self._show(results, "matches")
+
+    def _replay_selected(self):
+        selection = self.tree.selection()
+        record = self._records.get(selection[0]) if selection else None
+        if record is None:
+            return
+        self._show(self.capture.replay(record.device, since=record.timestamp - self.REPLAY_BEFORE),
+                   f"lines of {record.device}")
+
+    def _load_page(self):
+        """Pull the next page from the result iterator; nothing past it is read from disk"""
+        if self._results is None:
+            return
+        count = 0
+        for record in self._results:
+            ts = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.timestamp))
+            item = self.tree.insert("", tk.END, values=(
+                f"{ts}.{int(record.timestamp * 1000) % 1000:03d}", record.device,
+                STREAM_NAMES.get(record.stream, '?'), record.text))
+            self._records[item] = record
+            count += 1
+            if count >= self.PAGE_SIZE:
+                break
+        exhausted = count < self.PAGE_SIZE
+        if exhausted:
+            self._results = None
+        total = len(self._records)
+        self.status.config(text=f"{total} {self._description}" + ("" if exhausted else " so far"))
+        self.more_button.config(state=tk.DISABLED if exhausted else tk.NORMAL)
+
+
+class CommandPalette:
+    """Type to find any button of any unit type; Enter runs the highlighted one"""
+
+    LIMIT = 50
+
+    def __init__(self, parent, engine, on_choose):
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("Command Palette")
+        self.dialog.transient(parent)
+
+        self.engine = engine
+        self.on_choose = on_choose
+        self._entries = []
+
+        self._create_widgets()
+
+        # Centered over the main window
+        self.dialog.update_idletasks()
+        x = parent.winfo_rootx() + (parent.winfo_width() - 600) // 2
+        y = parent.winfo_rooty() + 80
+        self.dialog.geometry(f"600x400+{max(x, 0)}+{max(y, 0)}")
+        self.query_entry.focus_set()
+        self._refresh()
+
+    def _create_widgets(self):
+        main_frame = tk.Frame(self.dialog, padx=10, pady=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        self.query_var = tk.StringVar()
+        self.query_entry = tk.Entry(main_frame, textvariable=self.query_var, font=("Helvetica", 12))
+        self.query_entry.pack(fill=tk.X)
+        self.query_var.trace_add('write', lambda *args: self._refresh())
+
+        self.listbox = tk.Listbox(main_frame, activestyle='none', font=("Helvetica", 10))
+        self.listbox.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
+        self.listbox.bind('<Double-1>', lambda e: self._choose())
+
+        self.status = tk.Label(main_frame, text="", anchor=tk.W, fg="gray")
+        self.status.pack(fill=tk.X, pady=(5, 0))
+
+        for widget in (self.query_entry, self.listbox):
+            widget.bind('<Return>', lambda e: self._choose())
+            widget.bind('<Down>', lambda e: self._move(1))
+            widget.bind('<Up>', lambda e: self._move(-1))
+        self.dialog.bind('<Escape>', lambda e: self.dialog.destroy())
+
+    def _refresh(self):
+        started = time.perf_counter()
+        self._entries = self.engine.search_commands(self.query_var.get(), self.LIMIT)
+        elapsed = (time.perf_counter() - started) * 1000
+        self.listbox.delete(0, tk.END)
+        for entry in self._entries:
+            self.listbox.insert(tk.END, f"{entry.text}    —  {entry.group} · {entry.unit}")
+        if self._entries:
+            self.listbox.selection_set(0)
+        if self.query_var.get().strip():
+            self.status.config(text=f"{len(self._entries)} matches in {elapsed:.2f} ms")
+        else:
+            self.status.config(text="Recently and often used" if self._entries else "Type to search every button")
+
+    def _move(self, step):
+        if not self._entries:
+            return "break"
+        selection = self.listbox.curselection()
+        index = min(max((selection[0] if selection else -1) + step, 0), len(self._entries) - 1)
+        self.listbox.selection_clear(0, tk.END)
+        self.listbox.selection_set(index)
+        self.listbox.see(index)
+        return "break"
+
+    def _choose(self):
+        selection = self.listbox.curselection()
+        if not selection:
+            return
+        entry = self._entries[selection[0]]
+        self.dialog.destroy()
+        self.on_choose(entry)
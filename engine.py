@@ -0,0 +1,966 @@
+#!/usr/bin/env python3
+"""Command, config and serial core shared by the GUI, the CLI and the daemon
+
+Nothing in here imports tkinter, so headless front ends can use it on a
+machine without a display.
+"""
+
+import copy
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+import capture
+from command_index import CommandIndex
+from config_model import ConfigSchemaError, check_setting, compile_config, compile_unit, json_path, remote_host_names
+from config_store import ConfigStore, apply_change
+from device_index import DeviceIndex
+from fanout import FanOut, job_succeeded, serial_targets
+from io_loop import IOLoop
+from local_command import LocalCommand, STDERR, STDOUT
+from metrics import Metrics, MetricsExporter
+from parsers import ParserError, ParseRun, SnapshotStore, find_parser
+from remote import RemoteError, SSHPool, aggregate_output, remote_hosts
+from result_cache import CACHED, JOINED, OutputRecorder, ResultCache
+from scheduler import DONE, CommandScheduler, QueueFull, finished_job
+from sequence import SequenceRunner
+from serial_session import SerialSessionManager, SerialTimeout
+from templates import TemplateError, TemplateRegistry
+from unit_catalog import UnitCatalog
+
+
+class ConfigError(Exception):
+    """Raised when the config file can't be loaded or is missing required settings"""
+
+
+class EngineError(Exception):
+    """Raised when a button or command can't be run headless"""
+
+
+def print_log(message, level="INFO"):
+    """Default log sink for headless use: timestamped lines on stdout/stderr"""
+    stream = sys.stderr if level in ("ERROR", "WARNING") else sys.stdout
+    print(f"[{time.strftime('%H:%M:%S')}] {level:<7} {message}", file=stream, flush=True)
+
+
+class Engine:
+    """Loads the config and runs buttons through the scheduler
+
+    Front ends pass on_log(message, level) to receive log messages (it is
+    called from worker threads and the I/O loop), on_queue_change() to hear
+    about queue depth changes and on_ports_changed(added, removed) to hear
+    about serial ports being plugged in or removed.
+    """
+
+    def __init__(self, config_path='config.json', on_log=None, on_queue_change=None, on_ports_changed=None):
+        self.config_path = config_path
+        self.on_log = on_log or print_log
+        self.on_ports_changed = on_ports_changed
+
+        # Edits are journaled and written back atomically in the background
+        self.config_store = ConfigStore(config_path, on_error=self._on_config_save_error)
+        try:
+            self.config = self.config_store.load()
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            raise ConfigError(f"Failed to load config file: {e}") from e
+
+        # Commands are parsed once and rendered when they run
+        self.templates = TemplateRegistry(self.config.get('settings') or {})
+
+        # Unit types kept in their own files: listed from a manifest now,
+        # read and compiled when first selected
+        self.catalog = None
+        includes = self.config.get('include_unit_types')
+        if isinstance(includes, str) or (isinstance(includes, list) and all(isinstance(p, str) for p in includes)):
+            self.catalog = UnitCatalog(
+                includes, os.path.dirname(os.path.abspath(config_path)), manifest_path=f"{config_path}.manifest",
+                on_error=lambda e: self.log(f"Unit file problem: {e}", "WARNING"))
+
+        # Typed model of units, groups and buttons; a bad config stops here
+        self.model = self.validate_config()
+
+        # Every button of every unit type for the command palette, indexed on
+        # first search; use counts are kept across runs
+        self.commands = CommandIndex(f"{config_path}.history")
+        self._commands_indexed = False
+        self._commands_lock = threading.Lock()
+
+        settings = self.config['settings']
+
+        # Serial reads, response waits and local commands share one asyncio loop
+        # instead of a thread each (started on first use)
+        self.io_loop = IOLoop() if settings.get('async_io', True) else None
+
+        # Compressed per-device, per-day recording of everything sent and received
+        self.capture = None
+        if settings.get('capture', True):
+            capture_dir = settings.get('capture_dir') or os.path.join(
+                os.path.dirname(os.path.abspath(config_path)), 'captures')
+            try:
+                self.capture = capture.CaptureStore(
+                    capture_dir, on_error=lambda e: self.log(f"Session capture stopped, cannot write: {e}", "ERROR"))
+            except OSError as e:
+                self.log(f"Session capture disabled, cannot write {capture_dir}: {e}", "WARNING")
+
+        # One long-lived serial session per device, shared by all serial buttons;
+        # each session's reader copies what the device prints into the log
+        self.read_output = settings.get('serial_read_output', True)
+        self.serial_sessions = SerialSessionManager(
+            settings,
+            on_line=self._on_serial_line if self.read_output or self.capture else None,
+            on_write=self._on_serial_write if self.capture else None,
+            io_loop=self.io_loop)
+
+        # Registered serial targets
+        self.serial_targets = serial_targets(settings)
+
+        # Serial ports on this machine, checked in parallel and followed on hotplug;
+        # ports with an open session or terminal are never opened. Writing a
+        # probe to see what answers is opt-in, since it lands on the device
+        self._busy_sources = [self.serial_sessions.devices]
+        self.device_index = DeviceIndex(
+            baudrate=settings.get('serial_baudrate', 115200),
+            probe=settings.get('serial_probe', False),
+            probe_timeout=float(settings.get('serial_probe_timeout', 0.3)),
+            busy=self._busy_devices,
+            on_change=self._on_ports_changed,
+        )
+
+        # Queue wait, run time and outcome per button, plus bytes per serial port
+        self.metrics = Metrics(window=int(settings.get('metrics_window', 1000)),
+                               traffic=self.serial_sessions.traffic)
+        self.metrics_exporter = None
+        if settings.get('metrics_file'):
+            self.metrics_exporter = MetricsExporter(
+                self.metrics, settings['metrics_file'], interval=float(settings.get('metrics_interval', 15)),
+                on_error=lambda e: self.log(f"Cannot write metrics file: {e}", "WARNING"))
+
+        # Hosts that remote groups run their commands on, each reached through
+        # one persistent SSH connection that its commands share
+        self.remote_hosts = remote_hosts(settings)
+        self.ssh_pool = SSHPool(
+            ssh_command=settings.get('ssh_command', 'ssh'),
+            options=settings.get('ssh_options', []),
+            control_dir=settings.get('ssh_control_dir'),
+            persist=float(settings.get('ssh_control_persist', 600)),
+            connect_timeout=float(settings.get('ssh_connect_timeout', 10)),
+            multiplex=settings.get('ssh_multiplex', os.name == 'posix'),
+        )
+
+        # Output of cacheable local command buttons, reused until their ttl runs out
+        self.result_cache = ResultCache(int(settings.get('local_cache_max_bytes', 4 * 1024 * 1024)))
+        # Parsed output of the last run of each parsed button per target, to diff the next run against
+        self.snapshots = SnapshotStore(tolerance=float(settings.get('parse_tolerance', 0.05)))
+
+        # Ordered per-port serial queues plus a bounded pool for local commands
+        self.scheduler = CommandScheduler(
+            max_local_workers=int(settings.get('max_local_workers', 4)),
+            max_queue_size=int(settings.get('max_queue_size', 100)),
+            on_change=on_queue_change,
+            io_loop=self.io_loop,
+        )
+
+    @property
+    def settings(self):
+        return self.config['settings']
+
+    def log(self, message, level="INFO"):
+        self.on_log(message, level.upper())
+
+    @property
+    def _handlers(self):
+        return {
+            'send_to_serial': self._dispatch_serial,
+            'run_local_command': lambda button, device: self.dispatch_local_command(button),
+            'sequence': self.queue_sequence,
+            'remote_command': self.dispatch_remote_command,
+        }
+
+    def validate_config(self, config=None):
+        """Check the whole config and compile its model; raises ConfigError listing every problem
+
+        Unit types in include_unit_types files are checked when first used.
+        """
+        try:
+            return compile_config(self.config if config is None else config, self._handlers,
+                                  self.templates.compile, self.catalog)
+        except ConfigSchemaError as e:
+            raise ConfigError(f"Invalid config:\n{e}") from e
+
+    def _is_file_unit(self, name):
+        return (self.catalog is not None and name not in (self.config.get('unit_types') or {})
+                and name in self.model.unit_names())
+
+    def save_change(self, op, path, value):
+        """Apply one edit to the config and journal it; the file is rewritten shortly after
+
+        Edits are checked first, so one that would break the config raises
+        ConfigError and changes nothing.
+        """
+        model = None
+        if len(path) > 1 and path[0] == 'unit_types' and self._is_file_unit(path[1]):
+            self._save_unit_change(op, path, value)
+            return
+        if path and path[0] == 'unit_types':
+            candidate = copy.deepcopy(self.config)
+            apply_change(candidate, {'op': op, 'path': list(path), 'value': value})
+            model = self.validate_config(candidate)
+        elif len(path) == 2 and path[0] == 'settings':
+            problem = check_setting(path[1], value)
+            if problem:
+                raise ConfigError(f"{json_path(path)}: {problem}")
+        if op == 'append':
+            self.config_store.append(path, value)
+        else:
+            self.config_store.set(path, value)
+        if model is not None:
+            self.model = model
+            if len(path) > 1:
+                self._reindex_unit(path[1])
+
+    def _save_unit_change(self, op, path, value):
+        """save_change() for a unit type with its own file: only that file is checked and rewritten"""
+        name, unit_path = path[1], list(path[2:])
+        if not unit_path:
+            raise ConfigError(f"{json_path(path)}: unit type {name!r} lives in its own file; edit that instead")
+        store = self.catalog.store(name)
+        candidate = copy.deepcopy(store.config)
+        apply_change(candidate, {'op': op, 'path': unit_path, 'value': value})
+        try:
+            unit = compile_unit(name, candidate, self._handlers, self.templates.compile,
+                                os.path.relpath(store.path, os.path.dirname(os.path.abspath(self.config_path))),
+                                remote_host_names(self.settings), self.settings)
+        except ConfigSchemaError as e:
+            raise ConfigError(f"Invalid config:\n{e}") from e
+        if op == 'append':
+            store.append(unit_path, value)
+        else:
+            store.set(unit_path, value)
+        self.model.units[name] = unit
+        self._reindex_unit(name)
+
+    def update_setting(self, key, value):
+        """Change and save a setting; only commands that use it are rendered again"""
+        self.save_change('set', ['settings', key], value)
+        self.templates.invalidate(key)
+        if key in ('serial_device', 'serial_devices'):
+            self.serial_targets = serial_targets(self.settings)
+
+    def _on_config_save_error(self, error):
+        # Called from the background save thread; the journal still has the edits
+        self.log(f"Failed to save config file (changes kept in journal): {error}", "ERROR")
+
+    def detect_serial_ports(self):
+        """Paths of the serial ports present, from the device index (scanned on first use)"""
+        return [info.path for info in self.device_index.ports()]
+
+    def release_port(self, device):
+        """Close a device's serial session and keep it closed so another program (a terminal) can use the port
+
+        Serial commands for the device fail until reclaim_port().
+        """
+        self.serial_sessions.suspend(device, "is in use by a terminal window")
+
+    def reclaim_port(self, device):
+        """Reopen a released device's session on its next use, and resume reading it"""
+        self.serial_sessions.resume(device)
+
+    def add_busy_source(self, devices):
+        """Also keep the device index off the ports that devices() returns"""
+        self._busy_sources.append(devices)
+
+    def _busy_devices(self):
+        busy = set()
+        for devices in self._busy_sources:
+            busy.update(devices())
+        return busy
+
+    def start_device_index(self):
+        """Scan serial ports in the background and keep the index current on hotplug"""
+        self.device_index.watch()
+
+    def _on_ports_changed(self, added, removed):
+        for info in added:
+            state = {True: "responding", False: "silent", None: "in use"}[info.responsive]
+            self.log(f"Serial port connected: {info.path} ({state})")
+        for info in removed:
+            self.log(f"Serial port disconnected: {info.path}", "WARNING")
+        if self.on_ports_changed:
+            self.on_ports_changed(added, removed)
+
+    def detect_serial_ports_async(self, callback):
+        """Detect ports on a background thread and pass the list to callback from that thread"""
+        def probe():
+            try:
+                ports = self.detect_serial_ports()
+            except Exception as e:
+                self.log(f"Serial port detection failed: {e}", "WARNING")
+                ports = []
+            callback(ports)
+        threading.Thread(target=probe, name="port-probe", daemon=True).start()
+
+    def unit_types(self):
+        return self.model.unit_names()
+
+    def unit_description(self, unit_type):
+        """Description of a unit type; file unit types are not read for it"""
+        return self.model.description(unit_type)
+
+    def unit(self, unit_type):
+        """The UnitType model of a unit type, compiled on first use if it has its own file"""
+        try:
+            unit = self.model.unit(unit_type)
+        except ConfigSchemaError as e:
+            raise ConfigError(f"Invalid unit type {unit_type}:\n{e}") from e
+        if unit is None:
+            raise EngineError(f"Unknown unit type: {unit_type}")
+        return unit
+
+    def list_buttons(self, unit_type=None):
+        """Button texts by unit type and group, as {unit: [{'group': title, 'buttons': [text, ...]}]}"""
+        return {name: [{'group': group.title, 'buttons': [button.text for button in group.buttons]}
+                       for group in self.unit(name).groups]
+                for name in self.model.unit_names() if not unit_type or name == unit_type}
+
+    def find_button(self, unit_type, text):
+        """Look up a Button by its text (case-insensitive) within a unit type"""
+        button = self.unit(unit_type).find(text)
+        if button is None:
+            raise EngineError(f"No button '{text}' in unit type '{unit_type}'")
+        return button
+
+    def _unit_rows(self, unit_type):
+        """(group, text, command, action) per button, without compiling a file unit type"""
+        if self.model.is_loaded(unit_type) or self.catalog is None:
+            return [(group.title, button.text, button.command, button.action)
+                    for group in self.unit(unit_type).groups for button in group.buttons]
+        rows = []
+        data = self.catalog.read(unit_type)
+        for group in data.get('button_groups') or []:
+            if not isinstance(group, dict):
+                continue
+            for button in group.get('buttons') or []:
+                if isinstance(button, dict) and isinstance(button.get('text'), str):
+                    rows.append((str(group.get('title', '')), button['text'], button.get('command'),
+                                 button.get('action')))
+        return rows
+
+    def index_commands(self):
+        """Fill the command palette's index; later edits update it one unit type at a time"""
+        with self._commands_lock:
+            if self._commands_indexed:
+                return
+            for name in self.unit_types():
+                try:
+                    self.commands.set_unit(name, self._unit_rows(name))
+                except (ConfigError, ValueError) as e:
+                    self.log(f"Unit type {name} left out of the command palette: {e}", "WARNING")
+            self.commands.prepare()
+            self._commands_indexed = True
+
+    def index_commands_async(self):
+        """index_commands() on a background thread"""
+        threading.Thread(target=self.index_commands, name="command-index", daemon=True).start()
+
+    def _reindex_unit(self, unit_type):
+        with self._commands_lock:
+            if self._commands_indexed:
+                self.commands.set_unit(unit_type, self._unit_rows(unit_type))
+
+    def search_commands(self, query, limit=50):
+        """PaletteEntries matching a fuzzy query, best and most used first"""
+        self.index_commands()
+        return self.commands.search(query, limit)
+
+    def format_command(self, command_template, device=None):
+        """Render a command for a device; raises TemplateError for unknown settings"""
+        overrides = None
+        settings = self.settings
+        if device and device != settings['serial_device']:
+            # {serial_device} refers to the target the command runs on, and
+            # device_settings can override any other setting for that target
+            overrides = dict(settings.get('device_settings', {}).get(device, {}), serial_device=device)
+        elif device:
+            overrides = settings.get('device_settings', {}).get(device)
+        return self.templates.render(command_template, overrides)
+
+    def dispatch_button(self, button, devices=None, hosts=None):
+        """Queue a Button's work and return a FanOut tracking one job per target
+
+        Serial buttons and sequences run once per device in devices (the
+        configured serial_device by default); commands of a remote group run
+        once per host in hosts (the group's hosts by default); other local
+        commands run once.
+        """
+        if button.handler is None:
+            raise EngineError(f"'{button.text}' ({button.action}) needs the GUI")
+        if button.remote:
+            targets = self._remote_targets(button, hosts)
+        elif button.per_device:
+            targets = devices or [self.settings['serial_device']]
+        else:
+            targets = ['local']
+        if button.unit:
+            self.commands.record_use(button.unit, button.text)
+
+        on_complete = None
+        if len(targets) > 1:
+            on_complete = self._on_remote_fan_out_complete if button.remote else self._on_fan_out_complete
+        fanout = FanOut(button.text, on_complete=on_complete)
+        for target in targets:
+            job = button.handler(button, target)
+            if job is not None:
+                self.metrics.track(job, button.text, button.unit, button.group)
+                fanout.add(target, job)
+        fanout.seal()
+        return fanout
+
+    def _dispatch_serial(self, button, device):
+        try:
+            command = self.format_command(button.command, device)
+        except TemplateError as e:
+            self.log(str(e), "ERROR")
+            return None
+        if '\n' in command.strip():
+            # A pasted script: paced line by line instead of written in one go
+            return self.queue_serial_batch(command.strip().splitlines(), device, line_delay=button.line_delay,
+                                           wait_for=button.wait_for, window=button.window, timeout=button.timeout,
+                                           description=button.text)
+        return self.queue_serial_command(command, device, wait_for=button.wait_for, timeout=button.timeout,
+                                         parse=self._parse_run(button, command, device))
+
+    def dispatch_local_command(self, button):
+        """Run a local command button"""
+        try:
+            command = self.format_command(button.command)
+        except TemplateError as e:
+            self.log(str(e), "ERROR")
+            return None
+        ttl = None
+        if button.cacheable:
+            ttl = button.ttl or float(self.settings.get('local_cache_ttl', 30))
+        return self.queue_local_command(command, button.timeout, cache_ttl=ttl,
+                                        parse=self._parse_run(button, command, capture.LOCAL_DEVICE))
+
+    def _remote_targets(self, button, hosts=None):
+        targets = hosts or list(button.hosts) or list(self.remote_hosts)
+        if not targets:
+            raise EngineError(f"'{button.text}' runs on remote hosts, but settings.remote_hosts is empty")
+        unknown = [name for name in targets if name not in self.remote_hosts]
+        if unknown:
+            raise EngineError(f"Unknown remote host(s): {', '.join(unknown)}")
+        return targets
+
+    def dispatch_remote_command(self, button, host):
+        """Run a command of a remote group on one host"""
+        try:
+            command = self.format_command(button.command)
+        except TemplateError as e:
+            self.log(str(e), "ERROR")
+            return None
+        return self.queue_remote_command(command, host, button.timeout,
+                                         parse=self._parse_run(button, command, f"ssh:{host}"))
+
+    def _parse_run(self, button, command, target):
+        """A ParseRun for a rendered command of a button with a parser, or None"""
+        if not button.parser:
+            return None
+        try:
+            parser = find_parser(button.parser, command)()
+        except ParserError as e:
+            self.log(str(e), "WARNING")
+            return None
+        return ParseRun(parser, command, target)
+
+    def _quiet(self, parse):
+        """Whether a parsed run's output stays out of the log, which shows what changed instead"""
+        return (parse is not None and not self.settings.get('log_parsed_output', False)
+                and self.snapshots.has(parse.command, parse.target))
+
+    def _finish_parse(self, parse):
+        """Diff a parsed run against the last one on its target and log the changes"""
+        parser = parse.parser
+        records = parser.close()
+        target = parse.target[len('ssh:'):] if parse.target.startswith('ssh:') else parse.target
+        where = '' if target == capture.LOCAL_DEVICE else f" on {target}"
+        if not records and parser.lines:
+            self.log(f"Could not read the output of '{parse.command}'{where} as {parser.name} output", "WARNING")
+            return
+        changes = parse.changes = self.snapshots.update(parse)
+        if changes is None:
+            parse.summary = parser.count(len(records))
+            self.log(f"Parsed {parse.summary} from '{parse.command}'{where}; "
+                     f"later runs show only what changed")
+            return
+        if not changes:
+            parse.summary = "no changes"
+            self.log(f"'{parse.command}'{where}: no changes")
+            return
+        parse.summary = f"{len(changes)} change{'s' if len(changes) > 1 else ''}"
+        self.log(f"'{parse.command}'{where}: {parse.summary} since the last run", "WARNING")
+        for change in changes:
+            self.log(f"  {change}")
+            if self.capture:
+                # A few bytes per change instead of the whole output again
+                self.capture.record(parse.target, capture.EVENT, f"{parse.command}: {change}")
+
+    def _on_fan_out_complete(self, fanout):
+        # Called from a worker thread when the last device finishes
+        counts = fanout.summary()
+        failed = len(fanout.results) - counts.get('done', 0)
+        elapsed = time.monotonic() - fanout.started_at
+        self.log(f"'{fanout.description}' finished on {len(fanout.results)} targets in {elapsed:.2f}s"
+                 f" ({failed} not successful)", "WARNING" if failed else "SUCCESS")
+
+    def _on_remote_fan_out_complete(self, fanout):
+        """Log which hosts printed the same output, so the odd ones out stand out"""
+        self._on_fan_out_complete(fanout)
+        outputs = [(result.device, result.job.result.output()) for result in fanout.results
+                   if isinstance(result.job.result, LocalCommand)]
+        groups = aggregate_output(outputs)
+        if len(groups) < 2:
+            return
+        self.log(f"'{fanout.description}' printed {len(groups)} different outputs:", "WARNING")
+        for output, hosts in groups:
+            first = output.strip().split('\n', 1)[0] or "(no output)"
+            self.log(f"  {len(hosts)} host(s) [{', '.join(hosts)}]: {first[:100]}")
+
+    def queue_serial_command(self, text_command, device=None, wait_for=None, timeout=None, parse=None):
+        """Queue a serial command behind earlier commands for the same port
+
+        With parse (a ParseRun) and wait_for, the response is parsed and
+        compared with the command's last response from the device.
+        """
+        device = device or self.settings['serial_device']
+        send = self._send_to_serial_async if self.io_loop else self._send_to_serial
+        try:
+            job = self.scheduler.submit_serial(device, send, text_command, device,
+                                               wait_for, timeout, parse, description=text_command)
+        except QueueFull as e:
+            self.log(f"Command not queued: {e}", "WARNING")
+            return None
+        job.parsed = parse
+        return job
+
+    def queue_serial_batch(self, lines, device=None, line_delay=None, wait_for=None, window=None, timeout=None,
+                           description=None):
+        """Queue many lines for a port as one job that sends them as a paced stream
+
+        line_delay and window default to settings.serial_line_delay and
+        serial_batch_window; with wait_for each line must be answered (see
+        SerialSession.send_lines). Killing the job stops it after the
+        current write.
+        """
+        settings = self.settings
+        device = device or settings['serial_device']
+        lines = list(lines)
+        if line_delay is None:
+            line_delay = float(settings.get('serial_line_delay', 0))
+        if window is None:
+            window = int(settings.get('serial_batch_window', 1))
+        stop = threading.Event()
+        send = self._send_serial_batch_async if self.io_loop else self._send_serial_batch
+        try:
+            job = self.scheduler.submit_serial(
+                device, send, lines, device, line_delay, wait_for, window, timeout, stop,
+                description=description or f"Batch: {len(lines)} lines")
+        except QueueFull as e:
+            self.log(f"Batch not queued: {e}", "WARNING")
+            return None
+        job.kill_handler = stop.set
+        return job
+
+    def queue_local_command(self, command, timeout=None, cache_ttl=None, parse=None):
+        """Queue a local command on the bounded worker pool
+
+        With cache_ttl, output of a clean run is reused for that many
+        seconds: a repeat returns an already finished job whose result is
+        the CachedResult, and a repeat while the command still runs joins
+        that job instead of starting another.
+
+        With parse (a ParseRun), stdout is parsed as it streams in and a
+        clean run is compared with the command's last run; once there is
+        a last run, only stderr and the changes are logged.
+        """
+        if not cache_ttl:
+            return self._queue_local_command(command, timeout, parse=parse)
+
+        recorder = OutputRecorder(self.result_cache.max_bytes)
+        how, found = self.result_cache.lookup(
+            command, lambda: self._queue_local_command(command, timeout, recorder, parse))
+        if how == CACHED:
+            self._log_cached_result(found)
+            job = finished_job(self.scheduler.LOCAL_LANE, command, found)
+            if parse is not None:
+                parse.parser.feed_lines([line for stream, line in found.lines if stream == STDOUT])
+                self._finish_parse(parse)
+                job.parsed = parse
+            return job
+        if how == JOINED:
+            self.log(f"⧉ Already running, sharing its output: {command}")
+            return found
+        if found is not None:
+            found.add_done_callback(lambda job: self._cache_local_result(command, job, recorder, cache_ttl))
+        return found
+
+    def _queue_local_command(self, command, timeout=None, recorder=None, parse=None):
+        settings = self.settings
+        if timeout is None:
+            timeout = settings.get('local_command_timeout')
+        on_output = self._output_handler(parse, recorder=recorder)
+        process = LocalCommand(
+            command,
+            on_output=on_output,
+            timeout=float(timeout) if timeout else None,
+            max_output_bytes=int(settings.get('max_output_bytes', 1024 * 1024)),
+        )
+        execute = self._execute_local_command_async if self.io_loop else self._execute_local_command
+        try:
+            job = self.scheduler.submit_local(execute, process, parse, description=command)
+        except QueueFull as e:
+            self.log(f"Command not queued: {e}", "WARNING")
+            return None
+        job.kill_handler = process.kill
+        job.parsed = parse
+        return job
+
+    def _output_handler(self, parse, host=None, recorder=None):
+        """on_output for a LocalCommand: feeds the recorder and parser, then logs the batch"""
+        if parse is None and recorder is None:
+            return lambda batch: self._log_output_batch(batch, host)
+        quiet = self._quiet(parse)
+
+        def on_output(batch):
+            if recorder is not None:
+                recorder.add(batch)
+            if parse is not None:
+                parse.parser.feed_lines([line for stream, line in batch if stream == STDOUT])
+            self._log_output_batch(batch, host, quiet=quiet)
+        return on_output
+
+    def queue_remote_command(self, command, host, timeout=None, parse=None):
+        """Queue a command for a remote host; each host runs up to its max_sessions commands at once"""
+        settings = self.settings
+        host = self.remote_hosts[host]
+        if timeout is None:
+            timeout = settings.get('local_command_timeout')
+        process = LocalCommand(
+            self.ssh_pool.command_line(host, command),
+            on_output=self._output_handler(parse, host.name),
+            timeout=float(timeout) if timeout else None,
+            max_output_bytes=int(settings.get('max_output_bytes', 1024 * 1024)),
+        )
+        execute = self._execute_remote_command_async if self.io_loop else self._execute_remote_command
+        try:
+            job = self.scheduler.submit_remote(
+                host.name, execute, host, command, process, parse,
+                workers=int(host.max_sessions or settings.get('ssh_max_sessions', 4)),
+                description=f"[{host.name}] {command}")
+        except QueueFull as e:
+            self.log(f"Command not queued: {e}", "WARNING")
+            return None
+        job.kill_handler = process.kill
+        job.parsed = parse
+        return job
+
+    def _cache_local_result(self, command, job, recorder, ttl):
+        # Called from the worker (or loop) thread once the run finished. The
+        # result is stored before the run stops counting as in flight, so a
+        # click in between joins the finished job instead of running it again
+        process = job.result
+        try:
+            if (job.state == DONE and isinstance(process, LocalCommand) and process.returncode == 0
+                    and not (process.timed_out or process.killed or process.truncated or recorder.overflow)):
+                self.result_cache.put(command, recorder.lines, process.returncode, ttl)
+        finally:
+            self.result_cache.finish(command, job)
+
+    def _log_cached_result(self, result):
+        """Replay cached output into the log under a header saying it is not a fresh run"""
+        self.log(f"⟲ Cached output ({result.age:.0f}s old, kept {result.ttl:g}s), not run again: {result.command}")
+        if self.capture:
+            self.capture.record(capture.LOCAL_DEVICE, capture.EVENT, f"cached: {result.command}")
+        for stream, lines in itertools.groupby(result.lines, key=lambda item: item[0]):
+            self.log(''.join(line for _, line in lines).rstrip('\n'), "WARNING" if stream == STDERR else "INFO")
+
+    def queue_sequence(self, button, device=None):
+        """Queue a sequence Button as one job on the serial port's queue"""
+        settings = self.settings
+        device = device or settings['serial_device']
+        sequence = button.sequence
+        try:
+            # Render every step up front so an unknown setting fails before anything is sent
+            for step in sequence.steps:
+                if 'command' in step:
+                    self.format_command(step['command'], device)
+        except TemplateError as e:
+            self.log(str(e), "ERROR")
+            return None
+
+        runner = SequenceRunner(
+            sequence,
+            self.serial_sessions.get(device),
+            lambda template: self.format_command(template, device),
+            self.log,
+            on_output=self._log_output_batch,
+            serial_timeout=float(settings.get('serial_response_timeout', 10)),
+            local_timeout=settings.get('local_command_timeout'),
+        )
+        try:
+            # Queued on the port's lane so no other command writes mid-sequence
+            job = self.scheduler.submit_serial(device, runner.run, description=f"Sequence: {sequence.name}")
+        except QueueFull as e:
+            self.log(f"Sequence not queued: {e}", "WARNING")
+            return None
+        job.kill_handler = runner.abort
+        return job
+
+    def cancel_pending(self):
+        """Drop every queued command that hasn't started yet"""
+        return self.scheduler.cancel_pending()
+
+    def wait(self, fanout, timeout=None):
+        """Block until every job of a fan-out has finished; returns True if all succeeded"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for result in fanout.results:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not result.job.wait(remaining):
+                return False
+        return all(job_succeeded(result.job) for result in fanout.results)
+
+    def _response_timeout(self, timeout):
+        if timeout is None:
+            timeout = self.settings.get('serial_response_timeout', 10)
+        return float(timeout)
+
+    def _log_serial_error(self, text_command, error):
+        if isinstance(error, SerialTimeout):
+            self.log(f"No response to '{text_command}': {error}", "ERROR")
+        else:
+            self.log(f"Error sending to serial: {error}", "ERROR")
+
+    def _send_to_serial(self, text_command, device=None, wait_for=None, timeout=None, parse=None):
+        session = self.serial_sessions.get(device)
+
+        try:
+            # The session keeps the port open and reconnects if it was unplugged
+            if not wait_for:
+                session.write_line(text_command)
+                self.log(f"Sent: {text_command}", "SUCCESS")
+                return None
+
+            # wait_for is either a regex or true for the configured prompt
+            started = time.monotonic()
+            lines = session.send_and_wait(text_command, pattern=None if wait_for is True else wait_for,
+                                          timeout=self._response_timeout(timeout))
+            self.log(f"Sent: {text_command} (response in {time.monotonic() - started:.2f}s)", "SUCCESS")
+        except Exception as e:
+            self._log_serial_error(text_command, e)
+            raise
+        if parse is not None:
+            parse.parser.feed_lines(lines)
+            self._finish_parse(parse)
+        return lines
+
+    async def _send_to_serial_async(self, text_command, device=None, wait_for=None, timeout=None, parse=None):
+        """_send_to_serial() as a task on the IOLoop"""
+        session = self.serial_sessions.get(device)
+
+        try:
+            if not wait_for:
+                await session.write_line_async(text_command)
+                self.log(f"Sent: {text_command}", "SUCCESS")
+                return None
+
+            started = time.monotonic()
+            lines = await session.send_and_wait_async(
+                text_command, pattern=None if wait_for is True else wait_for, timeout=self._response_timeout(timeout))
+            self.log(f"Sent: {text_command} (response in {time.monotonic() - started:.2f}s)", "SUCCESS")
+        except Exception as e:
+            self._log_serial_error(text_command, e)
+            raise
+        if parse is not None:
+            parse.parser.feed_lines(lines)
+            self._finish_parse(parse)
+        return lines
+
+    def _send_serial_batch(self, lines, device, line_delay, wait_for, window, timeout, stop):
+        session = self.serial_sessions.get(device)
+        pacing = f"{line_delay * 1000:g}ms apart" if line_delay else "pipelined"
+        if wait_for:
+            pacing += f", up to {window} awaiting an answer"
+        self.log(f"Sending {len(lines)} lines to {device} ({pacing})")
+        started = time.monotonic()
+        # A progress line about every tenth of the batch, for long scripts
+        step = max(len(lines) // 10, 200)
+        progress = {'logged': 0}
+
+        def on_progress(sent, total):
+            if sent - progress['logged'] >= step and sent < total:
+                progress['logged'] = sent
+                self.log(f"  {sent}/{total} lines sent to {device}")
+        try:
+            sent = session.send_lines(lines, line_delay=line_delay, wait_for=wait_for, window=window,
+                                      timeout=self._response_timeout(timeout), on_progress=on_progress, stop=stop)
+        except Exception as e:
+            self._log_serial_error(f"{len(lines)} lines", e)
+            raise
+        elapsed = time.monotonic() - started
+        if sent < len(lines):
+            self.log(f"Batch to {device} stopped after {sent} of {len(lines)} lines", "WARNING")
+            return False
+        self.log(f"Sent {sent} lines to {device} in {elapsed:.2f}s ({sent / elapsed if elapsed else sent:.0f} lines/s)",
+                 "SUCCESS")
+        return sent
+
+    async def _send_serial_batch_async(self, *args):
+        """_send_serial_batch() for the IOLoop; the paced writes run on an executor thread"""
+        import asyncio
+
+        return await asyncio.get_running_loop().run_in_executor(None, self._send_serial_batch, *args)
+
+    def _on_serial_line(self, device, line, is_prompt):
+        """Log and capture a line read from a serial device (called from its reader)"""
+        if self.capture:
+            self.capture.record(device, capture.RX, line)
+        if self.read_output and line.strip():
+            self.log(f"[{os.path.basename(device)}] {line}")
+
+    def _on_serial_write(self, device, data):
+        self.capture.record(device, capture.TX, data.decode('utf-8', errors='replace').rstrip('\r\n'))
+
+    def _execute_local_command(self, process, parse=None):
+        self._local_command_started(process)
+        try:
+            # Output is streamed to the log in batches while the command runs
+            returncode = process.run()
+        except OSError as e:
+            self.log(f"Error executing command: {e}", "ERROR")
+            # The job ends FAILED; the command never ran, so it has no exit code
+            raise
+        return self._local_command_finished(process, returncode, parse)
+
+    async def _execute_local_command_async(self, process, parse=None):
+        """_execute_local_command() as a task on the IOLoop"""
+        self._local_command_started(process)
+        try:
+            returncode = await process.run_async()
+        except OSError as e:
+            self.log(f"Error executing command: {e}", "ERROR")
+            # The job ends FAILED; the command never ran, so it has no exit code
+            raise
+        return self._local_command_finished(process, returncode, parse)
+
+    def _execute_remote_command(self, host, command, process, parse=None):
+        self._remote_command_started(host, command)
+        try:
+            # Starts the host's shared connection, or waits for another job starting it
+            self.ssh_pool.connect(host)
+            returncode = process.run()
+        except (OSError, RemoteError) as e:
+            self.log(f"Error executing command on {host.name}: {e}", "ERROR")
+            raise
+        return self._remote_command_finished(host, command, process, returncode, parse)
+
+    async def _execute_remote_command_async(self, host, command, process, parse=None):
+        """_execute_remote_command() as a task on the IOLoop; only the connect runs on a thread"""
+        import asyncio
+
+        self._remote_command_started(host, command)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.ssh_pool.connect, host)
+            returncode = await process.run_async()
+        except (OSError, RemoteError) as e:
+            self.log(f"Error executing command on {host.name}: {e}", "ERROR")
+            raise
+        return self._remote_command_finished(host, command, process, returncode, parse)
+
+    def _remote_command_started(self, host, command):
+        self.log(f"▶ Executing on {host.name}: {command}")
+        if self.capture:
+            self.capture.record(f"ssh:{host.name}", capture.EVENT, f"$ {command}")
+
+    def _remote_command_finished(self, host, command, process, returncode, parse=None):
+        if process.timed_out:
+            self.log(f"Command timed out after {process.timeout:g}s on {host.name}: {command}", "ERROR")
+        elif process.killed:
+            self.log(f"Command killed on {host.name}: {command}", "WARNING")
+        elif returncode == 255:
+            # ssh's own exit code: the connection failed or dropped
+            self.log(f"Lost connection to {host.name} running: {command}", "ERROR")
+        elif returncode != 0:
+            self.log(f"Command exited with code {returncode} after {process.duration:.2f}s on {host.name}: "
+                     f"{command}", "ERROR")
+        if self.capture:
+            self.capture.record(f"ssh:{host.name}", capture.EVENT, f"exit {returncode}: {command}")
+        if parse is not None and self._clean_run(process, returncode):
+            self._finish_parse(parse)
+        return process
+
+    def _local_command_started(self, process):
+        self.log(f"▶ Executing: {process.command}")
+        if self.capture:
+            self.capture.record(capture.LOCAL_DEVICE, capture.EVENT, f"$ {process.command}")
+
+    def _local_command_finished(self, process, returncode, parse=None):
+        command = process.command
+        if process.timed_out:
+            self.log(f"Command timed out after {process.timeout:g}s: {command}", "ERROR")
+        elif process.killed:
+            self.log(f"Command killed: {command}", "WARNING")
+        elif returncode != 0:
+            self.log(f"Command exited with code {returncode} after {process.duration:.2f}s: {command}", "ERROR")
+        if self.capture:
+            self.capture.record(capture.LOCAL_DEVICE, capture.EVENT, f"exit {returncode}: {command}")
+        if parse is not None and self._clean_run(process, returncode):
+            self._finish_parse(parse)
+        return process
+
+    @staticmethod
+    def _clean_run(process, returncode):
+        # Partial output would show up as interfaces or routes that went away
+        return returncode == 0 and not (process.timed_out or process.killed or process.truncated)
+
+    def _log_output_batch(self, batch, host=None, quiet=False):
+        """Log a batch of streamed output lines, one message per run of stdout or stderr
+
+        Output of a remote host has each line tagged with the host's name and
+        is captured under that host instead of the local machine. With quiet,
+        stdout is only captured, not logged.
+        """
+        prefix = f"[{host}] " if host else ''
+        device = f"ssh:{host}" if host else capture.LOCAL_DEVICE
+        for stream, lines in itertools.groupby(batch, key=lambda item: item[0]):
+            lines = [line for _, line in lines]
+            if self.capture:
+                kind = capture.STDERR if stream == STDERR else capture.STDOUT
+                for line in lines:
+                    self.capture.record(device, kind, line.rstrip('\n'))
+            if quiet and stream != STDERR:
+                continue
+            self.log(''.join(prefix + line for line in lines).rstrip('\n'), "WARNING" if stream == STDERR else "INFO")
+
+    def shutdown(self):
+        """Stop workers, close serial ports and flush pending config edits"""
+        self.device_index.stop()
+        self.scheduler.shutdown()
+        if self.metrics_exporter:
+            # Before the sessions close, so the final file has their byte counts
+            self.metrics_exporter.stop()
+        self.serial_sessions.close_all()
+        if self.io_loop:
+            # Kills local commands still running
+            self.io_loop.stop()
+        self.ssh_pool.close()
+        if self.capture:
+            self.capture.close()
+        if self.catalog:
+            self.catalog.close()
+        try:
+            self.commands.save_history()
+        except OSError as e:
+            self.log(f"Cannot save command history: {e}", "WARNING")
+        self.config_store.close()
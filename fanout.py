@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""Running one command on several serial devices at once"""
+
+import threading
+import time
+
+from scheduler import CANCELLED, DONE, FAILED
+
+
+def serial_targets(settings):
+    """Registered serial targets as (name, device) pairs
+
+    settings['serial_devices'] may list plain device paths or objects with
+    'device' and an optional 'name'. The configured serial_device is always
+    included, first.
+    """
+    targets = []
+    seen = set()
+    entries = [settings['serial_device']] + list(settings.get('serial_devices', []))
+    for entry in entries:
+        if isinstance(entry, dict):
+            device = entry.get('device')
+            name = entry.get('name') or device
+        else:
+            device = name = entry
+        if device and device not in seen:
+            seen.add(device)
+            targets.append((name, device))
+    return targets
+
+
+def job_succeeded(job):
+    """Whether a finished job did its work: sequences return False and local
+    commands carry a non-zero return code when they fail"""
+    if job.state != DONE or job.result is False:
+        return False
+    return getattr(job.result, 'returncode', 0) in (0, None)
+
+
+class DeviceResult:
+    """Outcome of a fan-out job on one device"""
+
+    def __init__(self, device, job):
+        self.device = device
+        self.job = job
+
+    @property
+    def state(self):
+        job = self.job
+        if job.state == DONE and not job_succeeded(job):
+            return FAILED
+        return job.state
+
+    @property
+    def duration(self):
+        if self.job.started_at is None:
+            return None
+        end = self.job.finished_at or time.monotonic()
+        return end - self.job.started_at
+
+    @property
+    def detail(self):
+        job = self.job
+        if job.state == FAILED:
+            return str(job.error)
+        if job.state == CANCELLED:
+            return "cancelled"
+        if job.result is False:
+            return "failed, see log"
+        if job.parsed is not None and job.parsed.summary:
+            # What changed since the last run (see Engine._finish_parse)
+            return job.parsed.summary
+        if getattr(job.result, 'returncode', None) is not None:
+            if getattr(job.result, 'cached', False):
+                return f"cached, exit code {job.result.returncode}"
+            return f"exit code {job.result.returncode}"
+        if type(job.result) is int:
+            # A batch of lines (see Engine.queue_serial_batch)
+            return f"{job.result} lines sent"
+        if isinstance(job.result, list) and job.result:
+            # Last line of a serial response, usually the prompt or a status
+            return job.result[-1].strip()
+        return ""
+
+    def to_dict(self):
+        duration = self.duration
+        result = {'device': self.device, 'job': self.job.id, 'state': self.state,
+                  'duration': None if duration is None else round(duration, 3), 'detail': self.detail}
+        if self.job.parsed is not None and self.job.parsed.changes:
+            result['changes'] = [change.to_dict() for change in self.job.parsed.changes]
+        return result
+
+
+class FanOut:
+    """A command dispatched to several devices, one job per device
+
+    Each device has its own serial lane in the scheduler, so the jobs run
+    in parallel across devices while staying ordered on each port.
+    """
+
+    def __init__(self, description, on_complete=None):
+        self.description = description
+        self.on_complete = on_complete
+        self.results = []
+        self.started_at = time.monotonic()
+        self._remaining = 0
+        self._sealed = False
+        self._lock = threading.Lock()
+
+    def add(self, device, job):
+        result = DeviceResult(device, job)
+        with self._lock:
+            self.results.append(result)
+            self._remaining += 1
+        job.add_done_callback(self._job_done)
+        return result
+
+    def seal(self):
+        """Mark that every device has been added; on_complete may fire from now on"""
+        with self._lock:
+            self._sealed = True
+            finished = self._remaining == 0
+        if finished and self.on_complete:
+            self.on_complete(self)
+
+    @property
+    def complete(self):
+        with self._lock:
+            return self._sealed and self._remaining == 0
+
+    def summary(self):
+        """Counts of device results by state"""
+        counts = {}
+        for result in self.results:
+            counts[result.state] = counts.get(result.state, 0) + 1
+        return counts
+
+    def _job_done(self, job):
+        with self._lock:
+            self._remaining -= 1
+            finished = self._sealed and self._remaining == 0
+        if finished and self.on_complete:
+            self.on_complete(self)
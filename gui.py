@@ -0,0 +1,792 @@
+#!/usr/bin/env python3
+"""Tkinter front end: unit type selector, button groups, dialogs and the log window"""
+
+import tkinter as tk
+from tkinter import scrolledtext, font, messagebox, ttk
+import queue
+import sys
+import os
+import re
+
+from engine import ConfigError, Engine, EngineError
+from fanout import FanOut
+from log_buffer import LogBuffer
+from startup import StartupProfile
+from templates import TemplateError
+from terminals import CLOSING, EXITED, KILLED, RUNNING, TerminalError, TerminalSupervisor
+
+class App(tk.Tk):
+    # How often queued log messages are flushed to the log widget
+    LOG_FLUSH_MS = 100
+    # How often calls queued by worker threads and the I/O loop are run on the Tk thread
+    UI_CALLS_MS = 20
+
+    def __init__(self, config_path='config.json', profile=None, exit_when_ready=False):
+        super().__init__()
+        self.profile = profile or StartupProfile()
+        self.profile.mark("tk root")
+        self.exit_when_ready = exit_when_ready
+        self._startup_pending = {'buttons', 'port probe'}
+        # Ports found by the background probe started once the window is up
+        self.detected_ports = None
+        # The one way results get from other threads to Tk; see _call_soon
+        self._ui_calls = queue.SimpleQueue()
+
+        self.current_unit_type = None
+        self.buttons_frame = None
+        # Button widgets per unit type, built once and swapped in on selection
+        self.unit_frames = {}
+        self.group_frames = {}
+        self.config_path = config_path
+        # Messages logged while the engine starts, before the log buffer exists
+        self.log_buffer = None
+        self._early_log = []
+
+        # Command, config and serial core, shared with the CLI and the daemon
+        try:
+            self.engine = Engine(config_path, on_log=self.log, on_queue_change=self._on_queue_change)
+        except ConfigError as e:
+            self.withdraw()
+            messagebox.showerror("Config Error", str(e))
+            sys.exit(1)
+        self.config = self.engine.config
+        self.config_store = self.engine.config_store
+        self.templates = self.engine.templates
+        self.scheduler = self.engine.scheduler
+        settings = self.config['settings']
+        self.profile.mark("engine")
+
+        # Terminal windows (screen in xterm, PuTTY), one per serial device; they are
+        # reaped in the background and closing one never waits for it
+        self.terminals = TerminalSupervisor(
+            on_change=lambda session, state: self._call_soon(self._on_terminal_change, session, state),
+            grace=float(settings.get('terminal_close_timeout', 2)))
+        # A terminal holds its port just like a session; the device index must not open it
+        self.engine.add_busy_source(self.terminals.devices)
+
+        # Bounded log; older lines spill to a rotating file next to the config
+        log_file = settings.get('log_file') or os.path.join(
+            os.path.dirname(os.path.abspath(config_path)), 'logs', 'port_control.log')
+        log_max_lines = int(settings.get('log_max_lines', 5000))
+        try:
+            log_buffer = LogBuffer(max_lines=log_max_lines, spill_path=log_file)
+        except OSError as e:
+            log_buffer = LogBuffer(max_lines=log_max_lines)
+            self._early_log.append((f"Log file disabled, cannot write {log_file}: {e}", "WARNING"))
+        self.log_buffer = log_buffer
+        while self._early_log:
+            log_buffer.append(*self._early_log.pop(0))
+        if self.config_store.recovered:
+            self.log(f"Recovered {self.config_store.recovered} unsaved config change(s) from the journal", "WARNING")
+
+        # Serial buttons and sequences run on every selected target
+        self.selected_devices = [settings['serial_device']]
+
+        self.title("Port Control Interface")
+        self.geometry("1200x800")
+
+        self.default_font = font.nametofont("TkDefaultFont")
+        self.default_font.configure(family="Helvetica", size=10)
+        
+        self._create_widgets()
+        self.profile.mark("widgets")
+
+    def _save_change(self, op, path, value):
+        """Apply one edit to the config and journal it; the file is rewritten shortly after"""
+        try:
+            self.engine.save_change(op, path, value)
+            return True
+        except Exception as e:
+            messagebox.showerror("Save Error", f"Failed to save config change: {e}")
+            return False
+
+    @property
+    def serial_targets(self):
+        return self.engine.serial_targets
+
+    def _create_widgets(self):
+        # Top frame for unit type selection
+        top_frame = tk.Frame(self, padx=10, pady=10)
+        top_frame.pack(side=tk.TOP, fill=tk.X)
+
+        # Unit type selection
+        tk.Label(top_frame, text="Unit Type:", font=("Helvetica", 11, "bold")).pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.unit_type_var = tk.StringVar()
+        unit_types = self.engine.unit_types()
+        if unit_types:
+            self.unit_type_var.set(unit_types[0])  # Set default
+            self.current_unit_type = unit_types[0]
+        
+        self.unit_dropdown = ttk.Combobox(top_frame, textvariable=self.unit_type_var, 
+                                         values=unit_types, state="readonly", width=20)
+        self.unit_dropdown.pack(side=tk.LEFT, padx=(0, 20))
+        self.unit_dropdown.bind('<<ComboboxSelected>>', self._on_unit_type_change)
+
+        # Unit description
+        self.unit_description = tk.Label(top_frame, text="", fg="gray", font=("Helvetica", 10))
+        self.unit_description.pack(side=tk.LEFT, padx=(0, 20))
+
+        # Add command button
+        tk.Button(top_frame, text="+ Add Command", command=self._add_command_dialog,
+                 bg="#4CAF50", fg="white", font=("Helvetica", 9)).pack(side=tk.RIGHT, padx=(0, 10))
+        
+        # Add group button
+        tk.Button(top_frame, text="+ Add Group", command=self._add_group_dialog,
+                 bg="#2196F3", fg="white", font=("Helvetica", 9)).pack(side=tk.RIGHT, padx=(0, 10))
+
+        # Cancel queued commands button
+        tk.Button(top_frame, text="Cancel Pending", command=self.cancel_pending_commands,
+                 bg="#FF9800", fg="white", font=("Helvetica", 9)).pack(side=tk.RIGHT, padx=(0, 10))
+
+        # Timing and traffic stats window button
+        tk.Button(top_frame, text="Stats", command=self._open_metrics_window,
+                 bg="#607D8B", fg="white", font=("Helvetica", 9)).pack(side=tk.RIGHT, padx=(0, 10))
+
+        # Running/queued jobs window button
+        tk.Button(top_frame, text="Jobs", command=self._open_jobs_window,
+                 bg="#607D8B", fg="white", font=("Helvetica", 9)).pack(side=tk.RIGHT, padx=(0, 10))
+
+        # Open terminal sessions window button
+        tk.Button(top_frame, text="Terminals", command=self._open_terminals_window,
+                 bg="#607D8B", fg="white", font=("Helvetica", 9)).pack(side=tk.RIGHT, padx=(0, 10))
+
+        # Recorded session search window button
+        tk.Button(top_frame, text="Captures", command=self._open_capture_window,
+                 bg="#607D8B", fg="white", font=("Helvetica", 9)).pack(side=tk.RIGHT, padx=(0, 10))
+
+        # Paced sending of pasted or loaded command scripts
+        tk.Button(top_frame, text="Send Script", command=self._open_send_script_dialog,
+                 bg="#607D8B", fg="white", font=("Helvetica", 9)).pack(side=tk.RIGHT, padx=(0, 10))
+
+        # Fuzzy search over every button of every unit type
+        tk.Button(top_frame, text="Find (Ctrl+P)", command=self._open_command_palette,
+                 bg="#607D8B", fg="white", font=("Helvetica", 9)).pack(side=tk.RIGHT, padx=(0, 10))
+        self.bind_all('<Control-p>', lambda e: self._open_command_palette())
+        self.bind_all('<Control-k>', lambda e: self._open_command_palette())
+
+        self._create_target_selector()
+
+        # Main container for buttons (above logs)
+        self.buttons_container = tk.Frame(self, padx=10, pady=10)
+        self.buttons_container.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+
+        # The buttons are built once the empty window has been drawn
+        self.after_idle(lambda: self.after(0, self._finish_startup))
+
+        # Logs window at the bottom (taking 1/5 of screen height)
+        logs_frame = tk.Frame(self, padx=10, pady=10)
+        logs_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        
+        logs_header = tk.Frame(logs_frame)
+        logs_header.pack(fill=tk.X)
+        tk.Label(logs_header, text="Command Output Logs:", font=("Helvetica", 11, "bold")).pack(side=tk.LEFT)
+        tk.Button(logs_header, text="Search Logs", command=self._search_logs_dialog,
+                 font=("Helvetica", 9)).pack(side=tk.RIGHT)
+        self.output_text = scrolledtext.ScrolledText(logs_frame, wrap=tk.WORD, height=8, width=80)
+        self.output_text.pack(fill=tk.BOTH, expand=True)
+        self.output_text.tag_config("ERROR", foreground="red")
+        self.output_text.tag_config("SUCCESS", foreground="green")
+        self.output_text.tag_config("WARNING", foreground="orange")
+        self.after(self.LOG_FLUSH_MS, self._flush_log)
+        self.after(self.UI_CALLS_MS, self._run_ui_calls)
+
+        # Add a status bar at the very bottom, with the command queue depth on the right
+        status_frame = tk.Frame(self)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        self.queue_status = tk.Label(status_frame, text="Queue: 0", bd=1, relief=tk.SUNKEN, anchor=tk.E, width=30)
+        self.queue_status.pack(side=tk.RIGHT)
+        self.status_bar = tk.Label(status_frame, text="Ready", bd=1, relief=tk.SUNKEN, anchor=tk.W)
+        self.status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
+        # Update unit description
+        self._update_unit_description()
+
+    def _create_target_selector(self):
+        """Row for choosing which serial devices serial buttons and sequences run on"""
+        targets_frame = tk.Frame(self, padx=10)
+        targets_frame.pack(side=tk.TOP, fill=tk.X)
+
+        tk.Label(targets_frame, text="Serial Targets:", font=("Helvetica", 11, "bold")).pack(side=tk.LEFT, padx=(0, 10))
+
+        self.targets_button = tk.Menubutton(targets_frame, relief=tk.RAISED, width=20)
+        self.targets_button.pack(side=tk.LEFT, padx=(0, 10))
+        self.targets_menu = tk.Menu(self.targets_button, tearoff=False)
+        self.targets_button.config(menu=self.targets_menu)
+
+        self.targets_label = tk.Label(targets_frame, text="", fg="gray", font=("Helvetica", 10))
+        self.targets_label.pack(side=tk.LEFT)
+
+        self.target_vars = {}
+        self._rebuild_target_menu()
+
+    def _rebuild_target_menu(self):
+        """Fill the targets menu with one checkbox per registered device"""
+        self.targets_menu.delete(0, tk.END)
+        for name, device in self.serial_targets:
+            var = self.target_vars.get(device)
+            if var is None:
+                var = self.target_vars[device] = tk.BooleanVar(value=device in self.selected_devices)
+            label = name if name == device else f"{name} ({device})"
+            self.targets_menu.add_checkbutton(label=label, variable=var, command=self._on_targets_changed)
+        self.targets_menu.add_separator()
+        self.targets_menu.add_command(label="Select All", command=lambda: self._select_targets(all_targets=True))
+        self.targets_menu.add_command(label="Default Only", command=lambda: self._select_targets(all_targets=False))
+        self.targets_menu.add_command(label="Detect Ports", command=self._register_detected_ports)
+        self._on_targets_changed()
+
+    def _select_targets(self, all_targets):
+        default = self.config['settings']['serial_device']
+        for device, var in self.target_vars.items():
+            var.set(all_targets or device == default)
+        self._on_targets_changed()
+
+    def _on_targets_changed(self):
+        self.selected_devices = [device for _, device in self.serial_targets if self.target_vars[device].get()]
+        self.targets_button.config(text=f"{len(self.selected_devices)} of {len(self.serial_targets)} selected")
+        names = [name for name, device in self.serial_targets if device in self.selected_devices]
+        shown = ", ".join(names[:4]) + (f" +{len(names) - 4} more" if len(names) > 4 else "")
+        self.targets_label.config(text=shown or "No targets selected")
+
+    def _finish_startup(self):
+        """Build the current unit type's buttons and start probing serial ports"""
+        self.profile.mark("first paint")
+        self._create_buttons()
+        self.profile.mark("buttons")
+        self._startup_step_done('buttons')
+
+        # Scans the ports once in the background, then follows hotplug events
+        self.engine.start_device_index()
+        started = self.profile.elapsed()
+        def on_ports(ports):
+            self.profile.record("port probe", self.profile.elapsed() - started)
+            self._call_soon(self._on_ports_detected, ports)
+        self.engine.detect_serial_ports_async(on_ports)
+
+        # Ready for the first Ctrl+P without making startup wait for it
+        self.engine.index_commands_async()
+
+    def _startup_step_done(self, step):
+        self._startup_pending.discard(step)
+        if not self._startup_pending and self.exit_when_ready:
+            self.profile.report()
+            self.on_closing()
+
+    def _call_soon(self, func, *args):
+        """Run func(*args) on the Tk thread; safe from worker threads and the I/O loop"""
+        self._ui_calls.put((func, args))
+
+    def _run_ui_calls(self):
+        """Run the calls queued by other threads, then look again shortly"""
+        try:
+            while True:
+                try:
+                    func, args = self._ui_calls.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    func(*args)
+                except Exception as e:
+                    # One bad update must not stop the ones after it
+                    self.log(f"Error in {getattr(func, '__name__', func)}: {e}", "ERROR")
+        finally:
+            self.after(self.UI_CALLS_MS, self._run_ui_calls)
+
+    def _on_ports_detected(self, ports):
+        self.detected_ports = ports
+        known = {device for _, device in self.serial_targets}
+        new_ports = [port for port in ports if port not in known]
+        if new_ports:
+            self.log(f"Found {len(new_ports)} unregistered serial port(s): {', '.join(new_ports)}"
+                     " (Serial Targets → Detect Ports adds them)")
+        self._startup_step_done('port probe')
+
+    def _register_detected_ports(self):
+        """Detect serial ports in the background, then register the new ones"""
+        self.log("Detecting serial ports...")
+        self.engine.detect_serial_ports_async(lambda ports: self._call_soon(self._register_ports, ports))
+
+    def _register_ports(self, ports):
+        """Add detected serial ports to the registered targets and save them"""
+        self.detected_ports = ports
+        known = {device for _, device in self.serial_targets}
+        new_ports = [port for port in ports if port not in known]
+        if not new_ports:
+            self.log("No new serial ports detected")
+            return
+        settings = self.config['settings']
+        if not self.update_setting('serial_devices', list(settings.get('serial_devices', [])) + new_ports):
+            return
+        self._rebuild_target_menu()
+        self.log(f"Registered {len(new_ports)} serial target(s): {', '.join(new_ports)}", "SUCCESS")
+
+    def _add_command_dialog(self):
+        """Open dialog to add a new command button"""
+        if not self.current_unit_type:
+            messagebox.showwarning("Warning", "Please select a unit type first!")
+            return
+            
+        # Get available groups for the current unit type
+        button_groups = self.engine.unit(self.current_unit_type).groups
+        
+        if not button_groups:
+            messagebox.showwarning("Warning", "No button groups available. Please add a group first!")
+            return
+            
+        # Create a simple dialog to select group and add command
+        group_dialog = tk.Toplevel(self)
+        group_dialog.title("Select Button Group")
+        group_dialog.geometry("300x200")
+        group_dialog.transient(self)
+        group_dialog.grab_set()
+        
+        # Center the dialog
+        group_dialog.update_idletasks()
+        x = (group_dialog.winfo_screenwidth() // 2) - (300 // 2)
+        y = (group_dialog.winfo_screenheight() // 2) - (200 // 2)
+        group_dialog.geometry(f"300x200+{x}+{y}")
+        
+        main_frame = tk.Frame(group_dialog, padx=20, pady=20)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        
+        tk.Label(main_frame, text="Select group to add command:", font=("Helvetica", 10, "bold")).pack(pady=(0, 15))
+        
+        group_var = tk.StringVar(value=button_groups[0].title)
+        for group in button_groups:
+            tk.Radiobutton(main_frame, text=group.title, variable=group_var, 
+                          value=group.title).pack(anchor="w", pady=2)
+        
+        def open_add_command():
+            selected_group = group_var.get()
+            group_dialog.destroy()
+            
+            # Find the group index; its type was worked out when the config was loaded
+            group_index = next((i for i, g in enumerate(button_groups) if g.title == selected_group), 0)
+            
+            # Open the add command dialog
+            from dialogs import AddCommandDialog
+            dialog = AddCommandDialog(self, self.current_unit_type, selected_group,
+                                      button_groups[group_index].group_type)
+            self.wait_window(dialog.dialog)
+            
+            if dialog.result:
+                self._add_command_to_group(group_index, dialog.result)
+        
+        button_frame = tk.Frame(main_frame)
+        button_frame.pack(fill=tk.X, pady=(20, 0))
+        
+        tk.Button(button_frame, text="Continue", command=open_add_command,
+                 bg="green", fg="white", width=15).pack(side=tk.RIGHT, padx=(10, 0))
+        tk.Button(button_frame, text="Cancel", command=group_dialog.destroy,
+                 bg="red", fg="white", width=15).pack(side=tk.RIGHT, padx=(0, 0))
+
+    def _add_group_dialog(self):
+        """Open dialog to add a new button group"""
+        if not self.current_unit_type:
+            messagebox.showwarning("Warning", "Please select a unit type first!")
+            return
+            
+        from dialogs import AddGroupDialog
+        dialog = AddGroupDialog(self, self.current_unit_type)
+        self.wait_window(dialog.dialog)
+        
+        if dialog.result:
+            self._add_button_group(dialog.result)
+
+    def _add_command_to_group(self, group_index, command_data):
+        """Add a new command to an existing button group"""
+        try:
+            # Add the command to the config and save it
+            path = ['unit_types', self.current_unit_type, 'button_groups', group_index, 'buttons']
+            if self._save_change('append', path, command_data):
+                # Add just the new button to its group's frame
+                group = self.engine.unit(self.current_unit_type).groups[group_index]
+                group_frames = self.group_frames.get(self.current_unit_type)
+                if group_frames:
+                    self._build_button(group_frames[group_index], group.buttons[-1])
+                self.log(f"Added new command '{command_data['text']}' to group '{group.title}'", "SUCCESS")
+            else:
+                messagebox.showerror("Error", "Failed to save configuration!")
+                
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to add command: {e}")
+
+    def _add_button_group(self, group_data):
+        """Add a new button group to the current unit type"""
+        try:
+            # Add the new group to the config and save it
+            path = ['unit_types', self.current_unit_type, 'button_groups']
+            if self._save_change('append', path, group_data):
+                # Add just the new group after the existing ones
+                if self.current_unit_type in self.unit_frames:
+                    self._build_group_frame(self.current_unit_type,
+                                            self.engine.unit(self.current_unit_type).groups[-1])
+                self.log(f"Added new button group '{group_data['title']}'", "SUCCESS")
+            else:
+                messagebox.showerror("Error", "Failed to save configuration!")
+                
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to add button group: {e}")
+
+    def _on_unit_type_change(self, event=None):
+        """Handle unit type change from dropdown"""
+        new_unit_type = self.unit_type_var.get()
+        if new_unit_type != self.current_unit_type:
+            self.current_unit_type = new_unit_type
+            self._create_buttons()
+            self._update_unit_description()
+            self.log(f"Switched to unit type: {new_unit_type}", "SUCCESS")
+
+    def _update_unit_description(self):
+        """Update the unit description label"""
+        if self.current_unit_type:
+            self.unit_description.config(text=self.engine.unit_description(self.current_unit_type))
+
+    def _create_buttons(self):
+        """Show the buttons for the current unit type, building them on first use"""
+        if not self.current_unit_type:
+            return
+
+        # Hide the previous unit type's buttons; they stay cached for the next switch.
+        # An error frame isn't cached, so it is destroyed instead
+        if self.buttons_frame is not None:
+            if self.buttons_frame in self.unit_frames.values():
+                self.buttons_frame.pack_forget()
+            else:
+                self.buttons_frame.destroy()
+
+        unit_frame = self.unit_frames.get(self.current_unit_type)
+        if unit_frame is None:
+            unit_frame = self._build_unit_frame(self.current_unit_type)
+        self.buttons_frame = unit_frame
+        self.buttons_frame.pack(fill=tk.BOTH, expand=True)
+
+    def _build_unit_frame(self, unit_type):
+        """Build and cache the button groups of one unit type"""
+        try:
+            # A unit type with its own file is read and checked here, on first selection
+            button_groups = self.engine.unit(unit_type).groups
+        except ConfigError as e:
+            self.log(str(e), "ERROR")
+            # Not cached, so selecting it again after fixing the file retries
+            error_frame = tk.Frame(self.buttons_container)
+            tk.Label(error_frame, text=str(e), fg='red', justify='left', anchor='w').pack(fill=tk.X)
+            return error_frame
+
+        # Create a frame for all button groups
+        unit_frame = tk.Frame(self.buttons_container)
+        self.unit_frames[unit_type] = unit_frame
+        self.group_frames[unit_type] = []
+
+        # Create button groups in a grid layout (3 columns)
+        for group in button_groups:
+            self._build_group_frame(unit_type, group)
+
+        # Configure grid weights for even distribution
+        unit_frame.grid_columnconfigure(0, weight=1)
+        unit_frame.grid_columnconfigure(1, weight=1)
+        unit_frame.grid_columnconfigure(2, weight=1)
+        return unit_frame
+
+    def _build_group_frame(self, unit_type, group):
+        """Add one group's LabelFrame at the next grid position of its unit type"""
+        group_frames = self.group_frames[unit_type]
+        index = len(group_frames)
+
+        title = group.title
+        if group.hosts is not None:
+            hosts = group.hosts or list(self.engine.remote_hosts)
+            title += f" (on {', '.join(hosts[:3])}{f' +{len(hosts) - 3}' if len(hosts) > 3 else ''})"
+        group_frame = tk.LabelFrame(self.unit_frames[unit_type], text=title, padx=10, pady=10)
+        group_frame.grid(row=index // 3, column=index % 3, sticky='nsew', padx=5, pady=5)
+        group_frames.append(group_frame)
+
+        if group.description:
+            tk.Label(group_frame, text=group.description, wraplength=250, justify='left', fg='gray').pack(fill=tk.X, pady=(0,5))
+
+        # Create buttons for this group
+        for button in group.buttons:
+            self._build_button(group_frame, button)
+        return group_frame
+
+    def _build_button(self, group_frame, button):
+        """Create the widget for one Button; its action and template were checked at load"""
+        if button.action == 'open_screen':
+            callback = self.open_screen
+        elif button.action == 'close_screen':
+            callback = self.close_screen
+        else:
+            callback = lambda b=button: self.dispatch_button(b)
+
+        btn = tk.Button(group_frame, text=button.text, command=callback, **button.style)
+        btn.pack(fill=tk.X, pady=2)
+        return btn
+
+    def update_setting(self, key, value):
+        """Change and save a setting; only commands that use it are rendered again"""
+        try:
+            self.engine.update_setting(key, value)
+            return True
+        except Exception as e:
+            messagebox.showerror("Save Error", f"Failed to save config change: {e}")
+            return False
+
+    def log(self, message, level="INFO"):
+        """Queue a message for the log window; safe to call from any thread"""
+        if self.log_buffer is None:
+            # The engine is still starting; replayed once the buffer exists
+            self._early_log.append((message, level))
+            return
+        self.log_buffer.append(message, level)
+
+    def _flush_log(self):
+        """Write queued log messages to the widget in one batch"""
+        try:
+            batch = self.log_buffer.drain()
+            if batch:
+                # Only follow the output if the user hasn't scrolled up to read something
+                at_bottom = self.output_text.yview()[1] >= 0.999
+                chunks = []
+                for entry in batch:
+                    chunks.extend((LogBuffer.format_entry(entry) + "\n", entry[2]))
+                self.output_text.insert(tk.END, *chunks)
+
+                # Keep the widget no larger than the in-memory ring
+                line_count = int(self.output_text.index('end-1c').split('.')[0])
+                excess = line_count - self.log_buffer.max_lines
+                if excess > 0:
+                    self.output_text.delete('1.0', f'{excess + 1}.0')
+                if at_bottom:
+                    self.output_text.see(tk.END)
+
+                # Update status bar with the last message
+                message = batch[-1][1]
+                self.status_bar.config(text=f"Last: {message[:50]}{'...' if len(message) > 50 else ''}")
+        finally:
+            # Keep flushing even if one batch failed; Tk reports the error
+            self.after(self.LOG_FLUSH_MS, self._flush_log)
+
+    def _search_logs_dialog(self):
+        """Search the current log and the rotated log files"""
+        from tkinter import simpledialog
+        pattern = simpledialog.askstring("Search Logs", "Regular expression:", parent=self)
+        if not pattern:
+            return
+        try:
+            matches = self.log_buffer.search(pattern)
+        except re.error as e:
+            messagebox.showerror("Error", f"Invalid pattern: {e}")
+            return
+
+        results = tk.Toplevel(self)
+        results.title(f"Log Search - {pattern} ({len(matches)} matches)")
+        results.geometry("900x400")
+        text = scrolledtext.ScrolledText(results, wrap=tk.NONE)
+        text.pack(fill=tk.BOTH, expand=True)
+        text.insert(tk.END, "\n".join(matches) if matches else "No matches.")
+        text.config(state=tk.DISABLED)
+
+    def update_status(self, message):
+        """Update the status bar with a custom message"""
+        if hasattr(self, 'status_bar'):
+            self.status_bar.config(text=message)
+
+    def dispatch_button(self, button):
+        """Run a serial button or sequence on every selected target, a remote group's command
+        on its hosts, or a local command once"""
+        devices = list(self.selected_devices)
+        if button.per_device and not button.remote and not devices:
+            messagebox.showwarning("Warning", "No serial targets selected!")
+            return
+        try:
+            fanout = self.engine.dispatch_button(button, devices)
+        except EngineError as e:
+            self.log(str(e), "ERROR")
+            return
+        if len(fanout.results) > 1:
+            from dialogs import FanOutWindow
+            FanOutWindow(self, fanout, {device: name for name, device in self.serial_targets})
+
+    def _open_send_script_dialog(self):
+        """Send many lines to the selected serial targets, paced so the console keeps up"""
+        from dialogs import SendScriptDialog
+        SendScriptDialog(self, self.config['settings'], self._send_script)
+
+    def _send_script(self, lines, line_delay, wait_for, window):
+        devices = list(self.selected_devices)
+        if not devices:
+            messagebox.showwarning("Warning", "No serial targets selected!")
+            return
+        fanout = FanOut(f"Script ({len(lines)} lines)")
+        for device in devices:
+            job = self.engine.queue_serial_batch(lines, device, line_delay=line_delay, wait_for=wait_for,
+                                                 window=window)
+            if job is not None:
+                self.engine.metrics.track(job, 'script')
+                fanout.add(device, job)
+        fanout.seal()
+        if len(fanout.results) > 1:
+            from dialogs import FanOutWindow
+            FanOutWindow(self, fanout, {device: name for name, device in self.serial_targets})
+
+    def cancel_pending_commands(self):
+        """Drop every queued command that hasn't started yet"""
+        cancelled = self.engine.cancel_pending()
+        if cancelled:
+            self.log(f"Cancelled {len(cancelled)} pending command(s)", "WARNING")
+        else:
+            self.log("No pending commands to cancel")
+
+    def _open_jobs_window(self):
+        """Show queued and running commands"""
+        from dialogs import JobsWindow
+        JobsWindow(self, self.scheduler)
+
+    def _open_metrics_window(self):
+        """Show per-button timing and per-port traffic"""
+        from dialogs import MetricsWindow
+        MetricsWindow(self, self.engine.metrics)
+
+    def _open_capture_window(self):
+        """Search and replay recorded serial and command sessions"""
+        if self.engine.capture is None:
+            messagebox.showinfo("Captures", "Session capture is turned off (settings.capture)")
+            return
+        from dialogs import CaptureWindow
+        CaptureWindow(self, self.engine.capture)
+
+    def _open_command_palette(self):
+        """Find and run a button of any unit type from the keyboard"""
+        from dialogs import CommandPalette
+        CommandPalette(self, self.engine, self._run_palette_entry)
+
+    def _run_palette_entry(self, entry):
+        try:
+            button = self.engine.find_button(entry.unit, entry.text)
+        except (ConfigError, EngineError) as e:
+            self.log(str(e), "ERROR")
+            return
+        self.log(f"Running '{button.text}' from {entry.unit}")
+        if button.action in ('open_screen', 'close_screen'):
+            # These don't go through the engine, so count their use here
+            self.engine.commands.record_use(entry.unit, button.text)
+            if button.action == 'open_screen':
+                self.open_screen()
+            else:
+                self.close_screen()
+        else:
+            self.dispatch_button(button)
+
+    def _on_queue_change(self):
+        # Called from worker threads
+        self._call_soon(self._update_queue_status)
+
+    def _update_queue_status(self):
+        """Show how many commands are waiting in each queue"""
+        depths = {lane: depth for lane, depth in self.scheduler.queue_depth().items() if depth}
+        if not depths:
+            self.queue_status.config(text="Queue: 0")
+            return
+        total = sum(depths.values())
+        busiest = max(depths, key=depths.get)
+        self.queue_status.config(text=f"Queue: {total} (max {depths[busiest]} on {busiest.split(':', 1)[-1]})")
+
+    def _terminal_command(self, device):
+        """Command line of a terminal on a device: settings.terminal_command, or the platform default"""
+        settings = self.config['settings']
+        template = settings.get('terminal_command')
+        if template:
+            return [self.engine.format_command(arg, device) for arg in template]
+        baudrate = str(self.engine.format_command('{serial_baudrate}', device))
+        if sys.platform.startswith('win'):
+            return ["putty", "-serial", device, "-sercfg", f"{baudrate},8,n,1,N"]
+        return ["xterm", "-bg", "black", "-fg", "white", "-T", device, "-e", "screen", device, baudrate]
+
+    def open_screen(self):
+        """Open a terminal on each selected serial target that doesn't have one yet"""
+        names = {device: name for name, device in self.serial_targets}
+        for device in self.selected_devices or [self.config['settings']['serial_device']]:
+            session = self.terminals.get(device)
+            if session is not None and session.alive:
+                self.log(f"A terminal for {names.get(device, device)} is already open", "WARNING")
+                continue
+            try:
+                self._start_terminal(device, names.get(device, device))
+            except TemplateError as e:
+                self.log(f"Bad terminal_command: {e}", "ERROR")
+                return
+            except TerminalError as e:
+                messagebox.showerror("Error", f"{e}\n\nInstall it or set terminal_command in the config.")
+                return
+
+    def _start_terminal(self, device, name):
+        """Open a terminal on a device, taking the port from the engine's session first
+
+        Otherwise the session's reader and the terminal would both read the
+        port and each get part of the output. The session gets the port
+        back once the terminal has exited (see _on_terminal_change).
+        """
+        argv = self._terminal_command(device)
+        self.engine.release_port(device)
+        try:
+            self.terminals.open(device, argv, name)
+        except TerminalError:
+            self.engine.reclaim_port(device)
+            raise
+
+    def close_screen(self):
+        """Close the terminals of the selected serial targets; they are stopped in the background"""
+        devices = self.selected_devices or [self.config['settings']['serial_device']]
+        closing = [session for session in (self.terminals.close(device) for device in devices) if session]
+        if not closing:
+            messagebox.showinfo("Info", "No active screen session to close.")
+
+    def _on_terminal_change(self, session, state):
+        if state == RUNNING:
+            self.log(f"Terminal for {session.name} started (pid {session.pid}).", "SUCCESS")
+        elif state == CLOSING:
+            self.log(f"Closing terminal for {session.name}...")
+        elif state == KILLED:
+            self.log(f"Terminal for {session.name} did not exit and was killed.", "WARNING")
+        else:
+            self.log(f"Terminal for {session.name} exited (code {session.returncode}).")
+        if state in (KILLED, EXITED):
+            current = self.terminals.get(session.device)
+            # Unless a new terminal was opened on the device meanwhile
+            if current is None or not current.alive:
+                self.engine.reclaim_port(session.device)
+
+    def _open_terminals_window(self):
+        """Show every terminal session and its state"""
+        from dialogs import TerminalsWindow
+        TerminalsWindow(self, self.terminals, self._reopen_terminal)
+
+    def _reopen_terminal(self, session):
+        try:
+            self._start_terminal(session.device, session.name)
+        except (TemplateError, TerminalError) as e:
+            self.log(str(e), "ERROR")
+
+    def on_closing(self):
+        close_terminals = True
+        live = self.terminals.live()
+        if live:
+            close_terminals = messagebox.askyesno(
+                "Exit", f"{len(live)} terminal session(s) are open. Close them before exiting?")
+        # Returns at once; terminals that linger are killed after the window is gone
+        self.terminals.shutdown(close=close_terminals)
+        try:
+            self.engine.shutdown()
+        except Exception as e:
+            messagebox.showerror("Save Error", f"Failed to save config file: {e}")
+        self.log_buffer.close()
+        # Unbind mouse wheel to prevent memory leaks
+        self.unbind_all("<MouseWheel>")
+        self.destroy()
+
+def run(config_path='config.json', profile=None, exit_when_ready=False):
+    """Start the GUI and block until its window is closed"""
+    app = App(config_path, profile, exit_when_ready)
+    app.protocol("WM_DELETE_WINDOW", app.on_closing)
+    app.mainloop()
+    return 0
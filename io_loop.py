@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""One asyncio event loop, on its own thread, for serial ports and local commands"""
+
+import os
+import sys
+import threading
+
+
+def _watch_children_with_pidfd(loop):
+    """Reap subprocesses through pidfds on the loop itself
+
+    Before Python 3.12 asyncio's default child watcher starts a thread per
+    subprocess, which would undo the point of running commands on the loop.
+    3.12 and later pick pidfds on their own.
+    """
+    if sys.version_info >= (3, 12) or not sys.platform.startswith('linux') or not hasattr(os, 'pidfd_open'):
+        return
+    import asyncio
+
+    try:
+        os.close(os.pidfd_open(os.getpid()))
+    except OSError:
+        # Kernel older than 5.3
+        return
+    watcher = asyncio.PidfdChildWatcher()
+    watcher.attach_loop(loop)
+    asyncio.set_child_watcher(watcher)
+
+
+class IOLoop:
+    """An asyncio loop running beside the UI (or the daemon) on a background thread
+
+    Serial ports are watched with add_reader() and local commands run as
+    asyncio subprocesses, so waiting on hundreds of consoles and commands
+    costs tasks, not threads. Everything here may be called from any
+    thread; call() and run() block the caller until the loop has done the
+    work, and run directly when already on the loop thread.
+
+    asyncio is imported and the thread started on first use, so creating
+    an IOLoop adds nothing to startup time.
+    """
+
+    # Seconds stop() lets cancelled tasks clean up (kill their processes) before giving up
+    STOP_TIMEOUT = 2.0
+
+    def __init__(self, name='io-loop'):
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopped = False
+
+    @property
+    def loop(self):
+        """The asyncio loop, started on first access"""
+        if self._loop is None:
+            self._start()
+        return self._loop
+
+    def _start(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            if self._stopped:
+                raise RuntimeError("IOLoop has been stopped")
+            import asyncio
+
+            loop = asyncio.new_event_loop()
+            _watch_children_with_pidfd(loop)
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(loop, ready), name=self.name, daemon=True)
+            self._thread.start()
+            ready.wait()
+            self._loop = loop
+
+    @staticmethod
+    def _run(loop, ready):
+        import asyncio
+
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        try:
+            loop.run_forever()
+        finally:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def in_loop(self):
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def call_soon(self, func, *args):
+        """Run func(*args) on the loop thread without waiting for it"""
+        if self.in_loop():
+            return self._loop.call_soon(func, *args)
+        return self.loop.call_soon_threadsafe(func, *args)
+
+    def call(self, func, *args, timeout=None):
+        """Run func(*args) on the loop thread and return its result"""
+        if self.in_loop():
+            return func(*args)
+        import concurrent.futures
+
+        future = concurrent.futures.Future()
+
+        def invoke():
+            try:
+                future.set_result(func(*args))
+            except BaseException as e:
+                future.set_exception(e)
+        self.loop.call_soon_threadsafe(invoke)
+        return future.result(timeout)
+
+    def submit(self, coro):
+        """Schedule a coroutine; returns a concurrent.futures.Future for its result"""
+        import asyncio
+
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine to completion from a thread other than the loop's"""
+        if self.in_loop():
+            coro.close()
+            raise RuntimeError("IOLoop.run() would deadlock on the loop thread")
+        return self.submit(coro).result(timeout)
+
+    def stop(self):
+        """Cancel what is still running, let it clean up and stop the loop"""
+        with self._lock:
+            self._stopped = True
+        if not self.running:
+            return
+        import concurrent.futures
+
+        try:
+            self.run(self._cancel_all(), timeout=self.STOP_TIMEOUT + 1)
+        except (concurrent.futures.TimeoutError, RuntimeError):
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(self.STOP_TIMEOUT)
+
+    async def _cancel_all(self):
+        import asyncio
+
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks, timeout=self.STOP_TIMEOUT)
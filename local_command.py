@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""Local shell commands with streamed, batched output"""
+
+import collections
+import os
+import queue
+import signal
+import subprocess
+import threading
+import time
+
+STDOUT = 'stdout'
+STDERR = 'stderr'
+
+# Longest piece of a single line handed over at once; longer lines are split
+MAX_LINE_CHARS = 8192
+
+
+class LocalCommand:
+    """A shell command whose output is delivered while it runs
+
+    Lines from stdout and stderr are collected by two reader threads and
+    passed to on_output in batches of (stream, line) tuples, at most once per
+    batch_interval seconds. Only the most recent max_output_bytes of output
+    are kept in memory for the finished result.
+
+    run_async() does the same on an asyncio loop with no extra threads; its
+    batches are delivered from the loop thread.
+    """
+
+    def __init__(self, command, on_output=None, timeout=None, max_output_bytes=1024 * 1024,
+                 batch_interval=0.1, batch_lines=500):
+        self.command = command
+        self.on_output = on_output
+        self.timeout = timeout
+        self.max_output_bytes = max_output_bytes
+        self.batch_interval = batch_interval
+        self.batch_lines = batch_lines
+
+        self.returncode = None
+        self.timed_out = False
+        self.killed = False
+        self.truncated = False
+        self.started_at = None
+        self.finished_at = None
+
+        self._process = None
+        self._lines = queue.Queue()
+        self._kept = collections.deque()
+        self._kept_bytes = 0
+        self._kill_requested = threading.Event()
+        # Set while run_async() is running, so kill() can reach it
+        self._loop = None
+        self._batch = []
+        self._flush_handle = None
+
+    @property
+    def running(self):
+        return self._process is not None and self.returncode is None
+
+    @property
+    def duration(self):
+        """Seconds the command has run for, or ran for once finished"""
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def run(self):
+        """Start the command and stream its output until it exits; returns the exit code"""
+        popen_args = {}
+        if os.name == 'posix':
+            # Own process group, so kill() also stops the shell's children
+            popen_args['start_new_session'] = True
+        self.started_at = time.monotonic()
+        self._process = subprocess.Popen(
+            self.command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            stdin=subprocess.DEVNULL, text=True, errors='replace', bufsize=1, **popen_args)
+
+        readers = [
+            threading.Thread(target=self._read_stream, args=(self._process.stdout, STDOUT), daemon=True),
+            threading.Thread(target=self._read_stream, args=(self._process.stderr, STDERR), daemon=True),
+        ]
+        for reader in readers:
+            reader.start()
+
+        deadline = None if not self.timeout else self.started_at + self.timeout
+        open_streams = len(readers)
+        batch = []
+        next_flush = time.monotonic() + self.batch_interval
+        while open_streams:
+            now = time.monotonic()
+            if deadline is not None and now >= deadline and not self.timed_out:
+                self.timed_out = True
+                self._terminate()
+            if self._kill_requested.is_set() and not self.killed:
+                self.killed = True
+                self._terminate()
+
+            try:
+                item = self._lines.get(timeout=max(0.0, min(next_flush - now, 0.1)))
+            except queue.Empty:
+                item = ()
+            if item is None:
+                open_streams -= 1
+            elif item:
+                batch.append(item)
+                self._keep(item[1])
+
+            if batch and (len(batch) >= self.batch_lines or time.monotonic() >= next_flush or not open_streams):
+                self._emit(batch)
+                batch = []
+            if time.monotonic() >= next_flush:
+                next_flush = time.monotonic() + self.batch_interval
+
+        try:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            self.returncode = self._process.wait(timeout=remaining)
+        except subprocess.TimeoutExpired:
+            # Output closed but the command kept running past its timeout
+            self.timed_out = True
+            self._terminate()
+            self.returncode = self._process.wait()
+        self.finished_at = time.monotonic()
+        return self.returncode
+
+    async def run_async(self):
+        """run() as a coroutine: asyncio subprocess pipes instead of reader threads"""
+        import asyncio
+
+        popen_args = {}
+        if os.name == 'posix':
+            popen_args['start_new_session'] = True
+        self._loop = asyncio.get_running_loop()
+        self.started_at = time.monotonic()
+        readers = exited = None
+        try:
+            self._process = await asyncio.create_subprocess_shell(
+                self.command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL,
+                **popen_args)
+            if self._kill_requested.is_set():
+                self._on_kill()
+            readers = [asyncio.create_task(self._read_stream_async(self._process.stdout, STDOUT)),
+                       asyncio.create_task(self._read_stream_async(self._process.stderr, STDERR))]
+            # The timeout covers the exit too: a command can close its output and keep running
+            exited = asyncio.create_task(self._process.wait())
+            _, still_open = await asyncio.wait([*readers, exited], timeout=self.timeout or None)
+            if still_open:
+                self.timed_out = True
+                self._terminate()
+                await asyncio.wait(still_open)
+            for reader in readers:
+                reader.result()
+            self.returncode = exited.result()
+        except asyncio.CancelledError:
+            # Cancelled from outside (e.g. the loop shutting down): don't leave the process behind
+            if self._process is not None:
+                self.killed = True
+                self._terminate()
+            for task in [*(readers or ()), *([exited] if exited else [])]:
+                task.cancel()
+            raise
+        finally:
+            self._flush_batch()
+            self._loop = None
+            self.finished_at = time.monotonic()
+        return self.returncode
+
+    async def _read_stream_async(self, stream, name):
+        import codecs
+
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        pending = ''
+        while True:
+            data = await stream.read(64 * 1024)
+            pending += decoder.decode(data, final=not data)
+            *lines, pending = pending.split('\n')
+            for line in lines:
+                # Overlong lines go out in pieces, as readline(MAX_LINE_CHARS) hands them over
+                line += '\n'
+                for start in range(0, len(line), MAX_LINE_CHARS):
+                    self._add_line(name, line[start:start + MAX_LINE_CHARS])
+            while len(pending) > MAX_LINE_CHARS:
+                self._add_line(name, pending[:MAX_LINE_CHARS])
+                pending = pending[MAX_LINE_CHARS:]
+            if not data:
+                if pending:
+                    self._add_line(name, pending)
+                return
+
+    def _add_line(self, name, line):
+        self._batch.append((name, line))
+        self._keep(line)
+        if len(self._batch) >= self.batch_lines:
+            self._flush_batch()
+        elif self._flush_handle is None:
+            self._flush_handle = self._loop.call_later(self.batch_interval, self._flush_batch)
+
+    def _flush_batch(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._batch:
+            batch, self._batch = self._batch, []
+            self._emit(batch)
+
+    def kill(self):
+        """Ask a running command to stop; safe to call from any thread"""
+        self._kill_requested.set()
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._on_kill)
+            except RuntimeError:
+                # The loop already closed; the process went with it
+                pass
+
+    def _on_kill(self):
+        if self._process is not None and not self.killed:
+            self.killed = True
+            self._terminate()
+
+    def output(self):
+        """Output kept in memory (the tail, if the cap was reached)"""
+        return ''.join(self._kept)
+
+    def _read_stream(self, stream, name):
+        try:
+            for line in iter(lambda: stream.readline(MAX_LINE_CHARS), ''):
+                self._lines.put((name, line))
+        finally:
+            stream.close()
+            self._lines.put(None)
+
+    def _keep(self, line):
+        self._kept.append(line)
+        self._kept_bytes += len(line)
+        while self._kept_bytes > self.max_output_bytes and self._kept:
+            self._kept_bytes -= len(self._kept.popleft())
+            self.truncated = True
+
+    def _emit(self, batch):
+        if self.on_output:
+            self.on_output(batch)
+
+    def _terminate(self):
+        # asyncio processes have no poll(); the loop keeps their returncode current
+        poll = getattr(self._process, 'poll', None)
+        if (poll() if poll else self._process.returncode) is not None:
+            return
+        try:
+            if os.name == 'posix':
+                os.killpg(self._process.pid, signal.SIGKILL)
+            else:
+                self._process.kill()
+        except (ProcessLookupError, PermissionError):
+            pass
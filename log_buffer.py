@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Bounded in-memory log with batched delivery and a rotating spill file"""
+
+import collections
+import logging
+import logging.handlers
+import os
+import re
+import threading
+import time
+
+
+class LogBuffer:
+    """Ring buffer of log entries shared between worker threads and the UI
+
+    append() may be called from any thread; entries wait in a pending queue
+    until the UI drains them in one batch. The ring keeps the newest
+    entries holding up to max_lines lines in all, counting each line of a
+    multi-line message (a batch of command output), so it agrees with the
+    log widget; older entries are written to a rotating log file so they
+    can still be searched.
+    """
+
+    def __init__(self, max_lines=5000, spill_path=None, spill_max_bytes=5 * 1024 * 1024, spill_backups=5):
+        self.max_lines = max_lines
+        self.spill_path = spill_path
+        self.spill_backups = spill_backups
+        self.ring = collections.deque()
+        self._pending = collections.deque()
+        # Lines held by ring and _pending
+        self._ring_lines = 0
+        self._pending_lines = 0
+        self._lock = threading.Lock()
+        self._spill = None
+
+        if spill_path:
+            os.makedirs(os.path.dirname(os.path.abspath(spill_path)), exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                spill_path, maxBytes=spill_max_bytes, backupCount=spill_backups, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self._spill = logging.getLogger(f"{__name__}.{id(self)}")
+            self._spill.propagate = False
+            self._spill.setLevel(logging.INFO)
+            self._spill.addHandler(handler)
+
+    @staticmethod
+    def format_entry(entry):
+        timestamp, message, level = entry
+        return f"[{time.strftime('%H:%M:%S', time.localtime(timestamp))}] {message}"
+
+    @staticmethod
+    def _lines(entry):
+        return entry[1].count('\n') + 1
+
+    def append(self, message, level="INFO"):
+        """Queue a message for the next drain; safe from any thread"""
+        timestamp, level = time.time(), level.upper()
+        overflow = []
+        if message.count('\n') >= self.max_lines:
+            # Longer than the whole log: only its tail is kept in memory
+            lines = message.split('\n')
+            overflow.append((timestamp, '\n'.join(lines[:-self.max_lines]), level))
+            message = '\n'.join(lines[-self.max_lines:])
+        entry = (timestamp, message, level)
+        with self._lock:
+            self._pending.append(entry)
+            self._pending_lines += self._lines(entry)
+            # If the UI falls behind, the oldest pending entries go straight to disk
+            while self._pending_lines > self.max_lines:
+                dropped = self._pending.popleft()
+                self._pending_lines -= self._lines(dropped)
+                overflow.append(dropped)
+        self._write_spill(overflow)
+
+    def drain(self):
+        """Move pending entries into the ring and return them"""
+        with self._lock:
+            batch = list(self._pending)
+            lines = self._pending_lines
+            self._pending.clear()
+            self._pending_lines = 0
+        if not batch:
+            return batch
+        self.ring.extend(batch)
+        self._ring_lines += lines
+        evicted = []
+        while self._ring_lines > self.max_lines:
+            entry = self.ring.popleft()
+            self._ring_lines -= self._lines(entry)
+            evicted.append(entry)
+        self._write_spill(evicted)
+        return batch
+
+    def search(self, pattern, limit=1000):
+        """Find entries matching a regex, oldest first, in spilled files and the ring"""
+        regex = re.compile(pattern, re.IGNORECASE)
+        matches = collections.deque(maxlen=limit)
+        if self.spill_path:
+            # Rotated files are <name>.N (higher is older), then the live file
+            rotated = [f"{self.spill_path}.{i}" for i in range(self.spill_backups, 0, -1)]
+            for path in rotated + [self.spill_path]:
+                try:
+                    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                        matches.extend(line.rstrip('\n') for line in f if regex.search(line))
+                except FileNotFoundError:
+                    continue
+        matches.extend(self.format_entry(entry) for entry in self.ring if regex.search(entry[1]))
+        return list(matches)
+
+    def close(self):
+        """Spill everything still in memory and close the log file"""
+        self.drain()
+        self._write_spill(self.ring)
+        self.ring.clear()
+        self._ring_lines = 0
+        if self._spill:
+            for handler in list(self._spill.handlers):
+                handler.close()
+                self._spill.removeHandler(handler)
+
+    def _write_spill(self, entries):
+        if not self._spill:
+            return
+        for timestamp, message, level in entries:
+            stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+            self._spill.info("%s %-7s %s", stamp, level, message)
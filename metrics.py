@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""Command timing and serial traffic counters, exportable as JSON or Prometheus text"""
+
+import collections
+import json
+import math
+import threading
+import time
+
+from config_store import atomic_write
+from fanout import job_succeeded
+from scheduler import CANCELLED, DONE, FAILED
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class _Samples:
+    """Count and sum of all observations plus a window of recent ones for percentiles"""
+
+    def __init__(self, window):
+        self.count = 0
+        self.total = 0.0
+        self.recent = collections.deque(maxlen=window)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.recent.append(value)
+
+    def summary(self):
+        values = sorted(self.recent)
+        summary = {'count': self.count, 'sum': round(self.total, 6),
+                   'mean': round(self.total / self.count, 6) if self.count else None}
+        for q in QUANTILES:
+            # Nearest-rank percentile over the recent window
+            summary[f'p{int(q * 100)}'] = round(values[max(0, math.ceil(q * len(values)) - 1)], 6) if values else None
+        summary['max'] = round(values[-1], 6) if values else None
+        return summary
+
+
+class _ButtonStats:
+
+    def __init__(self, window):
+        self.queue_wait = _Samples(window)
+        self.execution = _Samples(window)
+        self.states = collections.Counter()
+        self.exit_codes = collections.Counter()
+
+
+class Metrics:
+    """Per-button queue wait and execution time, outcomes and exit codes
+
+    Buttons are told apart by (unit type, group, button text), since the
+    same text often appears in several unit types. observe_job() is meant
+    to be a job's done callback, so recording costs a few appends on the
+    worker thread that finished the job. Serial byte counts are read from
+    the sessions only when a snapshot is taken.
+    """
+
+    def __init__(self, window=1000, traffic=None):
+        self.window = window
+        self.traffic = traffic
+        self.started_at = time.time()
+        self._buttons = {}
+        self._lock = threading.Lock()
+
+    def track(self, job, label=None, unit_type=None, group=None):
+        """Record job under label once it finishes"""
+        job.add_done_callback(lambda finished: self.observe_job(finished, label, unit_type, group))
+
+    def observe_job(self, job, label=None, unit_type=None, group=None):
+        """Record a finished or cancelled scheduler job under label (its description by default)
+
+        unit_type and group name the button's unit type and group; leave
+        them out for commands that don't come from a button.
+        """
+        key = (unit_type or '', group or '', label or job.description)
+        state = job.state
+        if state == DONE and not job_succeeded(job):
+            state = FAILED
+        returncode = getattr(job.result, 'returncode', None)
+        with self._lock:
+            stats = self._buttons.get(key)
+            if stats is None:
+                stats = self._buttons[key] = _ButtonStats(self.window)
+            stats.states[state] += 1
+            if job.started_at is not None:
+                stats.queue_wait.add(job.started_at - job.submitted_at)
+                if job.finished_at is not None:
+                    stats.execution.add(job.finished_at - job.started_at)
+            elif state == CANCELLED and job.finished_at is not None:
+                stats.queue_wait.add(job.finished_at - job.submitted_at)
+            if returncode is not None:
+                stats.exit_codes[returncode] += 1
+
+    def reset(self):
+        with self._lock:
+            self._buttons.clear()
+            self.started_at = time.time()
+
+    def snapshot(self):
+        """Everything collected so far as plain data, buttons sorted by unit type, group and text"""
+        with self._lock:
+            buttons = [{
+                'unit_type': unit_type,
+                'group': group,
+                'button': label,
+                'runs': sum(stats.states.values()),
+                'states': dict(stats.states),
+                'exit_codes': {str(code): count for code, count in stats.exit_codes.items()},
+                'queue_wait': stats.queue_wait.summary(),
+                'execution': stats.execution.summary(),
+            } for (unit_type, group, label), stats in sorted(self._buttons.items())]
+        ports = {}
+        if self.traffic:
+            ports = {device: {'bytes_written': written, 'bytes_read': read}
+                     for device, (written, read) in self.traffic().items()}
+        return {'since': self.started_at, 'generated': time.time(), 'buttons': buttons, 'ports': ports}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2, ensure_ascii=False)
+
+    def to_prometheus(self):
+        """The snapshot in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = []
+
+        def label(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        def button_labels(stats):
+            return (f'unit_type="{label(stats["unit_type"])}",group="{label(stats["group"])}",'
+                    f'button="{label(stats["button"])}"')
+
+        for name, key, help_text in (
+                ('port_control_queue_wait_seconds', 'queue_wait', 'Time commands spent queued before starting'),
+                ('port_control_execution_seconds', 'execution', 'Time commands spent running')):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} summary"]
+            for stats in snapshot['buttons']:
+                summary = stats[key]
+                for q in QUANTILES:
+                    value = summary[f'p{int(q * 100)}']
+                    if value is not None:
+                        lines.append(f'{name}{{{button_labels(stats)},quantile="{q}"}} {value}')
+                lines.append(f'{name}_sum{{{button_labels(stats)}}} {summary["sum"]}')
+                lines.append(f'{name}_count{{{button_labels(stats)}}} {summary["count"]}')
+
+        lines += ["# HELP port_control_commands_total Finished commands by outcome",
+                  "# TYPE port_control_commands_total counter"]
+        for stats in snapshot['buttons']:
+            for state, count in sorted(stats['states'].items()):
+                lines.append(f'port_control_commands_total{{{button_labels(stats)},state="{state}"}} {count}')
+
+        lines += ["# HELP port_control_exit_codes_total Local command exit codes",
+                  "# TYPE port_control_exit_codes_total counter"]
+        for stats in snapshot['buttons']:
+            for code, count in sorted(stats['exit_codes'].items()):
+                lines.append(f'port_control_exit_codes_total{{{button_labels(stats)},code="{code}"}} {count}')
+
+        lines += ["# HELP port_control_serial_bytes_total Bytes moved over each serial port",
+                  "# TYPE port_control_serial_bytes_total counter"]
+        for device, counts in sorted(snapshot['ports'].items()):
+            lines.append(f'port_control_serial_bytes_total{{device="{label(device)}",direction="written"}} '
+                         f'{counts["bytes_written"]}')
+            lines.append(f'port_control_serial_bytes_total{{device="{label(device)}",direction="read"}} '
+                         f'{counts["bytes_read"]}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """Write the metrics atomically; .json files get JSON, anything else Prometheus text"""
+        data = self.to_json() if path.endswith('.json') else self.to_prometheus()
+        atomic_write(path, data)
+
+
+class MetricsExporter:
+    """Rewrites a metrics file every `interval` seconds on a background thread"""
+
+    def __init__(self, metrics, path, interval=15.0, on_error=None):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.on_error = on_error
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-export", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.export()
+
+    def export(self):
+        try:
+            self.metrics.export(self.path)
+        except OSError as e:
+            if self.on_error:
+                self.on_error(e)
+
+    def stop(self):
+        """Stop the timer and write the final numbers"""
+        self._stop.set()
+        self.export()
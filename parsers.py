@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""Parsers turning command output (ifconfig, route -n, ip addr, df -h, free -h) into records to diff between runs"""
+
+import collections
+import re
+import threading
+
+# Kinds of Change
+ADDED = 'added'
+REMOVED = 'removed'
+CHANGED = 'changed'
+
+PARSERS = {}
+
+
+class ParserError(Exception):
+    """Raised for an unknown parser name or a command no parser recognizes"""
+
+
+def register(cls):
+    """Class decorator adding an OutputParser subclass to PARSERS under its name"""
+    PARSERS[cls.name] = cls
+    return cls
+
+
+def find_parser(name, command):
+    """The parser class called name, or with name 'auto' the first whose pattern matches command"""
+    if name != 'auto':
+        try:
+            return PARSERS[name]
+        except KeyError:
+            raise ParserError(f"Unknown parser {name!r}; expected 'auto' or one of {', '.join(PARSERS)}") from None
+    for cls in PARSERS.values():
+        if cls.pattern and re.search(cls.pattern, command):
+            return cls
+    raise ParserError(f"No parser recognizes {command!r}; name one of {', '.join(PARSERS)}")
+
+
+_UNITS = {'': 1, 'b': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4, 'p': 1024 ** 5}
+_NUMBER = re.compile(r'^(-?\d+(?:[.,]\d+)?)\s*([kmgtp]?)(?:i?b?)?%?$', re.IGNORECASE)
+
+
+def _number(value):
+    """'1.5Gi', '21%', '812M' or '4096' as a float, or None"""
+    match = _NUMBER.match(value) if isinstance(value, str) else None
+    if not match:
+        return None
+    return float(match.group(1).replace(',', '.')) * _UNITS[match.group(2).lower()]
+
+
+class OutputParser:
+    """Reads a command's output line by line into records keyed by name
+
+    Subclasses set name, pattern (matched against a command to pick the
+    parser for 'auto'), noun and singular (what a record is called), and
+    implement feed(), which sees each line as it arrives and so can run on
+    output still streaming in. Lines it doesn't recognize, such as a serial
+    echo or prompt, are skipped.
+
+    Fields in volatile (traffic counters) are kept but never reported as
+    changed; fields in gauges (usage figures) are only reported when they
+    move by more than the tolerance given to diff_records().
+    """
+
+    name = None
+    pattern = None
+    noun = 'records'
+    singular = 'record'
+    volatile = frozenset()
+    gauges = frozenset()
+
+    def __init__(self):
+        # key -> {field: value}, in output order
+        self.records = {}
+        self.lines = 0
+
+    def feed(self, line):
+        raise NotImplementedError
+
+    def feed_lines(self, lines):
+        for line in lines:
+            self.lines += 1
+            self.feed(line.rstrip('\r\n'))
+
+    def close(self):
+        """End of output; returns the records"""
+        return self.records
+
+    def count(self, n):
+        """'1 route', '3 routes'"""
+        return f"{n} {self.singular if n == 1 else self.noun}"
+
+
+@register
+class IfconfigParser(OutputParser):
+    """ifconfig, in both the net-tools 2 layout and the older one BusyBox prints"""
+
+    name = 'ifconfig'
+    pattern = r'\bifconfig\b'
+    noun = 'interfaces'
+    singular = 'interface'
+    volatile = frozenset(('rx_packets', 'tx_packets', 'rx_bytes', 'tx_bytes'))
+
+    # eth0: flags=4163<UP,BROADCAST,RUNNING,MULTICAST>  mtu 1500
+    _HEADER = re.compile(r'^(\S+?):?\s+flags=\d+<([^>]*)>(?:\s+mtu\s+(\d+))?')
+    # eth0      Link encap:Ethernet  HWaddr 00:11:22:33:44:55
+    _OLD_HEADER = re.compile(r'^(\S+)\s+Link encap:(.*?)(?:\s+HWaddr\s+(\S+))?\s*$')
+    _FIELDS = [
+        (re.compile(r'\binet (?:addr:)?(\S+)'), 'inet'),
+        (re.compile(r'\b(?:netmask |Mask:)(\S+)'), 'netmask'),
+        (re.compile(r'\b(?:broadcast |Bcast:)(\S+)'), 'broadcast'),
+        (re.compile(r'\bether (\S+)'), 'mac'),
+        (re.compile(r'\bMTU:(\d+)'), 'mtu'),
+        (re.compile(r'\bRX packets[: ](\d+)'), 'rx_packets'),
+        (re.compile(r'\bTX packets[: ](\d+)'), 'tx_packets'),
+        (re.compile(r'\bRX (?:packets \d+\s+)?bytes[: ](\d+)'), 'rx_bytes'),
+        (re.compile(r'\bTX (?:packets \d+\s+)?bytes[: ](\d+)'), 'tx_bytes'),
+    ]
+    _INET6 = re.compile(r'\binet6 (?:addr:\s*)?(\S+)')
+    _COUNTERS = re.compile(r'\b(errors|dropped)[: ](\d+)')
+    _OLD_FLAGS = re.compile(r'^((?:[A-Z]+ )+)\s*MTU:')
+
+    def __init__(self):
+        super().__init__()
+        self.current = None
+
+    def feed(self, line):
+        if not line.strip():
+            self.current = None
+            return
+        if not line[0].isspace():
+            match = self._HEADER.match(line)
+            if match:
+                self.current = self.records[match.group(1)] = {'flags': match.group(2)}
+                if match.group(3):
+                    self.current['mtu'] = match.group(3)
+                return
+            match = self._OLD_HEADER.match(line)
+            if match:
+                self.current = self.records[match.group(1)] = {'link': match.group(2).strip()}
+                if match.group(3):
+                    self.current['mac'] = match.group(3).lower()
+                return
+            self.current = None
+            return
+        record = self.current
+        if record is None:
+            return
+        for regex, field in self._FIELDS:
+            match = regex.search(line)
+            if match:
+                record[field] = match.group(1)
+        match = self._INET6.search(line)
+        if match:
+            record['inet6'] = ' '.join(sorted(filter(None, record.get('inet6', '').split(' ') + [match.group(1)])))
+        match = self._OLD_FLAGS.match(line.strip() + ' ')
+        if match and 'flags' not in record:
+            record['flags'] = ','.join(match.group(1).split())
+        direction = line.split()[0]
+        if direction in ('RX', 'TX'):
+            for counter, value in self._COUNTERS.findall(line):
+                record[f"{direction.lower()}_{counter}"] = value
+
+
+@register
+class IpAddrParser(OutputParser):
+    """ip addr show (or ip a)"""
+
+    name = 'ip_addr'
+    pattern = r'\bip\s+(?:-\S+\s+)*a(?:ddr?(?:ess)?)?\b(?!\s+(?:add|del|flush|change|replace)\b)'
+    noun = 'interfaces'
+    singular = 'interface'
+
+    # 2: eth0@if5: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500 qdisc noqueue state UP group default
+    _HEADER = re.compile(r'^\d+:\s+([^:@\s]+)(?:@\S+)?:\s+<([^>]*)>(.*)$')
+    _OPTION = re.compile(r'\b(mtu|state|master)\s+(\S+)')
+    _LINK = re.compile(r'^\s+link/(\S+)(?:\s+(\S+))?')
+    _ADDRESS = re.compile(r'^\s+(inet6?)\s+(\S+)')
+
+    def __init__(self):
+        super().__init__()
+        self.current = None
+
+    def feed(self, line):
+        match = self._HEADER.match(line)
+        if match:
+            record = self.current = self.records[match.group(1)] = {'flags': match.group(2)}
+            for option, value in self._OPTION.findall(match.group(3)):
+                record[option] = value
+            return
+        record = self.current
+        if record is None or not line[:1].isspace():
+            self.current = None
+            return
+        match = self._LINK.match(line)
+        if match:
+            record['link'] = match.group(1)
+            if match.group(2):
+                record['mac'] = match.group(2)
+            return
+        match = self._ADDRESS.match(line)
+        if match:
+            family, address = match.groups()
+            record[family] = ' '.join(sorted(filter(None, record.get(family, '').split(' ') + [address])))
+
+
+class _TableParser(OutputParser):
+    """Output with a header row naming its columns, one record per row after it"""
+
+    # A token the header must contain
+    header_word = None
+
+    def __init__(self):
+        super().__init__()
+        self.columns = None
+
+    def feed(self, line):
+        words = line.split()
+        if self.columns is None:
+            if self.header_word in words:
+                self.columns = self.header(words)
+            return
+        if words:
+            self.row(words)
+
+    def header(self, words):
+        return [word.lower().replace('/', '_').replace('%', '') for word in words]
+
+    def row(self, words):
+        raise NotImplementedError
+
+
+@register
+class RouteParser(_TableParser):
+    """route -n (and netstat -rn), one record per destination, mask and interface"""
+
+    name = 'route'
+    # Not ip route, whose output has no header row
+    pattern = r'(?<!ip )\broute\b(?!\s+(?:add|del)\b)|\bnetstat\s+-\w*r'
+    noun = 'routes'
+    singular = 'route'
+    volatile = frozenset(('use', 'ref'))
+    header_word = 'Destination'
+
+    def row(self, words):
+        if len(words) < len(self.columns) - 1:
+            return
+        fields = dict(zip(self.columns, words))
+        if 'iface' not in fields and len(words) >= len(self.columns):
+            fields['iface'] = words[-1]
+        key = f"{fields.get('destination')}/{fields.get('genmask', '-')} dev {fields.get('iface', '?')}"
+        if fields.get('metric') not in (None, '0'):
+            key += f" metric {fields['metric']}"
+        self.records[key] = {field: value for field, value in fields.items()
+                             if field not in ('destination', 'genmask', 'iface')}
+
+
+@register
+class DfParser(_TableParser):
+    """df (-h or not), one record per mount point; long device names on their own line are joined up"""
+
+    name = 'df'
+    pattern = r'\bdf\b'
+    noun = 'filesystems'
+    singular = 'filesystem'
+    gauges = frozenset(('used', 'avail', 'available', 'use', 'capacity'))
+    header_word = 'Filesystem'
+
+    def __init__(self):
+        super().__init__()
+        self.wrapped = None
+
+    def header(self, words):
+        # "Mounted on" is one column
+        if words[-2:] == ['Mounted', 'on']:
+            words = words[:-2] + ['mounted']
+        return super().header(words)
+
+    def row(self, words):
+        if len(words) == 1:
+            self.wrapped = words[0]
+            return
+        if self.wrapped is not None:
+            words = [self.wrapped] + words
+            self.wrapped = None
+        count = len(self.columns)
+        if len(words) < count:
+            return
+        # A mount point may contain spaces
+        words = words[:count - 1] + [' '.join(words[count - 1:])]
+        fields = dict(zip(self.columns, words))
+        mounted = fields.pop('mounted', None) or fields['filesystem']
+        self.records[mounted] = fields
+
+
+@register
+class FreeParser(_TableParser):
+    """free (-h or not), one record per row: Mem, Swap and -/+ buffers/cache on older versions"""
+
+    name = 'free'
+    pattern = r'\bfree\b'
+    noun = 'memory rows'
+    singular = 'memory row'
+    gauges = frozenset(('used', 'free', 'shared', 'buff_cache', 'buffers', 'cached', 'available'))
+    header_word = 'total'
+
+    def row(self, words):
+        label, _, rest = ' '.join(words).partition(':')
+        if not rest:
+            return
+        values = rest.split()
+        # "-/+ buffers/cache:" has used and free only
+        columns = self.columns if len(values) > 2 or label == 'Swap' else ['used', 'free']
+        self.records[label.strip()] = dict(zip(columns, values))
+
+
+class Change:
+    """One difference between two runs: a record added, removed or changed"""
+
+    __slots__ = ('kind', 'key', 'fields')
+
+    def __init__(self, kind, key, fields):
+        self.kind = kind
+        self.key = key
+        # The record's fields when added or removed; {field: (old, new)} when changed
+        self.fields = fields
+
+    def __str__(self):
+        if self.kind == CHANGED:
+            return f"~ {self.key}: " + ', '.join(
+                f"{field} {old if old is not None else '-'} → {new if new is not None else '-'}"
+                for field, (old, new) in self.fields.items())
+        sign = '+' if self.kind == ADDED else '-'
+        return f"{sign} {self.key} " + ' '.join(f"{field}={value}" for field, value in self.fields.items())
+
+    def to_dict(self):
+        fields = self.fields
+        if self.kind == CHANGED:
+            fields = {field: {'old': old, 'new': new} for field, (old, new) in fields.items()}
+        return {'kind': self.kind, 'key': self.key, 'fields': fields}
+
+    @classmethod
+    def from_dict(cls, data):
+        fields = data['fields']
+        if data['kind'] == CHANGED:
+            fields = {field: (value['old'], value['new']) for field, value in fields.items()}
+        return cls(data['kind'], data['key'], fields)
+
+
+def _moved(old, new, tolerance):
+    a, b = _number(old), _number(new)
+    if a is None or b is None:
+        return old != new
+    return abs(a - b) > tolerance * max(abs(a), abs(b))
+
+
+def diff_records(old, new, parser_class=OutputParser, tolerance=0.05):
+    """Changes from one run's records to the next, in the new run's order, removals last
+
+    tolerance is the relative change below which the parser's gauges
+    count as unchanged; its volatile fields are never compared.
+    """
+    changes = []
+    for key, fields in new.items():
+        before = old.get(key)
+        if before is None:
+            changes.append(Change(ADDED, key, dict(fields)))
+            continue
+        changed = {}
+        for field in list(before) + [field for field in fields if field not in before]:
+            if field in parser_class.volatile:
+                continue
+            a, b = before.get(field), fields.get(field)
+            if a == b:
+                continue
+            if field in parser_class.gauges and a is not None and b is not None and not _moved(a, b, tolerance):
+                continue
+            changed[field] = (a, b)
+        if changed:
+            changes.append(Change(CHANGED, key, changed))
+    changes.extend(Change(REMOVED, key, dict(fields)) for key, fields in old.items() if key not in new)
+    return changes
+
+
+class ParseRun:
+    """Parsing of one run of a command on one target, fed as its output arrives"""
+
+    def __init__(self, parser, command, target):
+        self.parser = parser
+        self.command = command
+        self.target = target
+        # Set once the run is compared with the previous one: None for a
+        # first run, otherwise the (possibly empty) list of Changes
+        self.changes = None
+        self.summary = None
+
+
+class SnapshotStore:
+    """Last parsed records of each command on each target, which the next run is diffed against
+
+    Only the newest records of a (command, target) pair are kept, up to
+    max_entries pairs with the least recently run dropped first.
+    """
+
+    def __init__(self, tolerance=0.05, max_entries=2000):
+        self.tolerance = tolerance
+        self.max_entries = max_entries
+        self._snapshots = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def has(self, command, target):
+        with self._lock:
+            return (command, target) in self._snapshots
+
+    def get(self, command, target):
+        """Records of the last run of command on target, or None"""
+        with self._lock:
+            return self._snapshots.get((command, target))
+
+    def update(self, run):
+        """Store a finished run's records; returns its Changes, or None if there was no earlier run"""
+        records = run.parser.close()
+        key = (run.command, run.target)
+        with self._lock:
+            old = self._snapshots.pop(key, None)
+            self._snapshots[key] = records
+            while len(self._snapshots) > self.max_entries:
+                self._snapshots.popitem(last=False)
+        if old is None:
+            return None
+        return diff_records(old, records, type(run.parser), self.tolerance)
+
+    def clear(self):
+        with self._lock:
+            self._snapshots.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'snapshots': len(self._snapshots),
+                    'records': sum(len(records) for records in self._snapshots.values())}
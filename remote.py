@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""Running local-command groups on remote hosts over shared SSH connections"""
+
+import hashlib
+import os
+import shlex
+import subprocess
+import tempfile
+import threading
+
+
+class RemoteError(Exception):
+    """Raised when a host can't be connected to"""
+
+
+class RemoteHost:
+    """One entry of settings.remote_hosts"""
+
+    __slots__ = ('name', 'host', 'user', 'port', 'identity_file', 'max_sessions')
+
+    def __init__(self, name, host, user=None, port=None, identity_file=None, max_sessions=None):
+        self.name = name
+        self.host = host
+        self.user = user
+        self.port = port
+        self.identity_file = identity_file
+        # Commands run at once on this host (settings.ssh_max_sessions when None)
+        self.max_sessions = max_sessions
+
+    @property
+    def destination(self):
+        return f"{self.user}@{self.host}" if self.user else self.host
+
+    @property
+    def key(self):
+        return f"{self.destination}:{self.port or 22}"
+
+    def ssh_args(self):
+        args = []
+        if self.port:
+            args += ['-p', str(self.port)]
+        if self.identity_file:
+            args += ['-i', os.path.expanduser(self.identity_file)]
+        return args
+
+    def __repr__(self):
+        return f"<RemoteHost {self.name!r} {self.key}>"
+
+
+def remote_hosts(settings):
+    """Configured remote hosts by name, in config order
+
+    settings['remote_hosts'] may list 'user@host' strings or objects with
+    'host' and optional 'name', 'user', 'port', 'identity_file' and
+    'max_sessions'. A string's name is the string itself.
+    """
+    hosts = {}
+    for entry in settings.get('remote_hosts') or []:
+        if isinstance(entry, dict):
+            host = RemoteHost(entry.get('name') or entry['host'], entry['host'], user=entry.get('user'),
+                              port=entry.get('port'), identity_file=entry.get('identity_file'),
+                              max_sessions=entry.get('max_sessions'))
+        else:
+            user, _, address = entry.rpartition('@')
+            host = RemoteHost(entry, address, user=user or None)
+        hosts.setdefault(host.name, host)
+    return hosts
+
+
+def aggregate_output(outputs):
+    """Group (host name, output) pairs by identical output, most common first
+
+    Returns a list of (output, [host names]).
+    """
+    groups = {}
+    for name, output in outputs:
+        groups.setdefault(output, []).append(name)
+    return sorted(groups.items(), key=lambda item: -len(item[1]))
+
+
+def _join(argv):
+    # LocalCommand runs its command through the shell
+    return subprocess.list2cmdline(argv) if os.name == 'nt' else shlex.join(argv)
+
+
+class SSHPool:
+    """Persistent, multiplexed SSH connections, one per host
+
+    The first command for a host starts an OpenSSH control master in the
+    background; later commands open a session on the master's socket
+    instead of doing their own TCP connect, key exchange and login, which
+    is most of the cost of a short command. A master exits by itself after
+    persist idle seconds, and close() ends all of them. If a master's socket
+    is gone, ssh falls back to connecting directly.
+
+    ssh_command is the client to run, a string or an argument list, so a
+    stand-in script can take the place of ssh. With multiplex off every
+    command makes its own connection (OpenSSH on Windows has no control
+    masters).
+    """
+
+    def __init__(self, ssh_command='ssh', options=(), control_dir=None, persist=600, connect_timeout=10,
+                 multiplex=True):
+        self.ssh_command = shlex.split(ssh_command) if isinstance(ssh_command, str) else list(ssh_command)
+        self.options = list(options)
+        self.control_dir = control_dir
+        self.persist = persist
+        self.connect_timeout = connect_timeout
+        self.multiplex = multiplex
+        # Masters started by this pool: host key -> (host, control path)
+        self.masters = {}
+        self.connects = 0
+        self._host_locks = {}
+        self._lock = threading.Lock()
+
+    def _base(self, host):
+        return (self.ssh_command + ['-o', 'BatchMode=yes', '-o', f'ConnectTimeout={self.connect_timeout:g}']
+                + self.options + host.ssh_args())
+
+    def control_path(self, host):
+        """Socket of a host's master; hashed, since socket paths are limited to about 100 characters"""
+        if self.control_dir is None:
+            user = os.getuid() if hasattr(os, 'getuid') else os.getpid()
+            self.control_dir = os.path.join(tempfile.gettempdir(), f"port-control-ssh-{user}")
+        os.makedirs(self.control_dir, mode=0o700, exist_ok=True)
+        return os.path.join(self.control_dir, hashlib.sha1(host.key.encode()).hexdigest()[:16])
+
+    def command_line(self, host, command):
+        """Shell command line running command on host, through its master when multiplexing"""
+        argv = self._base(host)
+        if self.multiplex:
+            argv += ['-o', 'ControlMaster=no', '-o', f'ControlPath={self.control_path(host)}']
+        return _join(argv + [host.destination, command])
+
+    def connect(self, host):
+        """Start the host's master unless it is running; raises RemoteError if the host can't be reached"""
+        if not self.multiplex:
+            return
+        with self._lock:
+            lock = self._host_locks.setdefault(host.key, threading.Lock())
+        # Commands queued for a host while its master starts wait here, then share it
+        with lock:
+            path = self.control_path(host)
+            if host.key in self.masters and os.path.exists(path):
+                return
+            if os.path.exists(path) and self._control(host, path, 'check') == 0:
+                # Left running by an earlier run of the app
+                self.masters[host.key] = (host, path)
+                return
+            argv = self._base(host) + ['-M', '-N', '-f', '-o', 'ControlMaster=yes', '-o', f'ControlPath={path}',
+                                       '-o', f'ControlPersist={self.persist:g}', host.destination]
+            # stderr goes to a file: the backgrounded master would hold a pipe open
+            with tempfile.TemporaryFile(mode='w+', errors='replace') as stderr:
+                try:
+                    returncode = subprocess.run(argv, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                                stderr=stderr, timeout=self.connect_timeout + 5).returncode
+                except (OSError, subprocess.TimeoutExpired) as e:
+                    raise RemoteError(f"Cannot connect to {host.name}: {e}") from e
+                if returncode != 0:
+                    stderr.seek(0)
+                    message = stderr.read().strip() or f"ssh exited with code {returncode}"
+                    raise RemoteError(f"Cannot connect to {host.name}: {message}")
+            self.masters[host.key] = (host, path)
+            self.connects += 1
+
+    def _control(self, host, path, op):
+        try:
+            return subprocess.run(self._base(host) + ['-o', f'ControlPath={path}', '-O', op, host.destination],
+                                  stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                  timeout=5).returncode
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+
+    def stats(self):
+        return {'masters': len(self.masters), 'connects': self.connects}
+
+    def close(self):
+        """Stop the masters this pool started"""
+        with self._lock:
+            masters, self.masters = list(self.masters.values()), {}
+        for host, path in masters:
+            if os.path.exists(path):
+                self._control(host, path, 'exit')
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""Cached output of read-only local commands, for buttons marked cacheable"""
+
+import collections
+import threading
+import time
+
+# How lookup() answered
+CACHED = 'cached'
+JOINED = 'joined'
+STARTED = 'started'
+
+
+class CachedResult:
+    """Output of one finished command run, kept for ttl seconds
+
+    Stands in for the LocalCommand as a job's result, so the fan-out and
+    metrics code treats a cache hit like a run that took no time.
+    """
+
+    cached = True
+
+    def __init__(self, command, lines, returncode, ttl):
+        self.command = command
+        # (stream, line) tuples in the order they were printed
+        self.lines = lines
+        self.returncode = returncode
+        self.ttl = ttl
+        self.created = time.time()
+        self.expires = time.monotonic() + ttl
+        self.size = sum(len(line) for _, line in lines) + len(command)
+
+    @property
+    def age(self):
+        return time.time() - self.created
+
+    @property
+    def expired(self):
+        return time.monotonic() >= self.expires
+
+    def output(self):
+        return ''.join(line for _, line in self.lines)
+
+
+class OutputRecorder:
+    """Collects a running command's output batches for the cache, up to limit characters"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.lines = []
+        self.size = 0
+        self.overflow = False
+
+    def add(self, batch):
+        if self.overflow:
+            return
+        self.size += sum(len(line) for _, line in batch)
+        if self.size > self.limit:
+            # Too big to cache; stop holding on to it
+            self.overflow = True
+            self.lines = []
+            return
+        self.lines.extend(batch)
+
+
+class ResultCache:
+    """LRU cache of command output, capped at max_bytes, plus the runs in flight
+
+    Keys are rendered commands, so a button whose template now renders
+    differently (a setting changed) misses. Only clean runs are stored:
+    a non-zero exit, a timeout, a kill or truncated output is not reused.
+    """
+
+    def __init__(self, max_bytes=4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.joins = 0
+        self.misses = 0
+        self._results = collections.OrderedDict()
+        self._bytes = 0
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def get(self, command):
+        """The fresh CachedResult of a command, or None"""
+        with self._lock:
+            return self._get(command)
+
+    def _get(self, command):
+        result = self._results.get(command)
+        if result is not None and result.expired:
+            self._drop(command)
+            result = None
+        if result is not None:
+            self._results.move_to_end(command)
+        return result
+
+    def lookup(self, command, start):
+        """A cached result, the job already running the command, or a new job
+
+        Returns (CACHED, CachedResult), (JOINED, job) or (STARTED, job),
+        where the new job comes from calling start(); it is forgotten as
+        running once finish() is called for it. Checking and starting
+        happen under one lock, so two clicks can't both start the command.
+        """
+        with self._lock:
+            result = self._get(command)
+            if result is not None:
+                self.hits += 1
+                return CACHED, result
+            job = self._running.get(command)
+            if job is not None:
+                self.joins += 1
+                return JOINED, job
+            job = start()
+            if job is not None:
+                self.misses += 1
+                self._running[command] = job
+            return STARTED, job
+
+    def finish(self, command, job):
+        with self._lock:
+            if self._running.get(command) is job:
+                del self._running[command]
+
+    def put(self, command, lines, returncode, ttl):
+        """Store a clean run's output; returns the CachedResult, or None if it isn't kept"""
+        result = CachedResult(command, lines, returncode, ttl)
+        if result.size > self.max_bytes:
+            return None
+        with self._lock:
+            if command in self._results:
+                self._drop(command)
+            self._results[command] = result
+            self._bytes += result.size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._results)))
+        return result
+
+    def _drop(self, command):
+        self._bytes -= self._results.pop(command).size
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._results), 'bytes': self._bytes, 'running': len(self._running),
+                    'hits': self.hits, 'joins': self.joins, 'misses': self.misses}
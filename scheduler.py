@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""Command scheduling: ordered per-device serial queues and a bounded local pool"""
+
+import collections
+import itertools
+import threading
+import time
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class QueueFull(Exception):
+    """Raised when a lane has no room for another job"""
+
+
+class Job:
+    """A unit of work waiting in, or taken from, a scheduler lane"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, lane, description, func, args, kwargs):
+        self.id = next(self._ids)
+        self.lane = lane
+        self.description = description
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.state = PENDING
+        self.result = None
+        self.error = None
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        # Set by the submitter when the running job can be interrupted
+        self.kill_handler = None
+        # Set by the submitter when the job's output is parsed (a parsers.ParseRun)
+        self.parsed = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+
+    def cancel(self):
+        """Cancel the job if it hasn't started; returns True on success"""
+        with self._lock:
+            if self.state != PENDING:
+                return False
+            self.state = CANCELLED
+            self._finished.set()
+        self._run_callbacks()
+        return True
+
+    def kill(self):
+        """Interrupt a running job through its kill handler; returns True if one was called"""
+        if self.state == RUNNING and self.kill_handler:
+            self.kill_handler()
+            return True
+        return False
+
+    def add_done_callback(self, fn):
+        """Call fn(job) once the job finishes or is cancelled (immediately if it already has)"""
+        with self._lock:
+            if not self._finished.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def wait(self, timeout=None):
+        """Block until the job finishes or is cancelled"""
+        return self._finished.wait(timeout)
+
+    def _start(self):
+        with self._lock:
+            if self.state != PENDING:
+                return False
+            self.state = RUNNING
+            self.started_at = time.monotonic()
+            return True
+
+    def _finish(self, state, result=None, error=None):
+        with self._lock:
+            self.state = state
+            self.result = result
+            self.error = error
+            self.finished_at = time.monotonic()
+            self._finished.set()
+        self._run_callbacks()
+
+    def _run_callbacks(self):
+        with self._lock:
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            fn(self)
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.lane} {self.state}: {self.description}>"
+
+
+def finished_job(lane, description, result):
+    """A Job that is already done, for work answered without running anything"""
+    job = Job(lane, description, None, (), {})
+    job._start()
+    job._finish(DONE, result)
+    return job
+
+
+class _LaneBase:
+    """A bounded FIFO queue of jobs; subclasses decide how the jobs run"""
+
+    def __init__(self, name, workers, max_queue_size, on_change):
+        self.name = name
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+        self.pending = collections.deque()
+        self.running = []
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._on_change = on_change
+
+    def put(self, job, block=False, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while len(self.pending) >= self.max_queue_size:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if not block or (remaining is not None and remaining <= 0):
+                    raise QueueFull(f"Queue '{self.name}' is full ({self.max_queue_size} jobs waiting)")
+                self._cond.wait(remaining)
+            self.pending.append(job)
+            self._cond.notify_all()
+        self._on_change()
+
+    def depth(self):
+        with self._cond:
+            return len(self.pending)
+
+    def cancel_pending(self):
+        with self._cond:
+            cancelled = [job for job in self.pending if job.cancel()]
+            self.pending.clear()
+            self._cond.notify_all()
+        if cancelled:
+            self._on_change()
+        return cancelled
+
+    def cancel(self, job):
+        with self._cond:
+            if not job.cancel():
+                return False
+            self.pending.remove(job)
+            self._cond.notify_all()
+        self._on_change()
+        return True
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+
+class _Lane(_LaneBase):
+    """A FIFO queue drained by a fixed number of worker threads"""
+
+    def __init__(self, name, workers, max_queue_size, on_change):
+        super().__init__(name, workers, max_queue_size, on_change)
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"{name}-{i}", daemon=True).start()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self.pending and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    break
+                job = self.pending.popleft()
+                job._start()
+                self.running.append(job)
+                # Wake submitters waiting for room in the queue
+                self._cond.notify_all()
+            self._on_change()
+            try:
+                result = job.func(*job.args, **job.kwargs)
+                job._finish(DONE, result=result)
+            except Exception as e:
+                job._finish(FAILED, error=e)
+            finally:
+                with self._cond:
+                    self.running.remove(job)
+                self._on_change()
+
+
+class _AsyncLane(_LaneBase):
+    """A FIFO queue whose jobs run as tasks on an IOLoop, at most `workers` at a time
+
+    Coroutine functions run on the loop itself; plain functions run in the
+    loop's default executor so they can't stall it. No thread waits on an
+    idle lane.
+    """
+
+    def __init__(self, name, workers, max_queue_size, on_change, io_loop):
+        super().__init__(name, workers, max_queue_size, on_change)
+        self._io_loop = io_loop
+
+    def put(self, job, block=False, timeout=None):
+        super().put(job, block, timeout)
+        self._io_loop.call_soon(self._pump)
+
+    def _pump(self):
+        """Start pending jobs while there are free slots (runs on the loop thread)"""
+        started = False
+        while True:
+            with self._cond:
+                if self._stopped or not self.pending or len(self.running) >= self.workers:
+                    break
+                job = self.pending.popleft()
+                job._start()
+                self.running.append(job)
+                self._cond.notify_all()
+            task = self._io_loop.loop.create_task(self._run(job))
+            if job.kill_handler is None:
+                job.kill_handler = lambda task=task: self._io_loop.call_soon(task.cancel)
+            started = True
+        if started:
+            self._on_change()
+
+    async def _run(self, job):
+        import asyncio
+        import functools
+
+        try:
+            if asyncio.iscoroutinefunction(job.func):
+                result = await job.func(*job.args, **job.kwargs)
+            else:
+                result = await asyncio.get_running_loop().run_in_executor(
+                    None, functools.partial(job.func, *job.args, **job.kwargs))
+            job._finish(DONE, result=result)
+        except asyncio.CancelledError:
+            job._finish(CANCELLED)
+        except Exception as e:
+            job._finish(FAILED, error=e)
+        finally:
+            with self._cond:
+                self.running.remove(job)
+            self._on_change()
+            self._pump()
+
+
+class CommandScheduler:
+    """Runs commands without letting two writers share a serial port
+
+    Every serial device gets its own single-worker lane, so commands for a
+    port are written one at a time in the order they were submitted. Local
+    commands share one lane served by a bounded pool of workers, and every
+    remote host has a lane of its own with its session limit. Lanes have
+    a fixed capacity; submitting to a full lane raises QueueFull instead of
+    piling up more work.
+
+    Given an IOLoop, lanes run their jobs as tasks on it instead of on
+    worker threads, and max_local_workers only limits how many local
+    commands run at once.
+    """
+
+    LOCAL_LANE = 'local'
+
+    def __init__(self, max_local_workers=4, max_queue_size=100, on_change=None, io_loop=None):
+        self.max_local_workers = max_local_workers
+        self.max_queue_size = max_queue_size
+        self.on_change = on_change
+        self.io_loop = io_loop
+        self._lanes = {}
+        self._lock = threading.Lock()
+
+    def _lane(self, name, workers):
+        with self._lock:
+            lane = self._lanes.get(name)
+            if lane is None:
+                if self.io_loop is not None:
+                    lane = _AsyncLane(name, workers, self.max_queue_size, self._notify, self.io_loop)
+                else:
+                    lane = _Lane(name, workers, self.max_queue_size, self._notify)
+                self._lanes[name] = lane
+            return lane
+
+    def _notify(self):
+        if self.on_change:
+            self.on_change()
+
+    def submit_serial(self, device, func, *args, description='', block=False, timeout=None, **kwargs):
+        """Queue a job on the device's serial lane"""
+        job = Job(f"serial:{device}", description, func, args, kwargs)
+        self._lane(job.lane, 1).put(job, block, timeout)
+        return job
+
+    def submit_local(self, func, *args, description='', block=False, timeout=None, **kwargs):
+        """Queue a job on the shared local command pool"""
+        job = Job(self.LOCAL_LANE, description, func, args, kwargs)
+        self._lane(job.lane, self.max_local_workers).put(job, block, timeout)
+        return job
+
+    def submit_remote(self, host, func, *args, workers=4, description='', block=False, timeout=None, **kwargs):
+        """Queue a job on a remote host's lane, which runs at most workers jobs at once"""
+        job = Job(f"ssh:{host}", description, func, args, kwargs)
+        self._lane(job.lane, workers).put(job, block, timeout)
+        return job
+
+    def queue_depth(self):
+        """Number of pending jobs per lane"""
+        with self._lock:
+            lanes = list(self._lanes.values())
+        return {lane.name: lane.depth() for lane in lanes}
+
+    def active_jobs(self):
+        """Running and pending jobs across all lanes, oldest first"""
+        with self._lock:
+            lanes = list(self._lanes.values())
+        jobs = []
+        for lane in lanes:
+            with lane._cond:
+                jobs.extend(lane.running)
+                jobs.extend(lane.pending)
+        return sorted(jobs, key=lambda job: job.id)
+
+    def cancel(self, job):
+        """Cancel one pending job; returns False if it already started"""
+        with self._lock:
+            lane = self._lanes.get(job.lane)
+        return lane.cancel(job) if lane else job.cancel()
+
+    def cancel_pending(self, lane=None):
+        """Cancel jobs that haven't started, in one lane or everywhere"""
+        with self._lock:
+            if lane is None:
+                lanes = list(self._lanes.values())
+            else:
+                lanes = [self._lanes[lane]] if lane in self._lanes else []
+        cancelled = []
+        for item in lanes:
+            cancelled.extend(item.cancel_pending())
+        return cancelled
+
+    def shutdown(self, cancel_pending=True):
+        """Stop all workers after the jobs already running finish"""
+        if cancel_pending:
+            self.cancel_pending()
+        with self._lock:
+            lanes = list(self._lanes.values())
+            self._lanes.clear()
+        for lane in lanes:
+            lane.stop()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""Multi-step sequences mixing serial and local commands"""
+
+import re
+import threading
+import time
+
+from local_command import LocalCommand
+from serial_session import SerialError
+
+
+class SequenceError(Exception):
+    """Raised when a sequence definition in the config is invalid
+
+    step is the index (from 0) of the bad step and key the bad key in it,
+    when the problem is that specific.
+    """
+
+    def __init__(self, message, step=None, key=None):
+        super().__init__(message)
+        self.step = step
+        self.key = key
+
+
+class StepFailed(Exception):
+    """Raised when a step fails after all of its retries"""
+
+
+class Sequence:
+    """A named list of steps parsed from a 'sequence' button
+
+    Each step is a dict with an action of send_to_serial, run_local_command
+    or delay. Optional step keys:
+      wait_for          regex (or true for the prompt) to wait for after a serial send
+      expect            regex the step's output must contain
+      timeout           seconds allowed for the step
+      retries           extra attempts before the step counts as failed
+      retry_delay       seconds between attempts
+      continue_on_error keep going if this step fails
+    """
+
+    ACTIONS = ('send_to_serial', 'run_local_command', 'delay')
+
+    def __init__(self, name, steps):
+        self.name = name
+        self.steps = steps
+        self._validate()
+
+    @classmethod
+    def from_config(cls, btn_config):
+        return cls(btn_config.get('text', 'Sequence'), btn_config.get('steps', []))
+
+    # Optional step keys holding numbers: (smallest value allowed, must be whole)
+    NUMBER_KEYS = {'seconds': (0, False), 'timeout': (0, False), 'retries': (0, True), 'retry_delay': (0, False)}
+
+    def _validate(self):
+        if not isinstance(self.steps, list):
+            raise SequenceError(f"Sequence '{self.name}' steps must be a list")
+        if not self.steps:
+            raise SequenceError(f"Sequence '{self.name}' has no steps")
+        for i, step in enumerate(self.steps):
+            where = f"Sequence '{self.name}' step {i + 1}"
+            if not isinstance(step, dict):
+                raise SequenceError(f"{where}: expected an object, got {step!r}", i)
+            action = step.get('action')
+            if action not in self.ACTIONS:
+                raise SequenceError(f"{where}: unknown action '{action}'", i, 'action')
+            if action == 'delay':
+                if 'seconds' not in step:
+                    raise SequenceError(f"{where}: delay needs 'seconds'", i, 'seconds')
+            elif not isinstance(step.get('command'), str) or not step['command']:
+                raise SequenceError(f"{where}: '{action}' needs a command", i, 'command')
+            for key, (minimum, whole) in self.NUMBER_KEYS.items():
+                if key in step and not _is_number(step[key], minimum, whole):
+                    expected = "a whole number" if whole else "a number"
+                    raise SequenceError(f"{where}: {key} must be {expected} of at least {minimum}, "
+                                        f"got {step[key]!r}", i, key)
+            for key in ('wait_for', 'expect'):
+                value = step.get(key)
+                if value is None or (key == 'wait_for' and isinstance(value, bool)):
+                    continue
+                if not isinstance(value, str):
+                    raise SequenceError(f"{where}: {key} must be a regular expression, got {value!r}", i, key)
+                try:
+                    re.compile(value)
+                except re.error as e:
+                    raise SequenceError(f"{where}: invalid {key} regex: {e}", i, key)
+            if not isinstance(step.get('continue_on_error', False), bool):
+                raise SequenceError(f"{where}: continue_on_error must be true or false", i, 'continue_on_error')
+
+
+def _is_number(value, minimum, whole):
+    if isinstance(value, bool):
+        return False
+    if whole:
+        # The runner reads these with int()
+        return ((isinstance(value, int) or (isinstance(value, str) and value.strip().isdigit()))
+                and int(value) >= minimum)
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return False
+    return number >= minimum and (not whole or number == int(number))
+
+
+class SequenceRunner:
+    """Runs a Sequence's steps one after another as a single job
+
+    A step moves on as soon as its condition is met (a prompt arrives, a
+    command exits), so the whole sequence takes no longer than the device
+    needs. The first failing step aborts the run unless it is marked
+    continue_on_error.
+    """
+
+    def __init__(self, sequence, session, format_command, log, on_output=None,
+                 serial_timeout=10, local_timeout=None):
+        self.sequence = sequence
+        self.session = session
+        self.format_command = format_command
+        self.log = log
+        self.on_output = on_output
+        self.serial_timeout = serial_timeout
+        self.local_timeout = local_timeout
+
+        self._aborted = threading.Event()
+        self._process = None
+
+    def abort(self):
+        """Stop after the current step; a running local command is killed"""
+        self._aborted.set()
+        process = self._process
+        if process is not None:
+            process.kill()
+
+    def run(self):
+        """Run every step; returns True if the sequence completed"""
+        name = self.sequence.name
+        total = len(self.sequence.steps)
+        started = time.monotonic()
+        self.log(f"▶ Sequence '{name}' started ({total} steps)")
+
+        for index, step in enumerate(self.sequence.steps, 1):
+            if self._aborted.is_set():
+                self.log(f"Sequence '{name}' aborted before step {index}/{total}", "WARNING")
+                return False
+            try:
+                self._run_with_retries(index, total, step)
+            except StepFailed as e:
+                if step.get('continue_on_error'):
+                    self.log(f"Sequence '{name}' step {index}/{total} failed, continuing: {e}", "WARNING")
+                    continue
+                self.log(f"Sequence '{name}' aborted at step {index}/{total}: {e}", "ERROR")
+                return False
+
+        self.log(f"Sequence '{name}' finished in {time.monotonic() - started:.2f}s", "SUCCESS")
+        return True
+
+    def _run_with_retries(self, index, total, step):
+        attempts = 1 + int(step.get('retries', 0))
+        for attempt in range(1, attempts + 1):
+            description = self._describe(step)
+            suffix = f" (attempt {attempt}/{attempts})" if attempt > 1 else ""
+            self.log(f"[{self.sequence.name}] Step {index}/{total}: {description}{suffix}")
+            try:
+                self._run_step(step)
+                return
+            except StepFailed as e:
+                if self._aborted.is_set() or attempt == attempts:
+                    raise
+                self.log(f"[{self.sequence.name}] Step {index}/{total} failed: {e}", "WARNING")
+                if self._aborted.wait(float(step.get('retry_delay', 1))):
+                    raise StepFailed("aborted")
+
+    def _describe(self, step):
+        if step['action'] == 'delay':
+            return f"wait {step['seconds']}s"
+        return f"{step['action']} '{self.format_command(step['command'])}'"
+
+    def _run_step(self, step):
+        action = step['action']
+        if action == 'delay':
+            if self._aborted.wait(float(step['seconds'])):
+                raise StepFailed("aborted")
+            return
+
+        command = self.format_command(step['command'])
+        if action == 'send_to_serial':
+            output = self._send_serial(command, step)
+        else:
+            output = self._run_local(command, step)
+
+        expect = step.get('expect')
+        if expect and not re.search(expect, output, re.MULTILINE):
+            raise StepFailed(f"output did not match '{expect}'")
+
+    def _send_serial(self, command, step):
+        wait_for = step.get('wait_for')
+        try:
+            if not wait_for:
+                self.session.write_line(command)
+                return ''
+            lines = self.session.send_and_wait(command, pattern=None if wait_for is True else wait_for,
+                                               timeout=float(step.get('timeout', self.serial_timeout)))
+            return '\n'.join(lines)
+        except SerialError as e:
+            raise StepFailed(str(e)) from e
+
+    def _run_local(self, command, step):
+        timeout = step.get('timeout', self.local_timeout)
+        process = LocalCommand(command, on_output=self.on_output, timeout=float(timeout) if timeout else None)
+        self._process = process
+        try:
+            returncode = process.run()
+        except OSError as e:
+            raise StepFailed(str(e)) from e
+        finally:
+            self._process = None
+        if process.timed_out:
+            raise StepFailed(f"timed out after {process.timeout:g}s")
+        if process.killed:
+            raise StepFailed("killed")
+        if returncode != 0:
+            raise StepFailed(f"exited with code {returncode}")
+        return process.output()
@@ -0,0 +1,778 @@
+#!/usr/bin/env python3
+"""Persistent serial port sessions shared by all serial command buttons"""
+
+import os
+import re
+import select
+import sys
+import threading
+import time
+
+# Parity names accepted in config.json, mapped to pyserial's single-letter codes
+PARITY_CODES = {
+    'n': 'N', 'none': 'N',
+    'e': 'E', 'even': 'E',
+    'o': 'O', 'odd': 'O',
+    'm': 'M', 'mark': 'M',
+    's': 'S', 'space': 'S',
+}
+
+
+# Default prompt: a login prompt or a shell prompt ending in #, $ or >
+DEFAULT_PROMPT = r'(login:|[#$>])\s*$'
+
+# Flow control names accepted in config.json: none, software (XON/XOFF) or hardware (RTS/CTS)
+FLOW_CONTROLS = ('none', 'xonxoff', 'rtscts')
+
+
+class SerialError(Exception):
+    """Raised when a serial port cannot be opened or written"""
+
+
+class SerialTimeout(SerialError):
+    """Raised when the device doesn't answer in time; .lines holds what did arrive"""
+
+    def __init__(self, message, lines=()):
+        super().__init__(message)
+        self.lines = list(lines)
+
+
+class SerialWriteTimeout(SerialError):
+    """Raised when a write can't finish within the port's write_timeout (like pyserial's SerialTimeoutException)"""
+
+    def __init__(self, message, written=None):
+        super().__init__(message)
+        # Bytes that did go out, when known
+        self.written = written
+
+
+class _ResponseWaiter:
+    """Collects lines for send_and_wait until its pattern matches"""
+
+    def __init__(self, regex, on_done=None):
+        self.regex = regex
+        self.lines = []
+        self.done = threading.Event()
+        self.on_done = on_done
+
+    def feed(self, line, partial=False):
+        if self.done.is_set():
+            return
+        if not partial:
+            self.lines.append(line)
+        if self.regex.search(line):
+            if partial:
+                self.lines.append(line)
+            self.done.set()
+            if self.on_done:
+                self.on_done()
+
+
+class _MatchCounter:
+    """Counts lines matching a pattern, for send_lines to know how many lines were answered
+
+    A partial line (a prompt without a newline) is counted once, and not
+    again when the rest of that line arrives. When answers come in faster
+    than they are read, a prompt shares its line with the echo of the next
+    command sent ("switch# show version"); with the sent lines given, the
+    echo is cut off such a line before matching.
+    """
+
+    def __init__(self, regex, sent=(), lookahead=1):
+        self.regex = regex
+        self.sent = sent
+        self.lookahead = lookahead
+        self.count = 0
+        self._partial = None
+        self._changed = threading.Condition()
+
+    def feed(self, line, partial=False):
+        if partial:
+            if self._partial is None and self.regex.search(line):
+                self._partial = line
+                self._hit()
+            return
+        counted, self._partial = self._partial, None
+        if counted is not None and line.startswith(counted):
+            return
+        if self.regex.search(line):
+            self._hit()
+            return
+        for echo in self.sent[self.count:self.count + self.lookahead + 1]:
+            if echo and line.endswith(echo) and self.regex.search(line[:-len(echo)]):
+                self._hit()
+                return
+
+    def _hit(self):
+        with self._changed:
+            self.count += 1
+            self._changed.notify_all()
+
+    def wait(self, count, timeout):
+        """Wait until count lines matched; returns False on timeout"""
+        with self._changed:
+            return self._changed.wait_for(lambda: self.count >= count, timeout)
+
+
+class _PosixPort:
+    """Minimal termios-backed port used when pyserial is not installed"""
+
+    def __init__(self, device, baudrate, parity, bytesize, stopbits, flow_control='none', write_timeout=None):
+        import termios
+
+        self.device = device
+        # Seconds write() and flush() may wait while the device holds off output; None waits forever
+        self.write_timeout = write_timeout
+        # Non-blocking: open() doesn't wait for carrier detect, and writes wait in select() with a timeout
+        self.fd = os.open(device, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        try:
+            if os.isatty(self.fd):
+                self._configure(termios, baudrate, parity, bytesize, stopbits, flow_control)
+        except Exception:
+            os.close(self.fd)
+            raise
+
+    def _configure(self, termios, baudrate, parity, bytesize, stopbits, flow_control):
+        speed = getattr(termios, f"B{baudrate}", None)
+        if speed is None:
+            raise SerialError(f"Unsupported baud rate: {baudrate}")
+
+        iflag, oflag, cflag, lflag, _, _, cc = termios.tcgetattr(self.fd)
+
+        # Raw mode: no echo, no line editing, no output post-processing
+        iflag &= ~(termios.IGNBRK | termios.BRKINT | termios.PARMRK | termios.ISTRIP |
+                   termios.INLCR | termios.IGNCR | termios.ICRNL | termios.IXON | termios.IXOFF | termios.IXANY)
+        oflag &= ~termios.OPOST
+        lflag &= ~(termios.ECHO | termios.ECHONL | termios.ICANON | termios.ISIG | termios.IEXTEN)
+
+        cflag &= ~(termios.CSIZE | termios.PARENB | termios.PARODD | termios.CSTOPB)
+        cflag |= termios.CLOCAL | termios.CREAD
+        cflag |= {5: termios.CS5, 6: termios.CS6, 7: termios.CS7, 8: termios.CS8}[bytesize]
+        if parity in ('E', 'O'):
+            cflag |= termios.PARENB
+            if parity == 'O':
+                cflag |= termios.PARODD
+        elif parity != 'N':
+            raise SerialError(f"Parity '{parity}' requires pyserial")
+        if stopbits == 2:
+            cflag |= termios.CSTOPB
+
+        # The driver then holds back output while the device asks it to
+        crtscts = getattr(termios, 'CRTSCTS', 0)
+        cflag &= ~crtscts
+        if flow_control == 'xonxoff':
+            iflag |= termios.IXON | termios.IXOFF
+        elif flow_control == 'rtscts':
+            if not crtscts:
+                raise SerialError("RTS/CTS flow control requires pyserial on this platform")
+            cflag |= crtscts
+
+        cc[termios.VMIN] = 0
+        cc[termios.VTIME] = 0
+        termios.tcsetattr(self.fd, termios.TCSANOW, [iflag, oflag, cflag, lflag, speed, speed, cc])
+
+    def _deadline(self):
+        return None if self.write_timeout is None else time.monotonic() + self.write_timeout
+
+    def write(self, data):
+        view = memoryview(data)
+        deadline = self._deadline()
+        while view:
+            try:
+                written = os.write(self.fd, view)
+            except BlockingIOError:
+                written = 0
+            except OSError as e:
+                # Lets the session tell a write that sent nothing from a partial one
+                e.written = len(data) - len(view)
+                raise
+            view = view[written:]
+            if not view:
+                break
+            # The driver's buffer is full: the device is holding off (XOFF, CTS) or slow
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise SerialWriteTimeout(f"Write timeout after {len(data) - len(view)} of {len(data)} bytes",
+                                         len(data) - len(view))
+            select.select([], [self.fd], [], remaining)
+        return len(data)
+
+    def flush(self):
+        """Wait until the driver has sent everything, for at most write_timeout"""
+        if not os.isatty(self.fd):
+            return
+        import termios
+        outq = getattr(termios, 'TIOCOUTQ', None)
+        if outq is None:
+            termios.tcdrain(self.fd)
+            return
+        import fcntl
+        import struct
+        deadline = self._deadline()
+        while True:
+            try:
+                pending = struct.unpack('i', fcntl.ioctl(self.fd, outq, b'\0\0\0\0'))[0]
+            except OSError:
+                # Not every driver reports its queue; a pty doesn't hold output back anyway
+                return
+            if not pending:
+                return
+            if deadline is not None and time.monotonic() >= deadline:
+                raise SerialWriteTimeout(f"Write timeout: {pending} bytes still waiting to be sent")
+            time.sleep(0.005)
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def open_port(device, baudrate=115200, parity='N', bytesize=8, stopbits=1, write_timeout=2, flow_control='none'):
+    """Open a serial port with pyserial, falling back to termios on POSIX"""
+    try:
+        import serial
+    except ImportError:
+        serial = None
+
+    try:
+        if serial is not None:
+            return serial.Serial(device, baudrate=baudrate, parity=parity, bytesize=bytesize,
+                                 stopbits=stopbits, timeout=0, write_timeout=write_timeout,
+                                 xonxoff=flow_control == 'xonxoff', rtscts=flow_control == 'rtscts')
+        if os.name == 'posix':
+            return _PosixPort(device, baudrate, parity, bytesize, stopbits, flow_control, write_timeout)
+    except (OSError, ValueError) as e:
+        raise SerialError(f"Cannot open {device}: {e}") from e
+    raise SerialError(f"pyserial is required to open {device} on {sys.platform}")
+
+
+class SerialSession:
+    """A long-lived connection to one serial device
+
+    The port is opened on first use and kept open between commands. If the
+    port can't be opened, or a write fails before sending anything (for
+    example after a USB-serial adapter is unplugged), the port is reopened
+    and the write tried again. A write that may have sent part of the data
+    is never repeated, so a command can't reach the device twice.
+
+    An optional reader thread waits on the port with select(), splits what
+    the device sends into lines and passes them to on_line. A trailing
+    partial line that matches the prompt regex (e.g. "login: ") is reported
+    straight away, without waiting for a newline.
+
+    Given an IOLoop (on POSIX), the port is watched with add_reader()
+    instead and no reader thread is started; on_line is then called from
+    the loop thread. Code on the loop thread never blocks on the session
+    lock, so writers may hold it while waiting for the loop.
+
+    suspend() hands the device to another program (a terminal window): the
+    port is closed and stays closed, and writes fail, until resume().
+    """
+
+    # A partial line is reported after this many seconds without new data
+    PARTIAL_LINE_DELAY = 0.5
+
+    def __init__(self, device, baudrate=115200, parity='N', bytesize=8, stopbits=1,
+                 reconnect_attempts=3, reconnect_delay=1.0, prompt=DEFAULT_PROMPT, on_write=None, io_loop=None,
+                 flow_control='none', write_timeout=2.0):
+        self.device = device
+        self.baudrate = int(baudrate)
+        self.parity = PARITY_CODES.get(str(parity).lower(), str(parity).upper())
+        self.bytesize = int(bytesize)
+        self.stopbits = int(stopbits)
+        self.flow_control = flow_control
+        # Seconds a write may stay blocked, e.g. while the device holds XOFF
+        self.write_timeout = write_timeout
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_delay = reconnect_delay
+
+        self.prompt_regex = re.compile(prompt) if prompt else None
+        # on_write(device, data) sees every successful write, e.g. for session capture
+        self.on_write = on_write
+
+        self._port = None
+        self._lock = threading.RLock()
+        # Why the port may not be opened, while suspended
+        self._suspended = None
+        self._resume_reader = False
+        self._on_line = None
+        self._reader = None
+        self._reader_stop = threading.Event()
+        self._waiters = []
+        self._waiters_lock = threading.Lock()
+
+        # Line assembly state shared by the reader thread and the loop callbacks
+        self._buffer = b''
+        self._last_data = time.monotonic()
+
+        # Loop-driven reading; the handles and _attached_fd are only touched on the loop thread
+        self.io_loop = io_loop if os.name == 'posix' else None
+        self._watching = False
+        self._attached_fd = None
+        self._retry_handle = None
+        self._partial_handle = None
+
+        # Traffic counters for metrics; each is only updated by one thread at a time
+        self.bytes_written = 0
+        self.bytes_read = 0
+
+    @property
+    def is_open(self):
+        return self._port is not None
+
+    def open(self):
+        """Open the port if it isn't open already"""
+        with self._lock:
+            if self._suspended:
+                raise SerialError(f"{self.device} {self._suspended}")
+            if self._port is None:
+                self._port = open_port(self.device, self.baudrate, self.parity, self.bytesize, self.stopbits,
+                                       write_timeout=self.write_timeout, flow_control=self.flow_control)
+                if self._watching:
+                    self.io_loop.call_soon(self._attach)
+            return self._port
+
+    def close(self):
+        """Close the port; the next write reopens it"""
+        with self._lock:
+            if self._port is not None:
+                if self._attached_fd is not None and self.io_loop.running:
+                    # The fd must leave the loop's selector before it is closed and reused
+                    self.io_loop.call(self._detach)
+                try:
+                    self._port.close()
+                except OSError:
+                    pass
+                self._port = None
+
+    def _discard(self, port):
+        """Close the port only if a writer hasn't already replaced it"""
+        with self._lock:
+            if port is not None and port is self._port:
+                self.close()
+
+    @property
+    def suspended(self):
+        return self._suspended is not None
+
+    def suspend(self, reason):
+        """Close the port and keep it closed until resume(); open() raises SerialError with reason"""
+        self._suspended = reason
+        self._resume_reader = self._resume_reader or self.reading
+        self.stop_reader()
+        self.close()
+
+    def resume(self):
+        """Allow the port to be opened again, restarting the reader if suspend() stopped it"""
+        self._suspended = None
+        if self._resume_reader:
+            self._resume_reader = False
+            self.start_reader()
+
+    def reconnect(self):
+        """Close and reopen the port, retrying while the device is absent"""
+        with self._lock:
+            self.close()
+            if self._suspended:
+                raise SerialError(f"{self.device} {self._suspended}")
+            last_error = None
+            for attempt in range(self.reconnect_attempts):
+                if attempt:
+                    time.sleep(self.reconnect_delay)
+                try:
+                    return self.open()
+                except SerialError as e:
+                    last_error = e
+            raise last_error
+
+    def write(self, data):
+        """Write raw bytes, reconnecting once if the port has gone away and nothing was sent"""
+        with self._lock:
+            try:
+                port = self.open()
+            except SerialError:
+                port = self.reconnect()
+            if not self._write_port(port, data, retry=True):
+                self._write_port(self.reconnect(), data, retry=False)
+            self.bytes_written += len(data)
+        if self.on_write:
+            self.on_write(self.device, data)
+        return len(data)
+
+    def _write_port(self, port, data, retry):
+        """Write and drain; False if that failed before a byte went out and may be retried"""
+        try:
+            port.write(data)
+            port.flush()
+        except (OSError, SerialError) as e:
+            self.close()
+            # Only the termios port knows how much went out; with pyserial a
+            # failed write may always have been partial. A device holding off
+            # output won't take it any sooner on a reopened port
+            if retry and getattr(e, 'written', None) == 0 and not isinstance(e, SerialWriteTimeout):
+                return False
+            raise SerialError(f"Write to {self.device} failed: {e}") from e
+        return True
+
+    def write_line(self, text, line_ending="\r\n"):
+        """Send one command line to the device"""
+        return self.write(f"{text}{line_ending}".encode('utf-8'))
+
+    def _response_regex(self, pattern):
+        regex = re.compile(pattern) if pattern else self.prompt_regex
+        if regex is None:
+            raise SerialError("No response pattern given and no prompt configured")
+        return regex
+
+    def send_and_wait(self, text, pattern=None, timeout=10.0):
+        """Send a line and return the lines received until pattern (or the prompt) matches"""
+        regex = self._response_regex(pattern)
+        waiter = _ResponseWaiter(regex)
+        with self._waiters_lock:
+            self._waiters.append(waiter)
+        try:
+            self.start_reader()
+            self.write_line(text)
+            if not waiter.done.wait(timeout):
+                raise SerialTimeout(
+                    f"No response matching '{regex.pattern}' from {self.device} within {timeout:g}s",
+                    waiter.lines)
+            return waiter.lines
+        finally:
+            with self._waiters_lock:
+                self._waiters.remove(waiter)
+
+    async def send_and_wait_async(self, text, pattern=None, timeout=10.0):
+        """send_and_wait() for the session's IOLoop: no thread waits for the response
+
+        Only the write itself, which may block on flow control or tcdrain,
+        runs in the loop's executor.
+        """
+        import asyncio
+
+        regex = self._response_regex(pattern)
+        loop = asyncio.get_running_loop()
+        answered = loop.create_future()
+
+        def resolve():
+            if not answered.done():
+                answered.set_result(None)
+        waiter = _ResponseWaiter(regex, on_done=lambda: loop.call_soon_threadsafe(resolve))
+        with self._waiters_lock:
+            self._waiters.append(waiter)
+        try:
+            self.start_reader()
+            await loop.run_in_executor(None, self.write_line, text)
+            try:
+                await asyncio.wait_for(answered, timeout)
+            except asyncio.TimeoutError:
+                raise SerialTimeout(
+                    f"No response matching '{regex.pattern}' from {self.device} within {timeout:g}s",
+                    waiter.lines) from None
+            return waiter.lines
+        finally:
+            with self._waiters_lock:
+                self._waiters.remove(waiter)
+
+    def send_lines(self, lines, line_ending="\r\n", line_delay=0.0, wait_for=None, window=1, timeout=10.0,
+                   chunk_lines=64, on_progress=None, stop=None):
+        """Send many command lines as one paced stream; returns how many were sent
+
+        Without wait_for, lines go out back to back, chunk_lines per write,
+        or one at a time line_delay seconds apart. With wait_for (True for
+        the prompt, or a regex) each line is expected to be answered by a
+        match, and at most window lines are sent ahead of the answers, so
+        a slow console is never more than window lines behind; timeout is
+        how long to wait for an answer before giving up. XON/XOFF or RTS/CTS,
+        when configured, pause each write in the driver until the device
+        is ready. on_progress(sent, total) is called after every write, and
+        setting the stop Event ends the stream after the current write.
+        """
+        lines = list(lines)
+        counter = None
+        if wait_for:
+            counter = _MatchCounter(self._response_regex(None if wait_for is True else wait_for), lines,
+                                    max(1, int(window)))
+            with self._waiters_lock:
+                self._waiters.append(counter)
+            self.start_reader()
+        window = max(1, int(window))
+        sent = 0
+        try:
+            while sent < len(lines):
+                if stop is not None and stop.is_set():
+                    break
+                if sent and line_delay:
+                    if stop is not None:
+                        if stop.wait(line_delay):
+                            break
+                    else:
+                        time.sleep(line_delay)
+                if counter is not None:
+                    self._wait_for_answers(counter, sent - window + 1, timeout, sent)
+                    count = 1 if line_delay else window - (sent - counter.count)
+                else:
+                    count = 1 if line_delay else chunk_lines
+                chunk = lines[sent:sent + count]
+                self.write(''.join(f"{line}{line_ending}" for line in chunk).encode('utf-8'))
+                sent += len(chunk)
+                if on_progress:
+                    on_progress(sent, len(lines))
+            if counter is not None and sent:
+                self._wait_for_answers(counter, sent, timeout, sent)
+            return sent
+        finally:
+            if counter is not None:
+                with self._waiters_lock:
+                    self._waiters.remove(counter)
+
+    def _wait_for_answers(self, counter, count, timeout, sent):
+        if not counter.wait(count, timeout):
+            raise SerialTimeout(
+                f"{self.device} answered {counter.count} of {sent} lines; nothing matching "
+                f"'{counter.regex.pattern}' within {timeout:g}s")
+
+    async def write_line_async(self, text, line_ending="\r\n"):
+        """write_line() without blocking the loop"""
+        import asyncio
+
+        return await asyncio.get_running_loop().run_in_executor(None, self.write_line, text, line_ending)
+
+    @property
+    def reading(self):
+        return self._watching or (self._reader is not None and self._reader.is_alive())
+
+    def start_reader(self, on_line=None):
+        """Start the background reader; on_line(device, line, is_prompt) gets each line"""
+        if on_line is not None:
+            self._on_line = on_line
+        if self.reading:
+            return
+        self._reader_stop.clear()
+        if self.io_loop is not None:
+            self._watching = True
+            self.io_loop.call_soon(self._attach)
+            return
+        self._reader = threading.Thread(target=self._read_loop, name=f"serial-reader-{self.device}",
+                                        daemon=True)
+        self._reader.start()
+
+    def stop_reader(self):
+        """Stop the background reader"""
+        self._reader_stop.set()
+        if self._watching:
+            self._watching = False
+            if self.io_loop.running:
+                self.io_loop.call(self._detach)
+        if self._reader is not None and self._reader is not threading.current_thread():
+            self._reader.join(timeout=1)
+        self._reader = None
+
+    def _attach(self):
+        """Register the open port with the loop's selector (loop thread)"""
+        self._retry_handle = None
+        if not self._watching or self._attached_fd is not None:
+            return
+        if not self._lock.acquire(blocking=False):
+            # A writer is using (maybe reconnecting) the port; look again shortly
+            self._retry_handle = self.io_loop.loop.call_later(0.05, self._attach)
+            return
+        try:
+            port = self.open()
+            fd = port.fileno()
+            self.io_loop.loop.add_reader(fd, self._on_readable, port, fd)
+            self._attached_fd = fd
+        except (OSError, ValueError, SerialError):
+            # Unplugged; keep trying like the reader thread does
+            self._retry_handle = self.io_loop.loop.call_later(self.reconnect_delay, self._attach)
+        finally:
+            self._lock.release()
+
+    def _detach(self):
+        """Stop watching the port (loop thread)"""
+        for handle in (self._retry_handle, self._partial_handle):
+            if handle is not None:
+                handle.cancel()
+        self._retry_handle = self._partial_handle = None
+        if self._attached_fd is not None:
+            self.io_loop.loop.remove_reader(self._attached_fd)
+            self._attached_fd = None
+
+    def _on_readable(self, port, fd):
+        try:
+            data = os.read(fd, 4096)
+            if not data:
+                raise SerialError(f"{self.device} hung up")
+        except BlockingIOError:
+            return
+        except (OSError, SerialError):
+            self._detach()
+            if self._lock.acquire(blocking=False):
+                # Otherwise a writer holds the port; its failed write reconnects it
+                try:
+                    self._discard(port)
+                finally:
+                    self._lock.release()
+            if self._watching:
+                self._retry_handle = self.io_loop.loop.call_later(self.reconnect_delay, self._attach)
+            return
+
+        self.bytes_read += len(data)
+        if self._handle_data(data, time.monotonic()) and self._partial_handle is None:
+            self._partial_handle = self.io_loop.loop.call_later(self.PARTIAL_LINE_DELAY, self._on_quiet)
+
+    def _on_quiet(self):
+        """No data for a while: report a waiting partial line"""
+        self._partial_handle = None
+        if self._handle_data(b'', time.monotonic()):
+            self._partial_handle = self.io_loop.loop.call_later(self.PARTIAL_LINE_DELAY, self._on_quiet)
+
+    def _read_available(self, port, timeout):
+        """Return the bytes waiting on the port, waiting up to timeout for some to arrive"""
+        if os.name == 'posix':
+            # close() from another thread may clear the fd at any point
+            fd = port.fileno()
+            if fd is None:
+                raise SerialError(f"{self.device} was closed")
+            readable, _, _ = select.select([fd], [], [], timeout)
+            if not readable:
+                return b''
+            try:
+                data = os.read(fd, 4096)
+            except BlockingIOError:
+                return b''
+            if not data:
+                raise SerialError(f"{self.device} hung up")
+            return data
+        # Windows handles can't be selected on; poll pyserial's input buffer instead
+        waiting = port.in_waiting
+        if waiting:
+            return port.read(waiting)
+        time.sleep(min(timeout, 0.05))
+        return b''
+
+    def _read_loop(self):
+        while not self._reader_stop.is_set():
+            port = None
+            try:
+                port = self.open()
+                data = self._read_available(port, 0.2)
+                self.bytes_read += len(data)
+            except (OSError, ValueError, SerialError):
+                # Unplugged or closed by a writer; wait and let open() try again
+                self._discard(port)
+                if self._reader_stop.wait(self.reconnect_delay):
+                    break
+                continue
+
+            self._handle_data(data, time.monotonic())
+
+    def _handle_data(self, data, now):
+        """Split what was read into lines; returns True while a partial line is held back"""
+        if data:
+            self._last_data = now
+            self._buffer += data
+            *lines, self._buffer = self._buffer.split(b'\n')
+            for line in lines:
+                self._dispatch(line.rstrip(b'\r').decode('utf-8', errors='replace'), partial=False)
+
+        if self._buffer:
+            text = self._buffer.decode('utf-8', errors='replace')
+            is_prompt = bool(self.prompt_regex and self.prompt_regex.search(text))
+            self._feed_waiters(text, partial=True)
+            if is_prompt or now - self._last_data >= self.PARTIAL_LINE_DELAY:
+                self._emit(text, is_prompt)
+                self._buffer = b''
+        return bool(self._buffer)
+
+    def _dispatch(self, line, partial):
+        self._feed_waiters(line, partial)
+        self._emit(line, bool(self.prompt_regex and self.prompt_regex.search(line)))
+
+    def _feed_waiters(self, line, partial):
+        with self._waiters_lock:
+            waiters = list(self._waiters)
+        for waiter in waiters:
+            waiter.feed(line, partial)
+
+    def _emit(self, line, is_prompt):
+        if self._on_line:
+            self._on_line(self.device, line, is_prompt)
+
+
+class SerialSessionManager:
+    """Hands out one shared SerialSession per device"""
+
+    def __init__(self, settings, on_line=None, on_write=None, io_loop=None):
+        self.settings = settings
+        self.on_line = on_line
+        self.on_write = on_write
+        self.io_loop = io_loop
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, device=None):
+        """Return the session for a device (the configured one by default)"""
+        device = device or self.settings['serial_device']
+        with self._lock:
+            session = self._sessions.get(device)
+            if session is None:
+                session = self._sessions[device] = self._new_session(device)
+                if self.on_line:
+                    session.start_reader(self.on_line)
+            return session
+
+    def suspend(self, device, reason):
+        """Close a device's session and keep it closed until resume(), e.g. while a terminal has the port"""
+        with self._lock:
+            session = self._sessions.get(device)
+            if session is None:
+                # Created without a reader, so nothing opens the port meanwhile
+                session = self._sessions[device] = self._new_session(device)
+        session.suspend(reason)
+
+    def resume(self, device):
+        with self._lock:
+            session = self._sessions.get(device)
+        if session is None:
+            return
+        session.resume()
+        if self.on_line and not session.reading:
+            session.start_reader(self.on_line)
+
+    def _new_session(self, device):
+        return SerialSession(
+            device,
+            baudrate=self.settings.get('serial_baudrate', 115200),
+            parity=self.settings.get('serial_parity', 'N'),
+            bytesize=self.settings.get('serial_bytesize', 8),
+            stopbits=self.settings.get('serial_stopbits', 1),
+            prompt=self.settings.get('serial_prompt', DEFAULT_PROMPT),
+            on_write=self.on_write,
+            io_loop=self.io_loop,
+            flow_control=self.settings.get('serial_flow_control', 'none'),
+            write_timeout=float(self.settings.get('serial_write_timeout', 2)),
+        )
+
+    def traffic(self):
+        """{device: (bytes written, bytes read)} for every session opened so far"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {session.device: (session.bytes_written, session.bytes_read) for session in sessions}
+
+    def devices(self):
+        """Resolved device paths of the open sessions"""
+        with self._lock:
+            return {os.path.realpath(device) for device in self._sessions}
+
+    def close_all(self):
+        """Close every open session"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.stop_reader()
+            session.close()
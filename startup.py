@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""Startup phase timing for --profile-startup"""
+
+import sys
+import time
+
+
+class StartupProfile:
+    """Wall-clock time spent in each startup phase
+
+    mark() closes the phase that ran since the previous mark; record()
+    adds work that ran alongside the main thread, such as port probing.
+    """
+
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self.phases = []
+        self.background = []
+        self._last = self.started
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def record(self, phase, seconds):
+        self.background.append((phase, seconds))
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def report(self, stream=None):
+        stream = stream or sys.stderr
+        for phase, seconds in self.phases:
+            print(f"{phase:<28} {seconds * 1000:9.1f} ms", file=stream)
+        print(f"{'total':<28} {(self._last - self.started) * 1000:9.1f} ms", file=stream)
+        for phase, seconds in self.background:
+            print(f"{phase + ' (background)':<28} {seconds * 1000:9.1f} ms", file=stream)
+        stream.flush()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Command templates compiled once and rendered lazily against the settings"""
+
+import collections
+import string
+import threading
+
+
+class TemplateError(ValueError):
+    """Raised when a command template is malformed or uses an unknown setting"""
+
+
+class CommandTemplate:
+    """A command string parsed once, with the settings keys it depends on
+
+    Rendered results are cached by the values of those keys only, so a
+    change to an unrelated setting never forces a re-render, and the same
+    template rendered for different devices keeps one entry per device.
+    """
+
+    MAX_RENDERS = 16
+
+    def __init__(self, template):
+        self.template = template
+        self.keys = frozenset(self._parse(template))
+        self._key_order = tuple(sorted(self.keys))
+        self._renders = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _parse(template):
+        try:
+            parsed = [(field, conversion) for _, field, _, conversion in string.Formatter().parse(template)
+                      if field is not None]
+        except ValueError as e:
+            raise TemplateError(f"Invalid command template '{template}': {e}") from e
+        for field, conversion in parsed:
+            # parse() accepts any conversion; format() only these
+            if conversion not in (None, 'r', 's', 'a'):
+                raise TemplateError(f"Invalid command template '{template}': unknown conversion '!{conversion}'")
+        fields = [field for field, _ in parsed]
+        keys = []
+        for field in fields:
+            # {name.attr} and {name[0]} both depend on the 'name' setting
+            key = field.split('.', 1)[0].split('[', 1)[0]
+            if not key or key.isdigit():
+                raise TemplateError(f"Command template '{template}' uses a positional field; "
+                                    f"use a setting name like {{default_ip_address}}")
+            keys.append(key)
+        return keys
+
+    def render(self, settings):
+        """Fill in the template; repeated calls with unchanged settings hit the cache"""
+        missing = [key for key in self._key_order if key not in settings]
+        if missing:
+            raise TemplateError(f"Command '{self.template}' uses unknown setting(s): {', '.join(missing)}")
+        values = tuple(str(settings[key]) for key in self._key_order)
+        with self._lock:
+            rendered = self._renders.get(values)
+            if rendered is not None:
+                self._renders.move_to_end(values)
+                return rendered
+        rendered = self.template.format(**{key: settings[key] for key in self._key_order})
+        with self._lock:
+            self._renders[values] = rendered
+            if len(self._renders) > self.MAX_RENDERS:
+                self._renders.popitem(last=False)
+        return rendered
+
+    def clear(self):
+        """Forget cached renders"""
+        with self._lock:
+            self._renders.clear()
+
+
+class TemplateRegistry:
+    """Compiled templates shared by all buttons, indexed by the settings they use"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._templates = {}
+        self._by_key = collections.defaultdict(set)
+        self._lock = threading.Lock()
+
+    def compile(self, template):
+        """Return the compiled form of a template, parsing it only the first time"""
+        compiled = self._templates.get(template)
+        if compiled is None:
+            compiled = CommandTemplate(template)
+            with self._lock:
+                compiled = self._templates.setdefault(template, compiled)
+                for key in compiled.keys:
+                    self._by_key[key].add(compiled)
+        return compiled
+
+    def render(self, template, overrides=None):
+        """Render a template against the settings, with optional per-call overrides"""
+        settings = self.settings
+        if overrides:
+            settings = collections.ChainMap(overrides, settings)
+        return self.compile(template).render(settings)
+
+    def dependents(self, key):
+        """Templates that use a settings key"""
+        with self._lock:
+            return [compiled.template for compiled in self._by_key.get(key, ())]
+
+    def invalidate(self, key):
+        """Drop cached renders of the templates that use a settings key"""
+        with self._lock:
+            affected = list(self._by_key.get(key, ()))
+        for compiled in affected:
+            compiled.clear()
+        return len(affected)
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""Terminal windows (screen in xterm, PuTTY) on serial devices, one per device, reaped in the background"""
+
+import os
+import select
+import signal
+import subprocess
+import threading
+import time
+
+# Session states
+RUNNING = 'running'
+CLOSING = 'closing'
+EXITED = 'exited'
+KILLED = 'killed'
+
+
+class TerminalError(Exception):
+    """Raised when a terminal can't be started"""
+
+
+def _pidfd(pid):
+    """A pidfd for the process (Linux 5.3+), or None where there is no such thing"""
+    if not hasattr(os, 'pidfd_open'):
+        return None
+    try:
+        return os.pidfd_open(pid)
+    except OSError:
+        return None
+
+
+class TerminalSession:
+    """One terminal window and its process"""
+
+    def __init__(self, device, name, argv, process):
+        self.device = device
+        self.name = name
+        self.argv = argv
+        self.process = process
+        self.pid = process.pid
+        self.pidfd = _pidfd(process.pid)
+        self.state = RUNNING
+        self.started_at = time.time()
+        self.ended_at = None
+        self.returncode = None
+        # While closing: when SIGKILL follows the SIGTERM
+        self.kill_at = None
+        self.killed = False
+
+    @property
+    def alive(self):
+        return self.state in (RUNNING, CLOSING)
+
+    @property
+    def uptime(self):
+        return (self.ended_at or time.time()) - self.started_at
+
+    def to_dict(self):
+        return {'device': self.device, 'name': self.name, 'pid': self.pid, 'state': self.state,
+                'uptime': round(self.uptime, 1), 'returncode': self.returncode}
+
+
+class TerminalSupervisor:
+    """Starts, tracks and stops terminal sessions without ever waiting on them
+
+    Each device has at most one live session. A single reaper thread waits
+    on the sessions' pidfds (on Linux; elsewhere it polls every
+    POLL_INTERVAL seconds) and reaps each child as it exits. close() only
+    sends SIGTERM and returns; the reaper sends SIGKILL if the terminal is
+    still there grace seconds later. on_change(session, state) is called,
+    from the caller's or the reaper's thread, whenever a session starts or
+    changes state.
+    """
+
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, on_change=None, grace=2.0):
+        self.on_change = on_change
+        self.grace = grace
+        self._sessions = {}
+        self._lock = threading.Lock()
+        # Held from a state change until on_change has been told, so it sees
+        # each session's states in order even when the reaper is quick
+        self._notify_lock = threading.RLock()
+        self._stopping = False
+        self._thread = None
+        # Written to wake the reaper when sessions come and go
+        self._wake_r = self._wake_w = None
+        self._wake = threading.Event()
+        if os.name == 'posix':
+            self._wake_r, self._wake_w = os.pipe()
+            os.set_blocking(self._wake_r, False)
+
+    def open(self, device, argv, name=None):
+        """Start a terminal for a device; raises TerminalError if one is open or it can't start"""
+        name = name or device
+        popen_args = {}
+        if os.name == 'posix':
+            # Own process group, so closing also stops the screen inside the xterm
+            popen_args['start_new_session'] = True
+        with self._notify_lock:
+            with self._lock:
+                session = self._sessions.get(device)
+                if session is not None and session.alive:
+                    raise TerminalError(f"A terminal for {name} is already open (pid {session.pid})")
+                try:
+                    process = subprocess.Popen(argv, stdin=subprocess.DEVNULL, **popen_args)
+                except OSError as e:
+                    raise TerminalError(f"Cannot start {argv[0]}: {e}") from e
+                session = self._sessions[device] = TerminalSession(device, name, argv, process)
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._reap_loop, name="terminal-reaper", daemon=True)
+                    self._thread.start()
+            self._changed(session, RUNNING)
+        self._wakeup()
+        return session
+
+    def close(self, device):
+        """Ask a device's terminal to exit; returns the session, or None if none is live"""
+        with self._notify_lock:
+            with self._lock:
+                session = self._sessions.get(device)
+                if session is None or session.state != RUNNING:
+                    return None
+                session.state = CLOSING
+                session.kill_at = time.monotonic() + self.grace
+            self._changed(session, CLOSING)
+        self._signal(session, signal.SIGTERM)
+        self._wakeup()
+        return session
+
+    def kill(self, device):
+        """Kill a device's terminal right away"""
+        with self._notify_lock:
+            with self._lock:
+                session = self._sessions.get(device)
+                if session is None or not session.alive:
+                    return None
+                session.state = CLOSING
+                session.kill_at = time.monotonic()
+            self._changed(session, CLOSING)
+        self._wakeup()
+        return session
+
+    def close_all(self):
+        return [session for session in (self.close(device) for device in list(self._sessions)) if session]
+
+    def get(self, device):
+        with self._lock:
+            return self._sessions.get(device)
+
+    def sessions(self):
+        """Every session started, live or ended, in start order"""
+        with self._lock:
+            return list(self._sessions.values())
+
+    def live(self):
+        return [session for session in self.sessions() if session.alive]
+
+    def devices(self):
+        """Resolved device paths of the terminals still open"""
+        return {os.path.realpath(session.device) for session in self.live()}
+
+    def shutdown(self, close=True):
+        """Stop supervising; with close, terminals still open are closed first
+
+        Returns at once. If some terminal has yet to exit, a short-lived
+        non-daemon thread stays behind to kill it after the grace period,
+        so an app that exits right away doesn't leave it running.
+        """
+        if close:
+            self.close_all()
+        self._stopping = True
+        self._wakeup()
+        closing = [session for session in self.live() if session.state == CLOSING]
+        if closing:
+            threading.Thread(target=self._finish, args=(closing,), name="terminal-reaper-exit").start()
+
+    def _finish(self, sessions):
+        deadline = time.monotonic() + self.grace + 1
+        while sessions and time.monotonic() < deadline:
+            sessions = [session for session in sessions if self._check(session)]
+            time.sleep(0.05)
+
+    def _signal(self, session, signum):
+        try:
+            if os.name == 'posix':
+                os.killpg(session.pid, signum)
+            elif signum == signal.SIGTERM:
+                session.process.terminate()
+            else:
+                session.process.kill()
+        except OSError:
+            # Already gone; the reaper picks up its exit status
+            pass
+
+    def _wakeup(self):
+        if self._wake_w is not None:
+            try:
+                os.write(self._wake_w, b'x')
+            except OSError:
+                pass
+        else:
+            self._wake.set()
+
+    def _changed(self, session, state):
+        if self.on_change:
+            self.on_change(session, state)
+
+    def _check(self, session):
+        """Reap a session that exited and escalate an overdue close; returns True while it is alive"""
+        if not session.alive:
+            return False
+        returncode = session.process.poll()
+        if returncode is None:
+            if session.kill_at is not None and time.monotonic() >= session.kill_at:
+                session.kill_at = None
+                session.killed = True
+                self._signal(session, getattr(signal, 'SIGKILL', signal.SIGTERM))
+            return True
+        with self._notify_lock:
+            with self._lock:
+                if not session.alive:
+                    # Reaped by the other thread during shutdown
+                    return False
+                session.returncode = returncode
+                session.ended_at = time.time()
+                state = session.state = KILLED if session.killed else EXITED
+                if session.pidfd is not None:
+                    os.close(session.pidfd)
+                    session.pidfd = None
+            self._changed(session, state)
+        return False
+
+    def _reap_loop(self):
+        while not self._stopping:
+            live = self.live()
+            for session in live:
+                self._check(session)
+            live = [session for session in live if session.alive]
+
+            timeout = None
+            if any(session.pidfd is None for session in live) or self._wake_r is None:
+                timeout = self.POLL_INTERVAL
+            deadlines = [session.kill_at for session in live if session.kill_at is not None]
+            if deadlines:
+                wait = max(0.0, min(deadlines) - time.monotonic())
+                timeout = wait if timeout is None else min(timeout, wait)
+
+            if self._wake_r is None:
+                self._wake.wait(timeout)
+                self._wake.clear()
+                continue
+            fds = [self._wake_r] + [session.pidfd for session in live if session.pidfd is not None]
+            try:
+                readable, _, _ = select.select(fds, [], [], timeout)
+            except (OSError, ValueError):
+                # A pidfd was closed under us; look again
+                continue
+            if self._wake_r in readable:
+                try:
+                    while os.read(self._wake_r, 4096):
+                        pass
+                except BlockingIOError:
+                    pass
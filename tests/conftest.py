@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+# The app is a set of top-level modules run from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def fake_serial():
+    """Factory for benchmark.FakeSerialDevice: a pty that echoes each line and answers with a prompt
+
+    Takes FakeSerialDevice's arguments; every device made is closed after the test.
+    """
+    from benchmark import FakeSerialDevice
+
+    devices = []
+
+    def make(**kwargs):
+        device = FakeSerialDevice(**kwargs)
+        devices.append(device)
+        return device
+
+    yield make
+    for device in devices:
+        device.close()
@@ -0,0 +1,138 @@
+import os
+import time
+
+import pytest
+
+from capture import EVENT, RX, STDOUT, TX, CaptureStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = CaptureStore(str(tmp_path / 'captures'), flush_interval=3600)
+    yield store
+    store.close()
+
+
+def _texts(records):
+    return [record.text for record in records]
+
+
+def test_search_matches_words_anywhere_and_ignores_case(store):
+    store.record('/dev/ttyUSB0', RX, 'eth0: link up')
+    store.record('/dev/ttyUSB0', RX, 'Ethernet adapter ready')
+    store.record('/dev/ttyUSB0', RX, 'wlan0: link down')
+    assert _texts(store.search('eth')) == ['eth0: link up', 'Ethernet adapter ready']
+    assert _texts(store.search('LINK eth0')) == ['eth0: link up']
+    assert _texts(store.search('link eth0 down')) == []
+    assert len(list(store.search(''))) == 3
+
+
+def test_short_and_punctuated_query_words_still_match(store):
+    store.record('sw1', RX, 'inet 10.0.0.5 up')
+    store.record('sw1', RX, 'inet 10.0.0.6 down')
+    assert _texts(store.search('up')) == ['inet 10.0.0.5 up']
+    assert _texts(store.search('10.0.0.5')) == ['inet 10.0.0.5 up']
+    assert _texts(store.search('inet:')) == []
+
+
+def test_index_skips_blocks_that_cannot_match(tmp_path, monkeypatch):
+    store = CaptureStore(str(tmp_path), block_bytes=1, flush_interval=3600)
+    try:
+        for n in range(20):
+            store.record('sw1', RX, f"line {n} " + ('needle' if n == 7 else 'hay'))
+        read = []
+        original = CaptureStore._read_block
+        monkeypatch.setattr(CaptureStore, '_read_block',
+                            staticmethod(lambda f, entry: read.append(entry) or original(f, entry)))
+        assert _texts(store.search('needl')) == ['line 7 needle']
+        assert len(read) == 1
+    finally:
+        store.close()
+
+
+def test_search_filters(store):
+    now = time.time()
+    store.record('sw1', TX, 'show version', timestamp=now - 10)
+    store.record('sw1', RX, 'version 1.2', timestamp=now - 5)
+    store.record('sw2', RX, 'version 3.4', timestamp=now)
+    store.record('local', STDOUT, 'version 5.6', timestamp=now)
+
+    assert _texts(store.search('version', devices=['sw2'])) == ['version 3.4']
+    assert _texts(store.search('version', devices=['sw1'], streams={RX})) == ['version 1.2']
+    assert _texts(store.search('version', devices=['sw1'], since=now - 6)) == ['version 1.2']
+    assert _texts(store.search('version', devices=['sw1'], until=now - 6)) == ['show version']
+    assert _texts(store.search('', regex=r'\d\.[24]$')) == ['version 1.2', 'version 3.4']
+    assert sorted(store.devices()) == ['local', 'sw1', 'sw2']
+
+
+def test_device_paths_are_stored_under_their_base_name(store):
+    store.record('/dev/serial/by-id/usb-FTDI_FT232R-if00-port0', RX, 'hello there')
+    assert store.devices() == ['usb-FTDI_FT232R-if00-port0']
+    records = list(store.search('hello', devices=['/dev/serial/by-id/usb-FTDI_FT232R-if00-port0']))
+    assert records[0].device == 'usb-FTDI_FT232R-if00-port0'
+    assert 'rx' in records[0].format()
+
+
+def test_each_day_gets_its_own_file_and_replay_keeps_order(store):
+    today = time.time()
+    yesterday = today - 86400
+    store.record('sw1', EVENT, 'boot', timestamp=yesterday)
+    store.record('sw1', RX, 'login prompt', timestamp=yesterday + 1)
+    store.record('sw1', RX, 'uptime 1 day', timestamp=today)
+    store.flush()
+    assert len([name for name in os.listdir(os.path.join(store.directory, 'sw1')) if name.endswith('.cap')]) == 2
+    assert _texts(store.replay('sw1')) == ['boot', 'login prompt', 'uptime 1 day']
+    assert _texts(store.replay('sw1', since=today - 1)) == ['uptime 1 day']
+
+
+def test_new_records_show_up_in_later_searches(store):
+    store.record('sw1', RX, 'first entry')
+    assert _texts(store.search('entry')) == ['first entry']
+    store.record('sw1', RX, 'second entry')
+    assert _texts(store.search('entry')) == ['first entry', 'second entry']
+
+
+def test_a_failed_write_turns_capture_off_and_is_reported_once(tmp_path):
+    errors = []
+    store = CaptureStore(str(tmp_path), flush_interval=3600, on_error=errors.append)
+    # A file where the device directory should go
+    (tmp_path / 'sw1').write_text('')
+    store.record('sw1', RX, 'lost')
+    store.record('sw1', RX, 'lost too')
+    store.flush()
+    store.close()
+    assert store.disabled
+    assert len(errors) == 1 and isinstance(errors[0], OSError)
+
+
+def test_recording_goes_on_while_a_block_is_being_written(tmp_path, monkeypatch):
+    import threading
+
+    import capture
+
+    writing = threading.Event()
+    release = threading.Event()
+    original = capture._CaptureFile.write
+
+    def slow_write(self, records):
+        writing.set()
+        release.wait(5)
+        original(self, records)
+
+    monkeypatch.setattr(capture._CaptureFile, 'write', slow_write)
+    store = CaptureStore(str(tmp_path), block_bytes=1, flush_interval=3600)
+    try:
+        store.record('sw1', RX, 'line 0')
+        assert writing.wait(5)
+        # The writer is stuck on the disk; recording must not wait for it
+        started = time.monotonic()
+        for n in range(1, 50):
+            store.record('sw1', RX, f"line {n}")
+            store.record('sw2', RX, f"line {n}")
+        assert time.monotonic() - started < 1
+        release.set()
+        assert _texts(store.replay('sw1')) == [f"line {n}" for n in range(50)]
+        assert len(_texts(store.replay('sw2'))) == 49
+    finally:
+        release.set()
+        store.close()
@@ -0,0 +1,92 @@
+import json
+
+from command_index import CommandIndex
+
+ROWS = [
+    ('Show', 'Show interface', 'show interfaces', 'send_to_serial'),
+    ('Show', 'Show version', 'show version', 'send_to_serial'),
+    ('Show', 'Show running config', 'show running-config', 'send_to_serial'),
+    ('Network', 'Kill dhclient', 'sudo pkill dhclient', 'run_local_command'),
+    ('Network', 'Set IP address', 'sudo ip addr add {default_ip_address}', 'run_local_command'),
+    ('Terminal', 'Open screen', 'screen {serial_device}', 'open_screen'),
+]
+
+
+def _index(**kwargs):
+    index = CommandIndex(**kwargs)
+    index.set_unit('Switch', ROWS)
+    index.set_unit('Router', [('Show', 'Show version', 'show ver', 'send_to_serial')])
+    return index
+
+
+def _texts(entries):
+    return [(entry.unit, entry.text) for entry in entries]
+
+
+def test_whole_words_and_scattered_letters_match():
+    index = _index()
+    assert _texts(index.search('dhclient')) == [('Switch', 'Kill dhclient')]
+    assert _texts(index.search('shint'))[0] == ('Switch', 'Show interface')
+    assert _texts(index.search('version router')) == [('Router', 'Show version')]
+    # Group, unit and command count too, but less than the text
+    assert ('Switch', 'Set IP address') in _texts(index.search('default_ip'))
+    assert index.search('zzz') == []
+
+
+def test_one_or_two_letters_match_word_starts_of_the_text():
+    index = _index()
+    assert _texts(index.search('s')) == [('Router', 'Show version'), ('Switch', 'Show version'),
+                                         ('Switch', 'Set IP address'), ('Switch', 'Show interface'),
+                                         ('Switch', 'Show running config'), ('Switch', 'Open screen')]
+    assert _texts(index.search('ip')) == [('Switch', 'Set IP address')]
+    assert index.search('pk') == []
+
+
+def test_typing_on_gives_what_a_fresh_search_would():
+    index = _index()
+    fresh = _index()
+    for query in ('sh', 'sho', 'show', 'show r', 'show ru', 'show run'):
+        assert _texts(index.search(query)) == _texts(fresh.search(query)), query
+        fresh = _index()
+
+
+def test_use_counts_rank_entries_and_survive_restarts(tmp_path):
+    history = str(tmp_path / 'history.json')
+    index = _index(history_path=history)
+    assert index.search('') == []
+    for _ in range(3):
+        index.record_use('Switch', 'show running config')
+    index.record_use('Switch', 'Kill dhclient')
+    assert _texts(index.search('show'))[0] == ('Switch', 'Show running config')
+    assert _texts(index.search('')) == [('Switch', 'Show running config'), ('Switch', 'Kill dhclient')]
+
+    index.save_history()
+    assert json.load(open(history))['Switch\tshow running config'][0] == 3
+    assert _texts(_index(history_path=history).search(''))[0] == ('Switch', 'Show running config')
+
+
+def test_replacing_and_removing_a_unit_type():
+    index = _index()
+    index.search('ver')
+    index.set_unit('Router', [('Debug', 'Show logging', 'show logging', 'send_to_serial')])
+    assert _texts(index.search('ver')) == [('Switch', 'Show version')]
+    assert _texts(index.search('logging')) == [('Router', 'Show logging')]
+    assert len(index) == len(ROWS) + 1
+
+    index.prepare()
+    index.remove_unit('Switch')
+    assert _texts(index.search('s')) == [('Router', 'Show logging')]
+    assert len(index) == 1
+
+
+def test_large_indexes_still_find_the_best_match():
+    index = CommandIndex()
+    for unit in range(50):
+        index.set_unit(f"Unit{unit}", [(f"Group {group}", f"Show counter {unit}-{group}", f"show counter {group}",
+                                        'send_to_serial') for group in range(20)])
+    index.set_unit('Core', [('Show', 'Show counters', 'show counters', 'send_to_serial')])
+    assert len(index) == 1001
+    results = index.search('show counter', limit=5)
+    assert len(results) == 5
+    assert _texts(results)[0] == ('Core', 'Show counters')
+    assert _texts(index.search('show counter 7-13', limit=1)) == [('Unit7', 'Show counter 7-13')]
@@ -0,0 +1,140 @@
+import copy
+import json
+import os
+
+import pytest
+
+from config_model import ConfigSchemaError, compile_config, compile_unit, json_path
+from templates import TemplateRegistry
+
+BASE = {
+    'settings': {'serial_device': '/dev/ttyUSB0', 'serial_baudrate': 115200, 'default_ip_address': '10.0.0.2'},
+    'unit_types': {
+        'Switch': {
+            'description': 'A switch',
+            'button_groups': [
+                {'title': 'Serial Commands', 'buttons': [
+                    {'text': 'Set IP', 'action': 'send_to_serial', 'command': 'ifconfig ma1 {default_ip_address}'},
+                ]},
+                {'title': 'Local', 'buttons': [
+                    {'text': 'Routes', 'action': 'run_local_command', 'command': 'route -n', 'parser': 'auto'},
+                ]},
+            ],
+        },
+    },
+}
+
+
+def _compile(config):
+    return compile_config(config, compile_template=TemplateRegistry(config.get('settings') or {}).compile)
+
+
+def _errors(config):
+    with pytest.raises(ConfigSchemaError) as caught:
+        _compile(config)
+    return dict(caught.value.errors)
+
+
+def _edit(edit):
+    config = copy.deepcopy(BASE)
+    edit(config)
+    return config
+
+
+def _button(config, group=0, button=0):
+    return config['unit_types']['Switch']['button_groups'][group]['buttons'][button]
+
+
+def test_valid_config_compiles():
+    model = _compile(copy.deepcopy(BASE))
+    switch = model.unit('Switch')
+    assert [group.group_type for group in switch.groups] == ['serial', 'local']
+    assert switch.find('set ip').path == ('unit_types', 'Switch', 'button_groups', 0, 'buttons', 0)
+    assert switch.find('Routes').parser == 'auto'
+
+
+def test_shipped_config_compiles():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.json')
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    assert _compile(config).unit_names()
+
+
+def test_json_path():
+    assert json_path(['unit_types', 'Switch', 'button_groups', 1]) == '$.unit_types.Switch.button_groups[1]'
+    assert json_path(['unit_types', 'My Unit']) == "$.unit_types['My Unit']"
+
+
+def test_every_problem_is_reported_with_its_path():
+    def edit(config):
+        del config['settings']['serial_baudrate']
+        config['settings']['serial_probe'] = 'yes'
+        _button(config)['action'] = 'send'
+        _button(config, 1)['timeout'] = -1
+
+    errors = _errors(_edit(edit))
+    assert errors['$.settings.serial_baudrate'] == 'is required'
+    assert errors['$.settings.serial_probe'] == "expected true or false, got 'yes'"
+    assert errors['$.unit_types.Switch.button_groups[0].buttons[0].action'].startswith('expected one of')
+    assert errors['$.unit_types.Switch.button_groups[1].buttons[0].timeout'] == \
+        'expected a positive number of seconds, got -1'
+
+
+@pytest.mark.parametrize('edit, path, message', [
+    (lambda c: c.update(settings=[]), '$.settings', 'expected an object'),
+    (lambda c: c['unit_types'].update(Switch=[]), '$.unit_types.Switch', 'expected an object'),
+    (lambda c: c['unit_types']['Switch'].update(button_groups={}), '$.unit_types.Switch.button_groups',
+     'expected a list'),
+    (lambda c: c['settings'].update(serial_devices=['/dev/ttyUSB1', {'name': 'x'}]), '$.settings.serial_devices',
+     'expected a list of device paths or objects with a device'),
+    (lambda c: c['settings'].update(device_settings={'/dev/ttyUSB1': 5}), '$.settings.device_settings',
+     'expected an object mapping device paths to objects of settings'),
+    (lambda c: _button(c).update(command='ping {gateway}'), '$.unit_types.Switch.button_groups[0].buttons[0].command',
+     'uses unknown setting(s): gateway'),
+    (lambda c: _button(c).update(wait_for='('), '$.unit_types.Switch.button_groups[0].buttons[0].wait_for',
+     "expected true or a regular expression, got '('"),
+    (lambda c: _button(c).update(cacheable=True), '$.unit_types.Switch.button_groups[0].buttons[0].cacheable',
+     'only run_local_command buttons can be cached'),
+    (lambda c: _button(c, 1).update(parser='xml'), '$.unit_types.Switch.button_groups[1].buttons[0].parser',
+     "Unknown parser 'xml'"),
+    (lambda c: _button(c).update(parser='auto'), '$.unit_types.Switch.button_groups[0].buttons[0].parser',
+     'a parsed serial command needs wait_for to collect its response'),
+])
+def test_error_paths(edit, path, message):
+    errors = _errors(_edit(edit))
+    assert path in errors, errors
+    assert errors[path].startswith(message)
+
+
+def test_device_override_settings_count_as_known():
+    def edit(config):
+        config['settings']['device_settings'] = {'/dev/ttyUSB1': {'gateway': '10.0.0.1'}}
+        _button(config).update(command='ping {gateway}')
+
+    _compile(_edit(edit))
+
+
+@pytest.mark.parametrize('steps, path, message', [
+    ('send', 'steps', 'steps must be a list'),
+    (['send'], 'steps[0]', "expected an object, got 'send'"),
+    ([{'action': 'dance'}], 'steps[0].action', "unknown action 'dance'"),
+    ([{'action': 'send_to_serial', 'command': 5}], 'steps[0].command', 'needs a command'),
+    ([{'action': 'delay', 'seconds': 'soon'}], 'steps[0].seconds', 'seconds must be'),
+    ([{'action': 'send_to_serial', 'command': 'x', 'wait_for': '('}], 'steps[0].wait_for', 'invalid wait_for regex'),
+    ([{'action': 'send_to_serial', 'command': 'x', 'retries': 1.5}], 'steps[0].retries', 'retries must be'),
+])
+def test_sequence_errors_point_at_the_step(steps, path, message):
+    def edit(config):
+        config['unit_types']['Switch']['button_groups'][0]['buttons'].append(
+            {'text': 'Run', 'action': 'sequence', 'steps': steps})
+
+    errors = _errors(_edit(edit))
+    full = f'$.unit_types.Switch.button_groups[0].buttons[1].{path}'
+    assert full in errors, errors
+    assert message in errors[full]
+
+
+def test_unit_file_errors_name_the_file():
+    with pytest.raises(ConfigSchemaError) as caught:
+        compile_unit('Router', {'button_groups': [{'title': ''}]}, source='units/router.json')
+    assert caught.value.errors == [('units/router.json:$.button_groups[0].title', 'expected a non-empty string')]
@@ -0,0 +1,185 @@
+import json
+import os
+
+import pytest
+
+from config_store import ConfigStore, atomic_write
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps({'settings': {'baud': 9600}, 'items': ['a']}))
+    return str(path)
+
+
+def _journal(path):
+    with open(f"{path}.journal", encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def _snapshot(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_edits_are_journaled_before_the_snapshot(config_path):
+    store = ConfigStore(config_path, debounce=3600)
+    store.load()
+    store.append(['items'], 'b')
+    store.set(['settings', 'baud'], 115200)
+
+    assert store.config == {'settings': {'baud': 115200}, 'items': ['a', 'b']}
+    assert [(c['op'], c['seq']) for c in _journal(config_path)] == [('append', 1), ('set', 2)]
+    assert _snapshot(config_path)['items'] == ['a']
+
+    store.save_now()
+    assert not os.path.exists(f"{config_path}.journal")
+    assert _snapshot(config_path) == {'settings': {'baud': 115200}, 'items': ['a', 'b']}
+
+
+def test_crash_before_snapshot_is_recovered(config_path):
+    store = ConfigStore(config_path, debounce=3600)
+    store.load()
+    store.append(['items'], 'b')
+    store.append(['items'], 'b')
+    # No save: the process dies here
+
+    recovered = ConfigStore(config_path, debounce=3600)
+    assert recovered.load()['items'] == ['a', 'b', 'b']
+    assert recovered.recovered == 2
+    recovered.close()
+    assert _snapshot(config_path)['items'] == ['a', 'b', 'b']
+    assert not os.path.exists(f"{config_path}.journal")
+
+
+def test_crash_between_snapshot_and_truncation_applies_nothing_twice(config_path):
+    store = ConfigStore(config_path, debounce=3600)
+    store.load()
+    store.append(['items'], 'a')
+    journal = open(f"{config_path}.journal", encoding='utf-8').read()
+    store.save_now()
+    # The snapshot landed but the journal was never emptied
+    with open(f"{config_path}.journal", 'w', encoding='utf-8') as f:
+        f.write(journal)
+
+    replayed = ConfigStore(config_path, debounce=3600)
+    config = replayed.load()
+    assert config['items'] == ['a', 'a']
+    assert set(config) == {'settings', 'items'}
+    assert replayed.recovered == 0
+
+    # Numbering carries on after the journal, not the snapshot
+    replayed.append(['items'], 'c')
+    assert _journal(config_path)[-1]['seq'] == 2
+
+
+def test_replay_keeps_only_changes_newer_than_the_snapshot(config_path):
+    store = ConfigStore(config_path, debounce=3600)
+    store.load()
+    store.append(['items'], 'b')
+    store.save_now()
+    store.append(['items'], 'c')
+    journal = open(f"{config_path}.journal", encoding='utf-8').read()
+    # Crash after the second snapshot is written, before the journal is emptied
+    with open(f"{config_path}.journal", 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'op': 'append', 'path': ['items'], 'value': 'b', 'seq': 1}) + "\n" + journal)
+    store.append(['items'], 'd')
+    store.save_now()
+    with open(f"{config_path}.journal", 'w', encoding='utf-8') as f:
+        f.write(journal + json.dumps({'op': 'append', 'path': ['items'], 'value': 'e', 'seq': 4}) + "\n")
+
+    replayed = ConfigStore(config_path, debounce=3600)
+    assert replayed.load()['items'] == ['a', 'b', 'c', 'd', 'e']
+    assert replayed.recovered == 1
+
+
+def test_sequence_numbers_stay_out_of_the_config(config_path):
+    store = ConfigStore(config_path, debounce=3600)
+    store.load()
+    store.append(['items'], 'b')
+    store.save_now()
+
+    assert _snapshot(config_path) == {'settings': {'baud': 9600}, 'items': ['a', 'b']}
+    with open(f"{config_path}.seq", encoding='utf-8') as f:
+        assert [s['seq'] for s in json.load(f)['snapshots']] == [1]
+
+
+def test_crash_before_the_rename_keeps_the_previous_snapshot_numbering(config_path):
+    store = ConfigStore(config_path, debounce=3600)
+    store.load()
+    store.append(['items'], 'b')
+    store.save_now()
+    previous = open(config_path, encoding='utf-8').read()
+    store.append(['items'], 'c')
+    journal = open(f"{config_path}.journal", encoding='utf-8').read()
+    store.save_now()
+    # The sidecar went out but the new snapshot never replaced the old one
+    with open(config_path, 'w', encoding='utf-8') as f:
+        f.write(previous)
+    with open(f"{config_path}.journal", 'w', encoding='utf-8') as f:
+        f.write(journal)
+
+    replayed = ConfigStore(config_path, debounce=3600)
+    assert replayed.load()['items'] == ['a', 'b', 'c']
+    assert replayed.recovered == 1
+
+
+def test_hand_edited_snapshot_has_the_whole_journal_replayed(config_path):
+    store = ConfigStore(config_path, debounce=3600)
+    store.load()
+    store.append(['items'], 'b')
+    store.save_now()
+    store.append(['items'], 'c')
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump({'settings': {'baud': 4800}, 'items': []}, f)
+
+    replayed = ConfigStore(config_path, debounce=3600)
+    assert replayed.load() == {'settings': {'baud': 4800}, 'items': ['c']}
+
+
+def test_torn_and_broken_journal_lines_are_skipped(config_path):
+    with open(f"{config_path}.journal", 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'op': 'append', 'path': ['items'], 'value': 'b', 'seq': 1}) + "\n")
+        f.write(json.dumps({'op': 'append', 'path': ['missing'], 'value': 'x', 'seq': 2}) + "\n")
+        f.write(json.dumps({'op': 'rename', 'path': ['items'], 'value': 'x', 'seq': 3}) + "\n")
+        f.write('{"op": "append", "path": ["ite')
+
+    store = ConfigStore(config_path, debounce=3600)
+    assert store.load()['items'] == ['a', 'b']
+    assert store.recovered == 1
+
+
+def test_journal_without_sequence_numbers_is_replayed(config_path):
+    with open(f"{config_path}.journal", 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'op': 'set', 'path': ['settings', 'baud'], 'value': 57600}) + "\n")
+
+    store = ConfigStore(config_path, debounce=3600)
+    assert store.load()['settings']['baud'] == 57600
+    assert store.recovered == 1
+
+
+def test_debounced_save_runs_in_the_background(config_path):
+    import threading
+
+    saved = threading.Event()
+    store = ConfigStore(config_path, debounce=0.05, on_saved=saved.set)
+    store.load()
+    store.set(['settings', 'baud'], 19200)
+    assert saved.wait(5)
+    assert _snapshot(config_path)['settings']['baud'] == 19200
+
+
+def test_atomic_write_keeps_the_old_file_on_failure(tmp_path):
+    path = tmp_path / 'data.json'
+    path.write_text('old')
+    os.chmod(path, 0o640)
+
+    atomic_write(str(path), 'new')
+    assert path.read_text() == 'new'
+    assert os.stat(path).st_mode & 0o777 == 0o640
+
+    with pytest.raises(TypeError):
+        atomic_write(str(path), object())
+    assert path.read_text() == 'new'
+    assert os.listdir(tmp_path) == ['data.json']
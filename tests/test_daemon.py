@@ -0,0 +1,134 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import pytest
+
+from daemon import CommandDaemon, DaemonError, request
+
+
+@pytest.fixture
+def engine(tmp_path, fake_serial):
+    from engine import Engine
+
+    device = fake_serial(response="uptime 3 days")
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps({
+        'settings': {'serial_device': device.path, 'serial_baudrate': 9600},
+        'unit_types': {'Switch': {'button_groups': [
+            {'title': 'Show', 'buttons': [
+                {'text': 'Uptime', 'action': 'send_to_serial', 'command': 'show uptime', 'wait_for': True},
+                {'text': 'Hello', 'action': 'run_local_command', 'command': 'echo hello'},
+                {'text': 'Broken', 'action': 'run_local_command', 'command': 'exit 5'},
+            ]},
+        ]}},
+    }))
+    engine = Engine(str(path), on_log=lambda message, level='INFO': None)
+    yield engine
+    engine.shutdown()
+
+
+@pytest.fixture
+def socket_path():
+    # AF_UNIX paths are limited to about 100 bytes, too short for pytest's tmp_path
+    directory = tempfile.mkdtemp(prefix='pc-')
+    yield os.path.join(directory, 'daemon.sock')
+    shutil.rmtree(directory)
+
+
+def _serve(engine, socket_path):
+    """Start a daemon on a thread and wait until it answers"""
+    daemon = CommandDaemon(engine, socket_path)
+    thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+    thread.start()
+    for _ in range(500):
+        try:
+            request(socket_path, {'op': 'ping'}, timeout=1)
+            return daemon, thread
+        except DaemonError:
+            time.sleep(0.01)
+    pytest.fail("daemon never answered")
+
+
+@pytest.fixture
+def served(engine, socket_path):
+    daemon, thread = _serve(engine, socket_path)
+    yield daemon
+    daemon.shutdown()
+    thread.join(5)
+    assert not os.path.exists(socket_path)
+
+
+def test_ping_list_and_targets(served, socket_path, engine):
+    assert request(socket_path, {'op': 'ping'}) == {'ok': True, 'pid': os.getpid()}
+    assert request(socket_path, {'op': 'list'})['units'] == {
+        'Switch': [{'group': 'Show', 'buttons': ['Uptime', 'Hello', 'Broken']}]}
+    device = engine.settings['serial_device']
+    assert request(socket_path, {'op': 'targets'})['targets'] == [[device, device]]
+
+
+def test_run_waits_for_the_result_on_every_target(served, socket_path, engine):
+    response = request(socket_path, {'op': 'run', 'unit': 'Switch', 'button': 'uptime'}, timeout=10)
+    assert response['ok'] is True
+    [result] = response['results']
+    assert (result['device'], result['state'], result['detail']) == (engine.settings['serial_device'], 'done', 'switch#')
+
+    response = request(socket_path, {'op': 'run', 'button': 'Broken'}, timeout=10)
+    assert response['ok'] is False
+    assert response['results'][0]['detail'] == 'exit code 5'
+
+
+def test_send_records_metrics(served, socket_path):
+    response = request(socket_path, {'op': 'send', 'command': 'show clock', 'wait_for': True}, timeout=10)
+    assert response['ok'] is True
+    metrics = request(socket_path, {'op': 'metrics'})['metrics']
+    assert [(b['button'], b['runs']) for b in metrics['buttons']] == [('send', 1)]
+    text = request(socket_path, {'op': 'metrics', 'format': 'prometheus'})['text']
+    assert 'button="send"' in text
+
+
+def test_bad_requests_get_an_error_and_keep_the_connection(served, socket_path):
+    import socket
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(5)
+        sock.connect(socket_path)
+        sock.sendall(b'not json\n["a list"]\n{"op": "explode"}\n{"op": "run", "button": "Nope"}\n{"op": "ping"}\n')
+        with sock.makefile('rb') as f:
+            responses = [json.loads(f.readline()) for _ in range(5)]
+    assert [response['ok'] for response in responses] == [False, False, False, False, True]
+    assert responses[2]['error'] == "unknown op 'explode'"
+    assert "No button 'Nope'" in responses[3]['error']
+
+
+def test_search_rejects_a_bad_regex(served, socket_path):
+    response = request(socket_path, {'op': 'search', 'regex': '('})
+    assert response['ok'] is False and 'invalid regex' in response['error']
+
+
+def test_a_second_daemon_refuses_a_live_socket(served, socket_path, engine):
+    with pytest.raises(DaemonError, match="already listening"):
+        CommandDaemon(engine, socket_path).serve_forever()
+
+
+def test_stale_socket_is_replaced(engine, socket_path):
+    import socket
+
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(socket_path)
+    stale.close()
+
+    daemon, thread = _serve(engine, socket_path)
+    try:
+        assert os.stat(socket_path).st_mode & 0o077 == 0
+    finally:
+        daemon.shutdown()
+        thread.join(5)
+
+
+def test_request_to_a_missing_daemon_raises(socket_path):
+    with pytest.raises(DaemonError, match="Cannot reach daemon"):
+        request(socket_path, {'op': 'ping'})
@@ -0,0 +1,92 @@
+import os
+
+import pytest
+
+import device_index
+from device_index import DeviceIndex
+
+
+@pytest.fixture
+def dev_dir(tmp_path, monkeypatch):
+    """A stand-in /dev whose ttyUSB* entries are links to ptys"""
+    by_id = tmp_path / 'by-id'
+    by_id.mkdir()
+    monkeypatch.setattr(device_index, 'PORT_PATTERNS', (str(tmp_path / 'ttyUSB*'),))
+    monkeypatch.setattr(device_index, 'BY_ID_DIR', str(by_id))
+    return tmp_path
+
+
+def _link(dev_dir, name, target):
+    path = dev_dir / name
+    os.symlink(target, path)
+    return str(path)
+
+
+@pytest.fixture
+def no_open(monkeypatch):
+    opened = []
+
+    def open_port(device, **kwargs):
+        opened.append(device)
+        raise AssertionError(f"{device} was opened")
+
+    monkeypatch.setattr(device_index, 'open_port', open_port)
+    return opened
+
+
+def test_scan_without_probe_never_opens_a_port(dev_dir, no_open, fake_serial):
+    present = _link(dev_dir, 'ttyUSB90', fake_serial().path)
+    _link(dev_dir, 'ttyUSB91', str(dev_dir / 'gone'))
+    (dev_dir / 'ttyUSB92').write_text('not a device')
+
+    index = DeviceIndex(probe=False)
+    assert [info.device for info in index.scan()] == [present]
+    assert index.ports()[0].responsive is None
+    assert no_open == []
+
+
+def test_probe_records_what_answers(dev_dir, fake_serial):
+    device = _link(dev_dir, 'ttyUSB90', fake_serial(prompt="router> ").path)
+
+    [info] = DeviceIndex(probe=True, probe_timeout=0.5).scan()
+    assert info.device == device
+    assert info.responsive is True
+    assert info.response == "router>"
+    assert info.probed_at is not None
+
+
+def test_busy_ports_are_listed_but_not_probed(dev_dir, no_open, fake_serial):
+    device = _link(dev_dir, 'ttyUSB90', fake_serial().path)
+
+    index = DeviceIndex(probe=True, busy=lambda: {device})
+    assert [info.device for info in index.scan()] == [device]
+    assert no_open == []
+
+
+def test_lookup_by_id_link(dev_dir, monkeypatch, fake_serial):
+    device = fake_serial().path
+    monkeypatch.setattr(device_index, 'PORT_PATTERNS', (device,))
+    link = _link(dev_dir / 'by-id', 'usb-FTDI_FT232R_USB_UART_A12345-if00-port0', device)
+
+    index = DeviceIndex()
+    info = index.lookup(link)
+    assert info.device == device
+    assert info.stable_id == info.path == link
+    assert info.name == 'FTDI_FT232R_USB_UART_A12345'
+    assert index.lookup(device) is info
+    assert index.lookup('/no/such/port') is None
+
+
+def test_update_reports_plugged_and_unplugged_ports(dev_dir, fake_serial):
+    first = _link(dev_dir, 'ttyUSB90', fake_serial().path)
+    changes = []
+    index = DeviceIndex(on_change=lambda added, removed: changes.append(
+        ([i.device for i in added], [i.device for i in removed])))
+    index.scan()
+
+    second = _link(dev_dir, 'ttyUSB91', fake_serial().path)
+    os.unlink(first)
+    index.update({first, second})
+
+    assert changes == [([second], [first])]
+    assert [info.device for info in index.ports()] == [second]
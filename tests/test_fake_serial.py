@@ -0,0 +1,67 @@
+import os
+import select
+import time
+
+import pytest
+
+
+def _read_until(fd, marker, timeout=5):
+    data = b''
+    deadline = time.monotonic() + timeout
+    while marker not in data:
+        remaining = deadline - time.monotonic()
+        assert remaining > 0, f"no {marker!r} in {data!r}"
+        readable, _, _ = select.select([fd], [], [], remaining)
+        if readable:
+            data += os.read(fd, 4096)
+    return data
+
+
+@pytest.fixture
+def raw_port():
+    """Open a fake device's pty end the way a plain client would"""
+    opened = []
+
+    def open_device(device):
+        import termios
+        import tty
+        fd = os.open(device.path, os.O_RDWR | os.O_NOCTTY)
+        tty.setraw(fd, termios.TCSANOW)
+        opened.append(fd)
+        return fd
+
+    yield open_device
+    for fd in opened:
+        os.close(fd)
+
+
+def test_fake_device_echoes_answers_and_prompts(fake_serial, raw_port):
+    device = fake_serial(prompt="sw1# ", response="done")
+    fd = raw_port(device)
+    os.write(fd, b"show version\r\n")
+    assert _read_until(fd, b"sw1# ") == b"show version\r\ndone\r\nsw1# "
+    assert device.lines_received == 1
+
+
+def test_fake_device_without_echo(fake_serial, raw_port):
+    fd = raw_port(fake_serial(echo=False))
+    os.write(fd, b"reload\n")
+    assert _read_until(fd, b"switch# ") == b"ok\r\nswitch# "
+
+
+def test_fake_device_latency(fake_serial, raw_port):
+    fd = raw_port(fake_serial(latency=0.2))
+    start = time.monotonic()
+    os.write(fd, b"x\n")
+    _read_until(fd, b"switch# ")
+    assert time.monotonic() - start >= 0.2
+
+
+def test_fake_device_answers_every_line_of_a_burst(fake_serial, raw_port):
+    device = fake_serial(echo=False, prompt="> ")
+    fd = raw_port(device)
+    os.write(fd, b"a\nb\nc\n")
+    data = b''
+    while data.count(b"> ") < 3:
+        data += _read_until(fd, b"> ")
+    assert device.lines_received == 3
@@ -0,0 +1,91 @@
+import subprocess
+import threading
+
+import pytest
+
+from fanout import FanOut, serial_targets
+from scheduler import CANCELLED, DONE, FAILED, CommandScheduler
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = CommandScheduler()
+    yield scheduler
+    scheduler.shutdown()
+
+
+def test_serial_targets_put_the_default_device_first_and_drop_repeats():
+    settings = {'serial_device': '/dev/ttyUSB0',
+                'serial_devices': ['/dev/ttyUSB1', {'device': '/dev/ttyUSB0', 'name': 'again'},
+                                   {'device': '/dev/ttyUSB2', 'name': 'Core switch'}, {'name': 'no device'}]}
+    assert serial_targets(settings) == [('/dev/ttyUSB0', '/dev/ttyUSB0'), ('/dev/ttyUSB1', '/dev/ttyUSB1'),
+                                        ('Core switch', '/dev/ttyUSB2')]
+
+
+def test_devices_run_side_by_side_and_complete_once(scheduler):
+    devices = ['/dev/ttyUSB0', '/dev/ttyUSB1', '/dev/ttyUSB2']
+    # Every job waits for all the others to start, so this only finishes if they run in parallel
+    barrier = threading.Barrier(len(devices), timeout=5)
+    completed = []
+
+    def show_clock():
+        barrier.wait()
+        return ["show clock", "12:00:00", "switch# "]
+
+    fanout = FanOut("show clock", on_complete=completed.append)
+    for device in devices:
+        fanout.add(device, scheduler.submit_serial(device, show_clock))
+    assert not fanout.complete
+    fanout.seal()
+
+    for result in fanout.results:
+        assert result.job.wait(5)
+    assert fanout.complete
+    assert completed == [fanout]
+    assert fanout.summary() == {DONE: 3}
+    assert {result.detail for result in fanout.results} == {"switch#"}
+    assert all(result.duration is not None for result in fanout.results)
+
+
+def test_completion_waits_for_seal_even_when_jobs_finish_first(scheduler):
+    completed = []
+    fanout = FanOut("fast", on_complete=completed.append)
+    job = scheduler.submit_serial('/dev/ttyUSB0', lambda: None)
+    assert job.wait(5)
+    fanout.add('/dev/ttyUSB0', job)
+    assert completed == []
+    fanout.seal()
+    assert completed == [fanout]
+
+
+def test_device_results_report_failures(scheduler):
+    def boom():
+        raise RuntimeError("port vanished")
+
+    release = threading.Event()
+    fanout = FanOut("mixed")
+    jobs = {
+        'ok': scheduler.submit_local(lambda: subprocess.CompletedProcess([], 0)),
+        'exit': scheduler.submit_local(lambda: subprocess.CompletedProcess([], 4)),
+        'error': scheduler.submit_serial('/dev/ttyUSB0', boom),
+        'sequence': scheduler.submit_serial('/dev/ttyUSB1', lambda: False),
+        'batch': scheduler.submit_serial('/dev/ttyUSB2', lambda: 12),
+        'blocker': scheduler.submit_serial('/dev/ttyUSB3', release.wait, 5),
+    }
+    jobs['queued'] = scheduler.submit_serial('/dev/ttyUSB3', lambda: None)
+    scheduler.cancel(jobs['queued'])
+    release.set()
+    for name, job in jobs.items():
+        fanout.add(name, job)
+        job.wait(5)
+
+    results = {result.device: result for result in fanout.results}
+    assert {name: result.state for name, result in results.items()} == {
+        'ok': DONE, 'exit': FAILED, 'error': FAILED, 'sequence': FAILED, 'batch': DONE, 'blocker': DONE,
+        'queued': CANCELLED}
+    assert results['exit'].detail == "exit code 4"
+    assert results['error'].detail == "port vanished"
+    assert results['sequence'].detail == "failed, see log"
+    assert results['batch'].detail == "12 lines sent"
+    assert results['queued'].detail == "cancelled"
+    assert results['queued'].to_dict()['duration'] is None
@@ -0,0 +1,97 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+import pytest
+
+from io_loop import IOLoop
+
+
+@pytest.fixture
+def io_loop():
+    loop = IOLoop()
+    yield loop
+    loop.stop()
+
+
+def test_thread_starts_on_first_use():
+    loop = IOLoop()
+    try:
+        assert not loop.running
+        assert loop.call(lambda: 1 + 1) == 2
+        assert loop.running
+    finally:
+        loop.stop()
+    assert not loop.running
+    with pytest.raises(RuntimeError):
+        loop.call(lambda: None)
+
+
+def test_call_runs_on_the_loop_thread_and_raises_its_errors(io_loop):
+    assert io_loop.call(threading.current_thread) is io_loop._thread
+    with pytest.raises(ZeroDivisionError):
+        io_loop.call(lambda: 1 / 0)
+
+    def nested():
+        # Already on the loop: runs directly instead of deadlocking
+        return io_loop.call(lambda: io_loop.in_loop())
+    assert io_loop.call(nested) is True
+
+
+def test_run_returns_results_and_times_out(io_loop):
+    async def answer(delay):
+        await asyncio.sleep(delay)
+        return 42
+
+    assert io_loop.run(answer(0)) == 42
+    assert io_loop.submit(answer(0.01)).result(5) == 42
+    with pytest.raises(concurrent.futures.TimeoutError):
+        io_loop.run(answer(5), timeout=0.05)
+
+
+def test_run_on_the_loop_thread_refuses_to_deadlock(io_loop):
+    async def inner():
+        return 1
+
+    def on_loop():
+        with pytest.raises(RuntimeError, match="deadlock"):
+            io_loop.run(inner())
+        return True
+
+    assert io_loop.call(on_loop)
+
+
+def test_many_subprocesses_share_the_loop_thread(io_loop):
+    async def sleeper():
+        process = await asyncio.create_subprocess_exec('sleep', '0.3')
+        return await process.wait()
+
+    async def many():
+        return await asyncio.gather(*(sleeper() for _ in range(20)))
+
+    threads = threading.active_count()
+    started = time.monotonic()
+    assert io_loop.run(many(), timeout=10) == [0] * 20
+    assert time.monotonic() - started < 3
+    # No thread per child (asyncio's threaded child watcher would add 20)
+    assert threading.active_count() <= threads + 2
+
+
+def test_stop_cancels_tasks_and_lets_them_clean_up():
+    loop = IOLoop()
+    cleaned = threading.Event()
+    entered = threading.Event()
+
+    async def long_task():
+        try:
+            entered.set()
+            await asyncio.sleep(60)
+        finally:
+            cleaned.set()
+
+    loop.submit(long_task())
+    assert entered.wait(5)
+    loop.stop()
+    assert cleaned.is_set()
+    assert not loop.running
@@ -0,0 +1,86 @@
+import json
+import subprocess
+
+import pytest
+
+from metrics import Metrics
+from scheduler import CommandScheduler
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = CommandScheduler()
+    yield scheduler
+    scheduler.shutdown()
+
+
+def _run(scheduler, metrics, func, *keys):
+    job = scheduler.submit_local(func)
+    metrics.track(job, *keys)
+    assert job.wait(5)
+    return job
+
+
+def test_same_button_text_in_different_unit_types_is_kept_apart(scheduler):
+    metrics = Metrics()
+    _run(scheduler, metrics, lambda: None, 'Status', 'Switch', 'Show')
+    _run(scheduler, metrics, lambda: None, 'Status', 'Switch', 'Show')
+    _run(scheduler, metrics, lambda: None, 'Status', 'Router', 'Show')
+    _run(scheduler, metrics, lambda: None, 'Status', 'Router', 'Debug')
+
+    buttons = metrics.snapshot()['buttons']
+    assert [(b['unit_type'], b['group'], b['button'], b['runs']) for b in buttons] == [
+        ('Router', 'Debug', 'Status', 1), ('Router', 'Show', 'Status', 1), ('Switch', 'Show', 'Status', 2)]
+
+
+def test_outcomes_exit_codes_and_timings(scheduler):
+    metrics = Metrics()
+    ok = subprocess.CompletedProcess([], 0)
+    failed = subprocess.CompletedProcess([], 2)
+    _run(scheduler, metrics, lambda: ok, 'Ping', 'Switch', 'Tools')
+    _run(scheduler, metrics, lambda: failed, 'Ping', 'Switch', 'Tools')
+
+    def boom():
+        raise RuntimeError("boom")
+
+    _run(scheduler, metrics, boom, 'Ping', 'Switch', 'Tools')
+
+    [stats] = metrics.snapshot()['buttons']
+    assert stats['runs'] == 3
+    assert stats['states'] == {'done': 1, 'failed': 2}
+    assert stats['exit_codes'] == {'0': 1, '2': 1}
+    assert stats['execution']['count'] == 3
+    assert stats['execution']['p50'] is not None
+    assert stats['queue_wait']['count'] == 3
+
+
+def test_commands_outside_buttons_use_their_label(scheduler):
+    metrics = Metrics()
+    _run(scheduler, metrics, lambda: None, 'send')
+
+    [stats] = metrics.snapshot()['buttons']
+    assert (stats['unit_type'], stats['group'], stats['button']) == ('', '', 'send')
+
+
+def test_prometheus_labels_name_unit_type_group_and_button(scheduler):
+    metrics = Metrics(traffic=lambda: {'/dev/ttyUSB0': (10, 20)})
+    _run(scheduler, metrics, lambda: None, 'Say "hi"', 'Switch', 'Show')
+
+    text = metrics.to_prometheus()
+    assert ('port_control_commands_total{unit_type="Switch",group="Show",button="Say \\"hi\\"",state="done"} 1'
+            in text.splitlines())
+    assert 'port_control_execution_seconds_count{unit_type="Switch",group="Show",button="Say \\"hi\\""} 1' in text
+    assert 'port_control_serial_bytes_total{device="/dev/ttyUSB0",direction="read"} 20' in text
+
+
+def test_export_picks_the_format_from_the_extension(scheduler, tmp_path):
+    metrics = Metrics()
+    _run(scheduler, metrics, lambda: None, 'Status', 'Switch', 'Show')
+
+    metrics.export(str(tmp_path / 'stats.json'))
+    metrics.export(str(tmp_path / 'stats.prom'))
+    assert json.loads((tmp_path / 'stats.json').read_text())['buttons'][0]['unit_type'] == 'Switch'
+    assert (tmp_path / 'stats.prom').read_text().startswith('# HELP')
+
+    metrics.reset()
+    assert metrics.snapshot()['buttons'] == []
@@ -0,0 +1,203 @@
+import pytest
+
+from parsers import (ADDED, CHANGED, REMOVED, Change, DfParser, FreeParser, IfconfigParser, IpAddrParser,
+                     ParseRun, ParserError, RouteParser, SnapshotStore, diff_records, find_parser)
+
+IFCONFIG = """\
+eth0: flags=4163<UP,BROADCAST,RUNNING,MULTICAST>  mtu 1500
+        inet 10.0.0.5  netmask 255.255.255.0  broadcast 10.0.0.255
+        inet6 fe80::1  prefixlen 64  scopeid 0x20<link>
+        ether 00:11:22:33:44:55  txqueuelen 1000  (Ethernet)
+        RX packets 1200  bytes 340000 (340.0 KB)
+        RX errors 0  dropped 3  overruns 0  frame 0
+        TX packets 800  bytes 120000 (120.0 KB)
+
+lo: flags=73<UP,LOOPBACK,RUNNING>  mtu 65536
+        inet 127.0.0.1  netmask 255.0.0.0
+"""
+
+BUSYBOX_IFCONFIG = """\
+eth0      Link encap:Ethernet  HWaddr 00:11:22:33:44:55
+          inet addr:192.168.1.2  Bcast:192.168.1.255  Mask:255.255.255.0
+          UP BROADCAST RUNNING MULTICAST  MTU:1500  Metric:1
+          RX packets:10 errors:0 dropped:0 overruns:0 frame:0
+"""
+
+IP_ADDR = """\
+1: lo: <LOOPBACK,UP,LOWER_UP> mtu 65536 qdisc noqueue state UNKNOWN group default qlen 1000
+    link/loopback 00:00:00:00:00:00 brd 00:00:00:00:00:00
+    inet 127.0.0.1/8 scope host lo
+2: eth0@if5: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500 qdisc noqueue state UP group default
+    link/ether 02:42:ac:11:00:02 brd ff:ff:ff:ff:ff:ff link-netnsid 0
+    inet 172.17.0.2/16 brd 172.17.255.255 scope global eth0
+    inet 172.17.0.9/16 scope global secondary eth0
+"""
+
+ROUTE = """\
+Kernel IP routing table
+Destination     Gateway         Genmask         Flags Metric Ref    Use Iface
+0.0.0.0         10.0.0.1        0.0.0.0         UG    100    0        0 eth0
+10.0.0.0        0.0.0.0         255.255.255.0   U     0      0        0 eth0
+"""
+
+DF = """\
+Filesystem      Size  Used Avail Use% Mounted on
+/dev/sda1        50G   20G   28G  42% /
+/dev/mapper/a-very-long-volume-name
+                 10G  1.0G  9.0G  10% /mnt/My Data
+"""
+
+FREE = """\
+               total        used        free      shared  buff/cache   available
+Mem:           7.7Gi       2.1Gi       3.0Gi       150Mi       2.6Gi       5.2Gi
+Swap:          2.0Gi          0B       2.0Gi
+"""
+
+
+def _parse(parser_class, text):
+    parser = parser_class()
+    parser.feed_lines(text.splitlines(keepends=True))
+    return parser.close()
+
+
+@pytest.mark.parametrize('command, expected', [
+    ('ifconfig -a', 'ifconfig'),
+    ('ip -4 addr show', 'ip_addr'),
+    ('ip a', 'ip_addr'),
+    ('route -n', 'route'),
+    ('netstat -rn', 'route'),
+    ('df -h', 'df'),
+    ('free -h', 'free'),
+])
+def test_find_parser_auto(command, expected):
+    assert find_parser('auto', command).name == expected
+
+
+@pytest.mark.parametrize('command', ['ip route', 'ip addr add 10.0.0.1/24 dev eth0', 'route add default gw x', 'uptime'])
+def test_find_parser_rejects_commands_it_cannot_read(command):
+    with pytest.raises(ParserError):
+        find_parser('auto', command)
+
+
+def test_find_parser_by_name():
+    assert find_parser('df', 'anything') is DfParser
+    with pytest.raises(ParserError, match="Unknown parser 'nope'"):
+        find_parser('nope', 'df')
+
+
+def test_ifconfig():
+    records = _parse(IfconfigParser, IFCONFIG)
+    assert list(records) == ['eth0', 'lo']
+    eth0 = records['eth0']
+    assert eth0['inet'] == '10.0.0.5'
+    assert eth0['netmask'] == '255.255.255.0'
+    assert eth0['mac'] == '00:11:22:33:44:55'
+    assert eth0['mtu'] == '1500'
+    assert eth0['inet6'] == 'fe80::1'
+    assert eth0['rx_packets'] == '1200' and eth0['rx_bytes'] == '340000'
+    assert eth0['rx_dropped'] == '3'
+    assert records['lo']['flags'] == 'UP,LOOPBACK,RUNNING'
+
+
+def test_busybox_ifconfig():
+    eth0 = _parse(IfconfigParser, BUSYBOX_IFCONFIG)['eth0']
+    assert eth0['mac'] == '00:11:22:33:44:55'
+    assert eth0['inet'] == '192.168.1.2'
+    assert eth0['netmask'] == '255.255.255.0'
+    assert eth0['flags'] == 'UP,BROADCAST,RUNNING,MULTICAST'
+    assert eth0['mtu'] == '1500'
+
+
+def test_ip_addr():
+    records = _parse(IpAddrParser, IP_ADDR)
+    assert records['eth0']['state'] == 'UP'
+    assert records['eth0']['mac'] == '02:42:ac:11:00:02'
+    assert records['eth0']['inet'] == '172.17.0.2/16 172.17.0.9/16'
+    assert records['lo']['inet'] == '127.0.0.1/8'
+
+
+def test_route():
+    records = _parse(RouteParser, ROUTE)
+    assert list(records) == ['0.0.0.0/0.0.0.0 dev eth0 metric 100', '10.0.0.0/255.255.255.0 dev eth0']
+    assert records['0.0.0.0/0.0.0.0 dev eth0 metric 100']['gateway'] == '10.0.0.1'
+
+
+def test_df_joins_wrapped_device_names_and_keeps_spaces_in_mounts():
+    records = _parse(DfParser, DF)
+    assert records['/']['use'] == '42%'
+    assert records['/mnt/My Data']['filesystem'] == '/dev/mapper/a-very-long-volume-name'
+
+
+def test_free():
+    records = _parse(FreeParser, FREE)
+    assert records['Mem']['used'] == '2.1Gi'
+    assert records['Swap']['free'] == '2.0Gi'
+
+
+def test_unrecognized_lines_are_skipped():
+    parser = DfParser()
+    parser.feed_lines(['df -h\r\n', 'garbage\n', 'switch# '])
+    assert parser.close() == {}
+    assert parser.lines == 3
+
+
+def test_count_uses_the_singular():
+    assert FreeParser().count(1) == '1 memory row'
+    assert FreeParser().count(2) == '2 memory rows'
+
+
+def test_diff_reports_added_removed_and_changed():
+    old = {'a': {'x': '1'}, 'b': {'x': '2'}}
+    new = {'a': {'x': '9'}, 'c': {'x': '3'}}
+    changes = diff_records(old, new)
+    assert [(c.kind, c.key) for c in changes] == [(CHANGED, 'a'), (ADDED, 'c'), (REMOVED, 'b')]
+    assert changes[0].fields == {'x': ('1', '9')}
+    assert str(changes[0]) == '~ a: x 1 → 9'
+    assert str(changes[1]) == '+ c x=3'
+
+
+def test_diff_ignores_volatile_fields():
+    old = _parse(IfconfigParser, IFCONFIG)
+    new = _parse(IfconfigParser, IFCONFIG.replace('RX packets 1200', 'RX packets 1500'))
+    assert diff_records(old, new, IfconfigParser) == []
+
+
+def test_diff_reports_gauges_only_past_the_tolerance():
+    old = {'/': {'used': '20G', 'use': '42%'}}
+    assert diff_records(old, {'/': {'used': '20.5G', 'use': '43%'}}, DfParser, tolerance=0.05) == []
+    changes = diff_records(old, {'/': {'used': '30G', 'use': '62%'}}, DfParser, tolerance=0.05)
+    assert changes[0].fields == {'used': ('20G', '30G'), 'use': ('42%', '62%')}
+
+
+def test_change_round_trips_through_dicts():
+    change = Change(CHANGED, 'eth0', {'mtu': ('1500', None)})
+    again = Change.from_dict(change.to_dict())
+    assert (again.kind, again.key, again.fields) == (CHANGED, 'eth0', {'mtu': ('1500', None)})
+    assert str(again) == '~ eth0: mtu 1500 → -'
+
+
+def _run(store, text, command='df -h', target='local'):
+    run = ParseRun(DfParser(), command, target)
+    run.parser.feed_lines(text.splitlines(keepends=True))
+    return store.update(run)
+
+
+def test_snapshot_store_diffs_each_run_against_the_last():
+    store = SnapshotStore()
+    assert _run(store, DF) is None
+    assert _run(store, DF) == []
+    changes = _run(store, DF.replace('/dev/sda1        50G   20G   28G  42% /\n', ''))
+    assert [(c.kind, c.key) for c in changes] == [(REMOVED, '/')]
+    # Each target has its own snapshot
+    assert _run(store, DF, target='ssh:router') is None
+    assert store.stats() == {'snapshots': 2, 'records': 3}
+
+
+def test_snapshot_store_drops_the_least_recently_run():
+    store = SnapshotStore(max_entries=2)
+    _run(store, DF, command='df')
+    _run(store, DF, command='df -h')
+    _run(store, DF, command='df')
+    _run(store, DF, command='df -k')
+    assert store.has('df', 'local') and store.has('df -k', 'local')
+    assert not store.has('df -h', 'local')
@@ -0,0 +1,113 @@
+import json
+import os
+import subprocess
+import threading
+
+import pytest
+
+from benchmark import FakeSSH
+from remote import RemoteError, RemoteHost, SSHPool, aggregate_output, remote_hosts
+
+
+def test_remote_hosts_from_strings_and_objects():
+    hosts = remote_hosts({'remote_hosts': [
+        'admin@10.0.0.1', 'gateway',
+        {'name': 'lab', 'host': 'lab.example', 'user': 'root', 'port': 2222, 'identity_file': '~/.ssh/lab'},
+        {'host': 'gateway', 'user': 'someone'},
+    ]})
+    assert list(hosts) == ['admin@10.0.0.1', 'gateway', 'lab']
+    assert hosts['admin@10.0.0.1'].destination == 'admin@10.0.0.1'
+    assert hosts['gateway'].user is None
+    assert hosts['lab'].key == 'root@lab.example:2222'
+    assert hosts['lab'].ssh_args() == ['-p', '2222', '-i', os.path.expanduser('~/.ssh/lab')]
+    assert remote_hosts({}) == {}
+
+
+def test_aggregate_output_groups_identical_outputs():
+    assert aggregate_output([('a', 'ok\n'), ('b', 'down\n'), ('c', 'ok\n')]) == [('ok\n', ['a', 'c']),
+                                                                                 ('down\n', ['b'])]
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = SSHPool(FakeSSH(str(tmp_path), handshake=0.2).command, control_dir=str(tmp_path / 'ssh'))
+    yield pool
+    pool.close()
+
+
+def _run(pool, host, command):
+    return subprocess.run(pool.command_line(host, command), shell=True, capture_output=True, text=True, timeout=10)
+
+
+def test_commands_share_one_master_per_host(pool):
+    host = RemoteHost('lab', 'lab.example', user='root')
+    threads = [threading.Thread(target=pool.connect, args=(host,)) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert pool.stats() == {'masters': 1, 'connects': 1}
+    assert os.path.exists(pool.control_path(host))
+
+    result = _run(pool, host, "echo \"$SSH_DESTINATION says 'hi'\"")
+    assert result.returncode == 0
+    assert result.stdout == "root@lab.example says 'hi'\n"
+
+    pool.connect(RemoteHost('other', 'other.example'))
+    assert pool.stats() == {'masters': 2, 'connects': 2}
+
+    pool.close()
+    assert not os.path.exists(pool.control_path(host))
+    assert pool.stats()['masters'] == 0
+
+
+def test_a_master_left_by_an_earlier_run_is_reused(pool):
+    host = RemoteHost('lab', 'lab.example')
+    pool.connect(host)
+    pool.masters.clear()
+
+    again = SSHPool(pool.ssh_command, control_dir=pool.control_dir)
+    again.connect(host)
+    assert again.stats() == {'masters': 1, 'connects': 0}
+
+
+def test_unreachable_hosts_raise_with_the_ssh_error(tmp_path):
+    pool = SSHPool(['sh', '-c', 'echo "Permission denied (publickey)." >&2; exit 255', 'ssh'],
+                   control_dir=str(tmp_path / 'ssh'))
+    with pytest.raises(RemoteError, match=r"Cannot connect to lab: Permission denied \(publickey\)\."):
+        pool.connect(RemoteHost('lab', 'lab.example'))
+    assert pool.stats() == {'masters': 0, 'connects': 0}
+
+
+def test_without_multiplexing_each_command_connects_by_itself(tmp_path):
+    pool = SSHPool('ssh -v', multiplex=False)
+    host = RemoteHost('lab', 'lab.example', port=2222)
+    pool.connect(host)
+    assert pool.stats() == {'masters': 0, 'connects': 0}
+    line = pool.command_line(host, 'uptime')
+    assert line.startswith('ssh -v -o BatchMode=yes')
+    assert 'ControlPath' not in line and line.endswith("-p 2222 lab.example uptime")
+
+
+def test_engine_runs_a_remote_group_on_every_host(tmp_path):
+    from engine import Engine
+
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps({
+        'settings': {'serial_device': '/dev/null', 'serial_baudrate': 9600,
+                     'remote_hosts': ['a@host1', 'b@host2', 'c@host3'],
+                     'ssh_command': FakeSSH(str(tmp_path), handshake=0).command,
+                     'ssh_control_dir': str(tmp_path / 'ssh')},
+        'unit_types': {'Fleet': {'button_groups': [{'title': 'Hosts', 'remote': True, 'buttons': [
+            {'text': 'Who', 'action': 'run_local_command', 'command': 'echo ${{SSH_DESTINATION%@*}}'},
+        ]}]}},
+    }))
+    engine = Engine(str(path), on_log=lambda message, level='INFO': None)
+    try:
+        fanout = engine.dispatch_button(engine.find_button('Fleet', 'Who'))
+        assert engine.wait(fanout, 10)
+        outputs = {result.device: result.job.result.output() for result in fanout.results}
+        assert outputs == {'a@host1': 'a\n', 'b@host2': 'b\n', 'c@host3': 'c\n'}
+        assert engine.ssh_pool.stats()['masters'] == 3
+    finally:
+        engine.shutdown()
@@ -0,0 +1,141 @@
+import threading
+import time
+
+from result_cache import CACHED, JOINED, STARTED, OutputRecorder, ResultCache
+
+LINES = [('stdout', 'eth0 up\n'), ('stderr', 'warning\n')]
+
+
+def test_results_expire_after_their_ttl():
+    cache = ResultCache()
+    result = cache.put('ip link', LINES, 0, ttl=0.05)
+    assert cache.get('ip link') is result
+    assert result.output() == 'eth0 up\nwarning\n'
+    time.sleep(0.1)
+    assert cache.get('ip link') is None
+    assert cache.stats()['entries'] == 0 and cache.stats()['bytes'] == 0
+
+
+def test_lookup_answers_from_the_cache():
+    cache = ResultCache()
+    cache.put('uptime', LINES, 0, ttl=60)
+    started = []
+    assert cache.lookup('uptime', lambda: started.append(1))[0] == CACHED
+    assert not started
+    assert cache.stats()['hits'] == 1
+
+
+def test_lookup_joins_the_run_in_flight():
+    cache = ResultCache()
+    job = object()
+    assert cache.lookup('df -h', lambda: job) == (STARTED, job)
+    assert cache.lookup('df -h', lambda: object()) == (JOINED, job)
+    cache.finish('df -h', job)
+    other = object()
+    assert cache.lookup('df -h', lambda: other) == (STARTED, other)
+    assert cache.stats() == {'entries': 0, 'bytes': 0, 'running': 1, 'hits': 0, 'joins': 1, 'misses': 2}
+
+
+def test_concurrent_lookups_start_the_command_once():
+    cache = ResultCache()
+    starts = []
+    barrier = threading.Barrier(8)
+    answers = []
+
+    def click():
+        barrier.wait()
+        answers.append(cache.lookup('free -h', lambda: starts.append(1) or 'job'))
+
+    threads = [threading.Thread(target=click) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(starts) == 1
+    assert sorted(kind for kind, _ in answers) == [JOINED] * 7 + [STARTED]
+    assert {job for _, job in answers} == {'job'}
+
+
+def test_finish_ignores_a_job_that_is_no_longer_running():
+    cache = ResultCache()
+    first = object()
+    cache.lookup('w', lambda: first)
+    cache.finish('w', first)
+    second = object()
+    cache.lookup('w', lambda: second)
+    cache.finish('w', first)
+    assert cache.lookup('w', lambda: object()) == (JOINED, second)
+
+
+def test_a_failed_start_is_not_remembered():
+    cache = ResultCache()
+    assert cache.lookup('w', lambda: None) == (STARTED, None)
+    assert cache.stats()['running'] == 0
+
+
+def test_least_recently_used_results_go_first():
+    size = len('cmd0') + 10
+    cache = ResultCache(max_bytes=size * 2)
+    for n in range(2):
+        cache.put(f'cmd{n}', [('stdout', 'x' * 10)], 0, ttl=60)
+    cache.get('cmd0')
+    cache.put('cmd2', [('stdout', 'x' * 10)], 0, ttl=60)
+    assert cache.get('cmd1') is None
+    assert cache.get('cmd0') is not None and cache.get('cmd2') is not None
+    assert cache.put('huge', [('stdout', 'x' * 100)], 0, ttl=60) is None
+
+
+def test_recorder_gives_up_past_its_limit():
+    recorder = OutputRecorder(limit=10)
+    recorder.add([('stdout', '12345')])
+    assert recorder.lines == [('stdout', '12345')] and not recorder.overflow
+    recorder.add([('stdout', '678901')])
+    assert recorder.overflow and recorder.lines == []
+    recorder.add([('stdout', '1')])
+    assert recorder.lines == []
+
+
+def _engine(tmp_path):
+    import json
+
+    from engine import Engine
+
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps({'settings': {'serial_device': '/dev/null', 'serial_baudrate': 9600},
+                                'unit_types': {}}))
+    return Engine(str(path), on_log=lambda message, level='INFO': None)
+
+
+def _settle(engine):
+    """Wait for the done callbacks, which run just after a job's waiters wake"""
+    deadline = time.monotonic() + 5
+    while engine.result_cache.stats()['running'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_engine_joins_repeat_clicks_and_then_answers_from_the_cache(tmp_path):
+    engine = _engine(tmp_path)
+    try:
+        first = engine.queue_local_command('echo hi; sleep 0.2', cache_ttl=60)
+        assert engine.queue_local_command('echo hi; sleep 0.2', cache_ttl=60) is first
+        assert first.wait(5) and first.result.returncode == 0
+
+        _settle(engine)
+        cached = engine.queue_local_command('echo hi; sleep 0.2', cache_ttl=60)
+        assert cached is not first
+        assert cached.result.cached and cached.result.output() == 'hi\n'
+    finally:
+        engine.shutdown()
+
+
+def test_engine_does_not_cache_a_failed_run(tmp_path):
+    engine = _engine(tmp_path)
+    try:
+        failed = engine.queue_local_command('exit 3', cache_ttl=60)
+        assert failed.wait(5) and failed.result.returncode == 3
+        _settle(engine)
+        again = engine.queue_local_command('exit 3', cache_ttl=60)
+        assert again is not failed
+        assert again.wait(5) and not getattr(again.result, 'cached', False)
+    finally:
+        engine.shutdown()
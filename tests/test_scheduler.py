@@ -0,0 +1,140 @@
+import threading
+import time
+
+import pytest
+
+from io_loop import IOLoop
+from scheduler import CANCELLED, DONE, FAILED, CommandScheduler, QueueFull
+
+
+@pytest.fixture(params=['threads', 'io_loop'])
+def make_scheduler(request):
+    created = []
+    loop = IOLoop() if request.param == 'io_loop' else None
+
+    def make(**kwargs):
+        scheduler = CommandScheduler(io_loop=loop, **kwargs)
+        created.append(scheduler)
+        return scheduler
+
+    yield make
+    for scheduler in created:
+        scheduler.shutdown()
+    if loop is not None:
+        loop.stop()
+
+
+def _blocker():
+    """A job function that runs until the returned event is set"""
+    release = threading.Event()
+    started = threading.Event()
+
+    def run():
+        started.set()
+        release.wait(5)
+
+    return run, started, release
+
+
+def test_serial_lane_runs_jobs_one_at_a_time_in_order(make_scheduler):
+    scheduler = make_scheduler()
+    order, active = [], []
+
+    def job(n):
+        active.append(n)
+        assert len(active) == 1
+        time.sleep(0.005)
+        order.append(n)
+        active.remove(n)
+
+    jobs = [scheduler.submit_serial('/dev/ttyUSB0', job, n) for n in range(20)]
+    assert all(j.wait(5) for j in jobs)
+    assert order == list(range(20))
+    assert {j.state for j in jobs} == {DONE}
+
+
+def test_lanes_of_different_devices_run_side_by_side(make_scheduler):
+    scheduler = make_scheduler()
+    run, started, release = _blocker()
+    blocked = scheduler.submit_serial('/dev/ttyUSB0', run)
+    assert started.wait(5)
+    other = scheduler.submit_serial('/dev/ttyUSB1', lambda: 'ok')
+    assert other.wait(5) and other.result == 'ok'
+    release.set()
+    assert blocked.wait(5)
+
+
+def test_local_pool_limits_concurrency(make_scheduler):
+    scheduler = make_scheduler(max_local_workers=2)
+    lock = threading.Lock()
+    running, peak = [0], [0]
+
+    def job():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    jobs = [scheduler.submit_local(job) for _ in range(8)]
+    assert all(j.wait(5) for j in jobs)
+    assert peak[0] == 2
+
+
+def test_full_lane_raises_queue_full(make_scheduler):
+    scheduler = make_scheduler(max_queue_size=3)
+    run, started, release = _blocker()
+    scheduler.submit_serial('dev', run)
+    assert started.wait(5)
+    queued = [scheduler.submit_serial('dev', lambda: None) for _ in range(3)]
+    with pytest.raises(QueueFull):
+        scheduler.submit_serial('dev', lambda: None)
+    assert scheduler.queue_depth() == {'serial:dev': 3}
+    release.set()
+    assert all(j.wait(5) for j in queued)
+
+
+def test_blocking_submit_times_out_then_gets_room(make_scheduler):
+    scheduler = make_scheduler(max_queue_size=1)
+    run, started, release = _blocker()
+    scheduler.submit_serial('dev', run)
+    assert started.wait(5)
+    scheduler.submit_serial('dev', lambda: None)
+
+    before = time.monotonic()
+    with pytest.raises(QueueFull):
+        scheduler.submit_serial('dev', lambda: None, block=True, timeout=0.1)
+    assert time.monotonic() - before >= 0.1
+
+    threading.Timer(0.05, release.set).start()
+    job = scheduler.submit_serial('dev', lambda: 'late', block=True, timeout=5)
+    assert job.wait(5) and job.result == 'late'
+
+
+def test_cancel_pending_and_failures(make_scheduler):
+    scheduler = make_scheduler()
+    run, started, release = _blocker()
+    scheduler.submit_serial('dev', run)
+    assert started.wait(5)
+    pending = scheduler.submit_serial('dev', lambda: None)
+    assert scheduler.cancel(pending)
+    assert pending.state == CANCELLED and pending.wait(0)
+
+    def boom():
+        raise RuntimeError('boom')
+
+    failed = scheduler.submit_serial('dev', boom)
+    release.set()
+    assert failed.wait(5)
+    assert failed.state == FAILED and str(failed.error) == 'boom'
+
+
+def test_done_callback_sees_finished_job(make_scheduler):
+    scheduler = make_scheduler()
+    seen = []
+    done = threading.Event()
+    job = scheduler.submit_local(lambda: 42)
+    job.add_done_callback(lambda j: (seen.append((j.state, j.result)), done.set()))
+    assert done.wait(5)
+    assert seen == [(DONE, 42)]
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+from sequence import Sequence, SequenceError, SequenceRunner
+from serial_session import SerialSession
+
+
+@pytest.mark.parametrize('steps, step, key', [
+    ([], None, None),
+    ([{'action': 'reboot'}], 0, 'action'),
+    ([{'action': 'delay'}], 0, 'seconds'),
+    ([{'action': 'delay', 'seconds': 1}, {'action': 'send_to_serial'}], 1, 'command'),
+    ([{'action': 'run_local_command', 'command': 'true', 'retries': 1.5}], 0, 'retries'),
+    ([{'action': 'send_to_serial', 'command': 'x', 'expect': '(unclosed'}], 0, 'expect'),
+    ([{'action': 'send_to_serial', 'command': 'x', 'continue_on_error': 'yes'}], 0, 'continue_on_error'),
+])
+def test_invalid_steps_name_the_step_and_key(steps, step, key):
+    with pytest.raises(SequenceError) as raised:
+        Sequence('Setup', steps)
+    assert (raised.value.step, raised.value.key) == (step, key)
+
+
+def _runner(steps, session=None, **kwargs):
+    logs = []
+    runner = SequenceRunner(Sequence('Setup', steps), session, format_command=lambda command: command,
+                            log=lambda message, level="INFO": logs.append((level, message)), **kwargs)
+    return runner, logs
+
+
+@pytest.fixture
+def session(fake_serial):
+    session = SerialSession(fake_serial(response="version 1.2").path)
+    yield session
+    session.stop_reader()
+    session.close()
+
+
+def test_steps_run_in_order_and_check_their_output(session):
+    runner, logs = _runner([
+        {'action': 'send_to_serial', 'command': 'show version', 'wait_for': True, 'expect': r'version \d'},
+        {'action': 'delay', 'seconds': 0},
+        {'action': 'run_local_command', 'command': 'echo configured', 'expect': '^configured$'},
+    ], session)
+    assert runner.run() is True
+    assert logs[-1][0] == "SUCCESS"
+    assert [message.split(': ', 1)[1] for _, message in logs if 'Step ' in message] == [
+        "send_to_serial 'show version'", "wait 0s", "run_local_command 'echo configured'"]
+
+
+def test_a_failed_expectation_aborts_the_sequence(session):
+    runner, logs = _runner([
+        {'action': 'send_to_serial', 'command': 'show version', 'wait_for': True, 'expect': 'version 9'},
+        {'action': 'run_local_command', 'command': 'echo never'},
+    ], session)
+    assert runner.run() is False
+    assert logs[-1] == ("ERROR", "Sequence 'Setup' aborted at step 1/2: output did not match 'version 9'")
+
+
+def test_retries_and_continue_on_error(tmp_path):
+    marker = tmp_path / 'tried'
+    runner, logs = _runner([
+        {'action': 'run_local_command', 'command': f"test -f {marker} || {{ touch {marker}; exit 1; }}",
+         'retries': 2, 'retry_delay': 0},
+        {'action': 'run_local_command', 'command': 'exit 3', 'continue_on_error': True},
+        {'action': 'run_local_command', 'command': 'true'},
+    ])
+    assert runner.run() is True
+    levels = [level for level, _ in logs]
+    assert levels.count("WARNING") == 2
+    assert any("(attempt 2/3)" in message for _, message in logs)
+    assert any(message.endswith("step 2/3 failed, continuing: exited with code 3") for _, message in logs)
+
+
+def test_abort_stops_a_running_delay_and_local_command():
+    runner, logs = _runner([{'action': 'delay', 'seconds': 30}, {'action': 'run_local_command', 'command': 'true'}])
+    result = []
+    thread = threading.Thread(target=lambda: result.append(runner.run()))
+    thread.start()
+    time.sleep(0.1)
+    runner.abort()
+    thread.join(5)
+    assert result == [False]
+
+    runner, logs = _runner([{'action': 'run_local_command', 'command': 'sleep 30'}])
+    thread = threading.Thread(target=lambda: result.append(runner.run()))
+    started = time.monotonic()
+    thread.start()
+    time.sleep(0.2)
+    runner.abort()
+    thread.join(5)
+    assert result == [False, False]
+    assert time.monotonic() - started < 5
+
+
+def test_a_serial_error_fails_the_step(tmp_path):
+    session = SerialSession(str(tmp_path / 'missing'))
+    runner, logs = _runner([{'action': 'send_to_serial', 'command': 'x'}], session)
+    assert runner.run() is False
+    assert "aborted at step 1/1" in logs[-1][1]
@@ -0,0 +1,320 @@
+import pytest
+
+from io_loop import IOLoop
+from serial_session import SerialSession, SerialTimeout
+
+
+@pytest.fixture(params=['threads', 'io_loop'])
+def io_loop(request):
+    loop = IOLoop() if request.param == 'io_loop' else None
+    yield loop
+    if loop is not None:
+        loop.stop()
+
+
+@pytest.fixture
+def session_for(io_loop):
+    """Open SerialSessions on fake devices, with the reader on a thread or the IOLoop"""
+    sessions = []
+
+    def make(device, **kwargs):
+        session = SerialSession(device.path, io_loop=io_loop, **kwargs)
+        sessions.append(session)
+        return session
+
+    yield make
+    for session in sessions:
+        session.stop_reader()
+        session.close()
+
+
+def _send_and_wait(session, text, **kwargs):
+    if session.io_loop is None:
+        return session.send_and_wait(text, **kwargs)
+    return session.io_loop.run(session.send_and_wait_async(text, **kwargs), timeout=10)
+
+
+def test_round_trip_returns_the_lines_up_to_the_prompt(fake_serial, session_for):
+    session = session_for(fake_serial())
+    lines = _send_and_wait(session, "show clock", timeout=5)
+    assert [line.strip() for line in lines] == ["show clock", "ok", "switch#"]
+
+
+def test_times_out_on_a_slow_device(fake_serial, session_for):
+    session = session_for(fake_serial(latency=1.0))
+    with pytest.raises(SerialTimeout):
+        _send_and_wait(session, "slow", timeout=0.2)
+
+
+def test_reader_reports_lines_and_prompts(fake_serial, session_for):
+    import threading
+
+    seen = []
+    prompted = threading.Event()
+
+    def on_line(device, line, is_prompt):
+        seen.append((line.strip(), is_prompt))
+        if is_prompt:
+            prompted.set()
+
+    session = session_for(fake_serial(response="done"))
+    session.start_reader(on_line)
+    session.write_line("hello")
+    assert prompted.wait(5)
+    assert seen == [("hello", False), ("done", False), ("switch#", True)]
+    assert session.bytes_read > 0 and session.bytes_written == len(b"hello\r\n")
+
+
+def test_close_while_reading_does_not_kill_the_reader(fake_serial, session_for, io_loop):
+    import time
+
+    session = session_for(fake_serial(), reconnect_delay=0.05)
+    session.start_reader()
+    time.sleep(0.1)
+    session.close()
+    time.sleep(0.2)
+    assert session.reading
+    assert [line.strip() for line in _send_and_wait(session, "again", timeout=5)][-1] == "switch#"
+
+
+class _FlakyPort:
+    """A port whose writes fail after sending `sends` bytes; records what went out"""
+
+    def __init__(self, sent, sends=None, error=None):
+        self.sent = sent
+        self.sends = sends
+        self.error = error
+        self.closed = False
+
+    def write(self, data):
+        if self.sends is None:
+            self.sent.append(bytes(data))
+            return len(data)
+        if self.sends:
+            self.sent.append(bytes(data[:self.sends]))
+        if self.error is not None:
+            raise self.error
+        # As _PosixPort reports it
+        error = OSError(5, 'Input/output error')
+        error.written = self.sends
+        raise error
+
+    def flush(self):
+        pass
+
+    def fileno(self):
+        return None
+
+    def close(self):
+        self.closed = True
+
+
+def _session_with_ports(monkeypatch, ports):
+    import serial_session
+
+    opened = []
+
+    def fake_open_port(device, *args, **kwargs):
+        opened.append(device)
+        return ports.pop(0)
+
+    monkeypatch.setattr(serial_session, 'open_port', fake_open_port)
+    return SerialSession('/dev/ttyFAKE', reconnect_delay=0), opened
+
+
+def test_write_that_sent_nothing_is_retried_on_a_reopened_port(monkeypatch):
+    sent = []
+    session, opened = _session_with_ports(monkeypatch, [_FlakyPort(sent, sends=0), _FlakyPort(sent)])
+    session.write(b"show run\r\n")
+    assert sent == [b"show run\r\n"]
+    assert len(opened) == 2
+    assert session.bytes_written == len(b"show run\r\n")
+
+
+def test_partial_write_is_not_repeated(monkeypatch):
+    from serial_session import SerialError
+
+    sent = []
+    session, opened = _session_with_ports(monkeypatch, [_FlakyPort(sent, sends=3), _FlakyPort(sent)])
+    with pytest.raises(SerialError, match="Write to /dev/ttyFAKE failed"):
+        session.write(b"reload\r\n")
+    assert sent == [b"rel"]
+    assert len(opened) == 1 and not session.is_open
+    # The next command reopens the port
+    session.write(b"show\r\n")
+    assert sent[-1] == b"show\r\n"
+
+
+def test_failure_of_unknown_extent_is_not_repeated(monkeypatch):
+    from serial_session import SerialError
+
+    class PySerialTimeout(OSError):
+        """Like pyserial's SerialTimeoutException: no count of what went out"""
+
+    sent = []
+    session, opened = _session_with_ports(
+        monkeypatch, [_FlakyPort(sent, sends=0, error=PySerialTimeout('Write timeout')), _FlakyPort(sent)])
+    with pytest.raises(SerialError):
+        session.write(b"write erase\r\n")
+    assert sent == [] and len(opened) == 1
+
+
+def test_open_failure_is_retried(monkeypatch):
+    import serial_session
+    from serial_session import SerialError
+
+    sent = []
+    attempts = []
+
+    def fake_open_port(device, *args, **kwargs):
+        attempts.append(device)
+        if len(attempts) < 3:
+            raise SerialError(f"Cannot open {device}")
+        return _FlakyPort(sent)
+
+    monkeypatch.setattr(serial_session, 'open_port', fake_open_port)
+    session = SerialSession('/dev/ttyFAKE', reconnect_delay=0, reconnect_attempts=3)
+    session.write(b"x\n")
+    assert sent == [b"x\n"] and len(attempts) == 3
+
+
+def test_send_lines_gated_on_prompt(fake_serial, session_for):
+    device = fake_serial(latency=0.01)
+    session = session_for(device)
+    progress = []
+    sent = session.send_lines([f"line {n}" for n in range(10)], wait_for=True, window=2,
+                              timeout=5, on_progress=lambda done, total: progress.append(done))
+    assert sent == 10
+    assert device.lines_received == 10
+    assert progress[-1] == 10
+
+
+def test_send_lines_paced_and_stopped(fake_serial, session_for):
+    import threading
+    import time
+
+    device = fake_serial()
+    session = session_for(device)
+    start = time.monotonic()
+    assert session.send_lines(["a", "b", "c"], line_delay=0.05) == 3
+    assert time.monotonic() - start >= 0.1
+
+    stop = threading.Event()
+    sent = session.send_lines(["a", "b", "c"], line_delay=0.05,
+                              on_progress=lambda done, total: done == 1 and stop.set(), stop=stop)
+    assert sent == 1
+
+
+def test_send_lines_times_out_when_answers_stop(fake_serial, session_for):
+    session = session_for(fake_serial(latency=1.0))
+    with pytest.raises(SerialTimeout, match="answered 0 of 1 lines"):
+        session.send_lines(["a", "b"], wait_for=True, window=1, timeout=0.2)
+
+
+@pytest.fixture
+def held_pty():
+    """A pty whose far end nobody reads, with XOFF/XON control from the test"""
+    import os
+    import pty
+
+    master, slave = pty.openpty()
+    yield master, os.ttyname(slave)
+    os.close(master)
+    os.close(slave)
+
+
+def test_write_held_off_by_xoff_times_out_without_holding_the_lock(held_pty):
+    import os
+    import threading
+    import time
+
+    from serial_session import SerialError, SerialWriteTimeout
+
+    master, path = held_pty
+    session = SerialSession(path, flow_control='xonxoff', write_timeout=0.2)
+    try:
+        session.open()
+        os.write(master, b'\x13')
+        time.sleep(0.05)
+        start = time.monotonic()
+        with pytest.raises(SerialError) as caught:
+            session.write(b"show run\r\n")
+        assert isinstance(caught.value.__cause__, SerialWriteTimeout)
+        assert time.monotonic() - start < 2
+
+        # Another writer isn't stuck behind it, and XON lets output through again
+        os.write(master, b'\x11')
+        done = threading.Event()
+        threading.Thread(target=lambda: (session.write(b"ok\r\n"), done.set()), daemon=True).start()
+        assert done.wait(2)
+        assert os.read(master, 100).endswith(b"ok\r\n")
+    finally:
+        session.close()
+
+
+def test_full_buffer_write_times_out_with_a_count(held_pty):
+    from serial_session import SerialWriteTimeout, open_port
+
+    _, path = held_pty
+    port = open_port(path, write_timeout=0.1)
+    try:
+        with pytest.raises(SerialWriteTimeout) as caught:
+            port.write(b"x" * 1024 * 1024)
+        assert 0 < caught.value.written < 1024 * 1024
+    finally:
+        port.close()
+
+
+def test_suspended_session_stays_closed_until_resumed(fake_serial, io_loop):
+    import threading
+    import time
+
+    from serial_session import SerialError, SerialSessionManager
+
+    device = fake_serial()
+    lines = []
+    prompted = threading.Event()
+
+    def on_line(dev, line, is_prompt):
+        lines.append(line)
+        if is_prompt:
+            prompted.set()
+
+    manager = SerialSessionManager({'serial_device': device.path}, on_line=on_line, io_loop=io_loop)
+    try:
+        session = manager.get()
+        session.write_line("one")
+        assert prompted.wait(5)
+
+        manager.suspend(device.path, "is in use by a terminal window")
+        assert not session.is_open and not session.reading
+        with pytest.raises(SerialError, match="in use by a terminal window"):
+            session.write_line("two")
+        time.sleep(0.1)
+        assert not session.is_open
+        assert device.lines_received == 1
+
+        prompted.clear()
+        manager.resume(device.path)
+        session.write_line("three")
+        assert prompted.wait(5)
+        assert "three" in [line.strip() for line in lines]
+    finally:
+        manager.close_all()
+
+
+def test_suspending_a_device_without_a_session_opens_nothing(fake_serial):
+    from serial_session import SerialError, SerialSessionManager
+
+    device = fake_serial()
+    manager = SerialSessionManager({'serial_device': device.path}, on_line=lambda *args: None)
+    try:
+        manager.suspend(device.path, "is in use by a terminal window")
+        session = manager.get(device.path)
+        assert not session.is_open and not session.reading
+        with pytest.raises(SerialError):
+            session.write_line("x")
+        manager.resume(device.path)
+        assert session.reading
+    finally:
+        manager.close_all()
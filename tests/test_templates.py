@@ -0,0 +1,65 @@
+import pytest
+
+from templates import CommandTemplate, TemplateError, TemplateRegistry
+
+
+@pytest.mark.parametrize('template', ["ping {", "ping {0}", "ping {}", "ping {ip!z}"])
+def test_malformed_templates_are_rejected(template):
+    with pytest.raises(TemplateError):
+        CommandTemplate(template)
+
+
+def test_keys_are_the_settings_used():
+    template = CommandTemplate("ssh {user}@{hosts[0]} -p {port.real} {{literal}}")
+    assert template.keys == {'user', 'hosts', 'port'}
+    assert template.render({'user': 'admin', 'hosts': ['10.0.0.1'], 'port': 22}) == \
+        "ssh admin@10.0.0.1 -p 22 {literal}"
+
+
+def test_unknown_settings_are_named():
+    with pytest.raises(TemplateError, match="unknown setting\\(s\\): ip, port"):
+        CommandTemplate("ping {ip} {port}").render({'user': 'admin'})
+
+
+def test_renders_are_cached_by_the_values_they_use():
+    template = CommandTemplate("ping {ip}")
+    settings = {'ip': '10.0.0.1', 'other': 1}
+    first = template.render(settings)
+    settings['other'] = 2
+    assert template.render(settings) is first
+
+    settings['ip'] = '10.0.0.2'
+    assert template.render(settings) == "ping 10.0.0.2"
+    assert template.render({'ip': '10.0.0.1'}) is first
+
+
+def test_cache_keeps_only_the_most_recent_renders():
+    template = CommandTemplate("ping {ip}")
+    kept = template.render({'ip': 'kept'})
+    for n in range(CommandTemplate.MAX_RENDERS * 2):
+        template.render({'ip': n})
+        template.render({'ip': 'kept'})
+    assert len(template._renders) == CommandTemplate.MAX_RENDERS
+    assert template.render({'ip': 'kept'}) is kept
+
+
+def test_registry_shares_templates_and_applies_overrides():
+    settings = {'serial_device': '/dev/ttyUSB0', 'ip': '10.0.0.1'}
+    registry = TemplateRegistry(settings)
+    assert registry.compile("ping {ip}") is registry.compile("ping {ip}")
+    assert registry.render("screen {serial_device}") == "screen /dev/ttyUSB0"
+    assert registry.render("screen {serial_device}", {'serial_device': '/dev/ttyUSB1'}) == "screen /dev/ttyUSB1"
+    assert settings['serial_device'] == '/dev/ttyUSB0'
+
+
+def test_invalidate_clears_only_templates_using_the_key():
+    registry = TemplateRegistry({'ip': '10.0.0.1', 'user': 'admin'})
+    registry.render("ping {ip}")
+    registry.render("whoami {user}")
+    registry.render("ssh {user}@{ip}")
+
+    assert sorted(registry.dependents('ip')) == ["ping {ip}", "ssh {user}@{ip}"]
+    assert registry.invalidate('ip') == 2
+    assert registry.compile("ping {ip}")._renders == {}
+    assert len(registry.compile("whoami {user}")._renders) == 1
+    assert registry.invalidate('unused') == 0
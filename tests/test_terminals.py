@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+
+import pytest
+
+from terminals import CLOSING, EXITED, KILLED, RUNNING, TerminalError, TerminalSupervisor
+
+
+class _Changes:
+    """on_change recorder that can wait for a state"""
+
+    def __init__(self):
+        self.events = []
+        self._cond = threading.Condition()
+
+    def __call__(self, session, state):
+        with self._cond:
+            self.events.append((session.device, state))
+            self._cond.notify_all()
+
+    def wait_for(self, device, state, timeout=5):
+        with self._cond:
+            return self._cond.wait_for(lambda: (device, state) in self.events, timeout)
+
+
+@pytest.fixture
+def changes():
+    return _Changes()
+
+
+@pytest.fixture
+def supervisor(changes):
+    supervisor = TerminalSupervisor(on_change=changes, grace=0.3)
+    yield supervisor
+    supervisor.shutdown()
+    for session in supervisor.sessions():
+        if session.alive:
+            session.process.kill()
+            session.process.wait()
+
+
+def _sh(script):
+    return ['/bin/sh', '-c', script]
+
+
+def _gone(pid):
+    """Whether a process has ended; an orphan may linger as a zombie until init reaps it"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(')', 1)[1].split()[0] in ('Z', 'X')
+    except FileNotFoundError:
+        return True
+
+
+def test_exits_are_reaped_and_reported(supervisor, changes):
+    session = supervisor.open('/dev/ttyUSB0', _sh('exit 3'), name='Switch')
+    assert changes.wait_for('/dev/ttyUSB0', EXITED)
+    assert changes.events == [('/dev/ttyUSB0', RUNNING), ('/dev/ttyUSB0', EXITED)]
+    assert (session.state, session.returncode, session.alive) == (EXITED, 3, False)
+    assert session.to_dict()['name'] == 'Switch'
+    assert supervisor.live() == []
+
+
+def test_one_live_terminal_per_device(supervisor, changes):
+    first = supervisor.open('/dev/ttyUSB0', _sh('sleep 30'))
+    with pytest.raises(TerminalError, match="already open"):
+        supervisor.open('/dev/ttyUSB0', _sh('true'))
+    other = supervisor.open('/dev/ttyUSB1', _sh('sleep 30'))
+    assert {session.pid for session in supervisor.live()} == {first.pid, other.pid}
+    assert supervisor.devices() == {'/dev/ttyUSB0', '/dev/ttyUSB1'}
+
+    supervisor.kill('/dev/ttyUSB0')
+    assert changes.wait_for('/dev/ttyUSB0', KILLED)
+    again = supervisor.open('/dev/ttyUSB0', _sh('sleep 30'))
+    assert supervisor.get('/dev/ttyUSB0') is again
+
+
+def test_a_missing_program_raises(supervisor):
+    with pytest.raises(TerminalError, match="Cannot start"):
+        supervisor.open('/dev/ttyUSB0', ['/no/such/terminal'])
+    assert supervisor.get('/dev/ttyUSB0') is None
+
+
+def test_close_stops_the_whole_process_group_without_waiting(supervisor, changes, tmp_path):
+    # The shell stands in for xterm and its child for the screen inside it
+    pidfile = tmp_path / 'child'
+    supervisor.open('/dev/ttyUSB0', _sh(f'sleep 30 & echo $! > {pidfile}; wait'))
+    deadline = time.monotonic() + 5
+    while not (pidfile.exists() and pidfile.read_text().strip()) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    child = int(pidfile.read_text())
+
+    started = time.monotonic()
+    supervisor.close('/dev/ttyUSB0')
+    assert time.monotonic() - started < 0.5
+    assert supervisor.close('/dev/ttyUSB0') is None
+    assert changes.wait_for('/dev/ttyUSB0', EXITED)
+    assert changes.events == [('/dev/ttyUSB0', RUNNING), ('/dev/ttyUSB0', CLOSING), ('/dev/ttyUSB0', EXITED)]
+    deadline = time.monotonic() + 5
+    while not _gone(child) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert _gone(child)
+
+
+def test_a_terminal_ignoring_sigterm_is_killed_after_the_grace_period(supervisor, changes):
+    session = supervisor.open('/dev/ttyUSB0', _sh('trap "" TERM; while :; do sleep 0.05; done'))
+    time.sleep(0.1)
+    started = time.monotonic()
+    supervisor.close('/dev/ttyUSB0')
+    assert changes.wait_for('/dev/ttyUSB0', KILLED)
+    assert time.monotonic() - started >= supervisor.grace
+    assert session.killed and session.returncode < 0
+
+
+def test_shutdown_returns_at_once_and_still_ends_the_terminals(changes):
+    supervisor = TerminalSupervisor(on_change=changes, grace=0.3)
+    session = supervisor.open('/dev/ttyUSB0', _sh('trap "" TERM; while :; do sleep 0.05; done'))
+    time.sleep(0.1)
+    started = time.monotonic()
+    supervisor.shutdown()
+    assert time.monotonic() - started < 0.5
+    assert changes.wait_for('/dev/ttyUSB0', KILLED)
+    assert not session.alive
@@ -0,0 +1,88 @@
+import json
+import os
+
+import pytest
+
+from unit_catalog import UnitCatalog, UnitCatalogError
+
+
+def _unit(path, **data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({'button_groups': [], **data}))
+    return path
+
+
+@pytest.fixture
+def units(tmp_path):
+    _unit(tmp_path / 'units' / 'switch.json', description="Access switch")
+    _unit(tmp_path / 'units' / 'router.json', name="Edge Router")
+    _unit(tmp_path / 'extra' / 'ap.json')
+    return tmp_path
+
+
+def _catalog(base, **kwargs):
+    return UnitCatalog(['units', 'extra/*.json', 'units/switch.json'], str(base),
+                       manifest_path=str(base / 'config.json.manifest'), **kwargs)
+
+
+def test_patterns_list_each_file_once_in_order(units):
+    catalog = _catalog(units)
+    assert catalog.names() == ['Edge Router', 'switch', 'ap']
+    assert catalog.description('switch') == "Access switch"
+    assert catalog.description('missing') == ''
+    assert catalog.path('ap') == str(units / 'extra' / 'ap.json')
+
+
+def test_manifest_spares_reading_unchanged_files(units, monkeypatch):
+    _catalog(units).names()
+    read = []
+    original = UnitCatalog._read
+    monkeypatch.setattr(UnitCatalog, '_read', staticmethod(lambda path: read.append(path) or original(path)))
+
+    assert _catalog(units).names() == ['Edge Router', 'switch', 'ap']
+    assert read == []
+
+    _unit(units / 'units' / 'switch.json', description="Core switch, renamed")
+    catalog = _catalog(units)
+    assert catalog.description('switch') == "Core switch, renamed"
+    assert read == [str(units / 'units' / 'switch.json')]
+
+
+def test_unreadable_files_are_reported_and_skipped(units):
+    (units / 'units' / 'broken.json').write_text('{"button_groups": [')
+    (units / 'units' / 'list.json').write_text('[]')
+    errors = []
+    assert _catalog(units, on_error=errors.append).names() == ['Edge Router', 'switch', 'ap']
+    assert len(errors) == 2 and all(isinstance(e, UnitCatalogError) for e in errors)
+
+
+def test_edits_rewrite_only_that_units_file(units):
+    catalog = _catalog(units)
+    before = (units / 'units' / 'router.json').read_text()
+    catalog.store('switch').append(['button_groups'], {'title': 'Show', 'buttons': []})
+    assert catalog.load('switch')['button_groups'] == [{'title': 'Show', 'buttons': []}]
+    assert catalog.loaded() == ['switch']
+    catalog.close()
+
+    assert json.loads((units / 'units' / 'switch.json').read_text())['button_groups'][0]['title'] == 'Show'
+    assert (units / 'units' / 'router.json').read_text() == before
+    # The store's sidecar files are not unit types
+    assert _catalog(units).names() == ['Edge Router', 'switch', 'ap']
+
+
+def test_read_does_not_keep_a_store(units):
+    catalog = _catalog(units)
+    assert catalog.read('Edge Router')['name'] == "Edge Router"
+    assert catalog.loaded() == []
+    with pytest.raises(KeyError):
+        catalog.read('missing')
+    with pytest.raises(KeyError):
+        catalog.store('missing')
+
+
+def test_a_unit_file_that_vanished_after_the_scan_raises(units):
+    catalog = _catalog(units)
+    catalog.names()
+    os.unlink(units / 'extra' / 'ap.json')
+    with pytest.raises(UnitCatalogError):
+        catalog.store('ap')
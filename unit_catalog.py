@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""Unit types kept one per file, listed through a manifest and loaded on demand"""
+
+import glob
+import json
+import os
+import threading
+
+from config_store import ConfigStore, atomic_write
+
+
+class UnitCatalogError(ValueError):
+    """Raised when a unit file can't be read"""
+
+
+class UnitCatalog:
+    """Unit type files matched by include patterns, parsed only when asked for
+
+    Each pattern is a glob or a directory (meaning every *.json in it),
+    relative to the config file. A unit file holds one unit type:
+
+        {"name": "Switch", "description": "...", "button_groups": [...]}
+
+    where name defaults to the file name without .json. The manifest next
+    to the config keeps each file's name, description, size and mtime, so
+    listing hundreds of unit types only stats their files; a file is read
+    again only when it changed. Every loaded unit gets its own ConfigStore,
+    so an edit is journaled and rewrites that unit's file alone.
+    """
+
+    def __init__(self, patterns, base_dir, manifest_path=None, on_error=None):
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        self.patterns = list(patterns)
+        self.base_dir = base_dir
+        self.manifest_path = manifest_path
+        self.on_error = on_error
+        self._entries = None
+        self._stores = {}
+        self._lock = threading.Lock()
+
+    def _files(self):
+        files = []
+        for pattern in self.patterns:
+            pattern = os.path.join(self.base_dir, os.path.expanduser(pattern))
+            if os.path.isdir(pattern):
+                pattern = os.path.join(pattern, '*.json')
+            for path in sorted(glob.glob(pattern)):
+                if path not in files:
+                    files.append(path)
+        return files
+
+    def _read_manifest(self):
+        if not self.manifest_path:
+            return {}
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return {entry['file']: entry for entry in json.load(f).get('units', [])}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return {}
+
+    def entries(self):
+        """Manifest entries ({'name', 'description', 'file', ...}) in file order, refreshed once"""
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._scan()
+            return self._entries
+
+    def _scan(self):
+        cached = self._read_manifest()
+        entries = []
+        changed = False
+        for path in self._files():
+            relative = os.path.relpath(path, self.base_dir)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entry = cached.get(relative)
+            if entry is None or entry.get('mtime_ns') != stat.st_mtime_ns or entry.get('size') != stat.st_size:
+                changed = True
+                try:
+                    data = self._read(path)
+                except UnitCatalogError as e:
+                    if self.on_error:
+                        self.on_error(e)
+                    continue
+                entry = {'file': relative, 'name': data.get('name') or os.path.splitext(os.path.basename(path))[0],
+                         'description': data.get('description', ''),
+                         'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+            entries.append(entry)
+        if changed or len(entries) != len(cached):
+            self._write_manifest(entries)
+        return entries
+
+    def _write_manifest(self, entries):
+        if not self.manifest_path:
+            return
+        try:
+            atomic_write(self.manifest_path, json.dumps({'units': entries}, indent=1, ensure_ascii=False))
+        except OSError as e:
+            # A read-only config directory only costs a rescan next time
+            if self.on_error:
+                self.on_error(e)
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise UnitCatalogError(f"Cannot read unit file {path}: {e}") from e
+        if not isinstance(data, dict):
+            raise UnitCatalogError(f"Unit file {path} must hold a JSON object")
+        return data
+
+    def names(self):
+        return [entry['name'] for entry in self.entries()]
+
+    def description(self, name):
+        entry = self._entry(name)
+        return entry['description'] if entry else ''
+
+    def _entry(self, name):
+        for entry in self.entries():
+            if entry['name'] == name:
+                return entry
+        return None
+
+    def path(self, name):
+        entry = self._entry(name)
+        return os.path.join(self.base_dir, entry['file']) if entry else None
+
+    def store(self, name):
+        """The ConfigStore of a unit's file, loading it on first use"""
+        with self._lock:
+            store = self._stores.get(name)
+        if store is not None:
+            return store
+        path = self.path(name)
+        if path is None:
+            raise KeyError(name)
+        store = ConfigStore(path, on_error=self.on_error)
+        try:
+            store.load()
+        except (OSError, ValueError) as e:
+            raise UnitCatalogError(f"Cannot read unit file {path}: {e}") from e
+        with self._lock:
+            return self._stores.setdefault(name, store)
+
+    def load(self, name):
+        """The raw dict of one unit type"""
+        return self.store(name).config
+
+    def read(self, name):
+        """The raw dict of one unit type, without keeping a store for it if it isn't loaded"""
+        with self._lock:
+            store = self._stores.get(name)
+        if store is not None:
+            return store.config
+        path = self.path(name)
+        if path is None:
+            raise KeyError(name)
+        return self._read(path)
+
+    def loaded(self):
+        with self._lock:
+            return list(self._stores)
+
+    def close(self):
+        """Write pending edits of every loaded unit file"""
+        with self._lock:
+            stores = list(self._stores.values())
+        for store in stores:
+            store.close()